@@ -0,0 +1,92 @@
+"""Замер времени запуска CLI: импорт и время выполнения подкоманд.
+
+Каждый сценарий запускается в отдельном процессе несколько раз; в отчёт
+(JSON в стандартный вывод) попадают медиана и минимум в миллисекундах,
+а также модули, которые загружаются при импорте weather.main.
+
+Запуск:
+    python benchmarks/startup.py --repeat 10
+    python benchmarks/startup.py --max-ms help=150 --max-ms history=250
+
+С --max-ms скрипт завершается с кодом 1, если медиана сценария превысила
+порог, — так его можно использовать для защиты от регрессий.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SCENARIOS = {
+    'python': ['-c', 'pass'],
+    'import': ['-c', 'import weather.main'],
+    'help': ['-m', 'weather', '--help'],
+    'history': ['-m', 'weather', '--history'],
+    'stats': ['-m', 'weather', '--stats', 'day', '--days', '7'],
+}
+
+# Модули, которые не должны загружаться при импорте точки входа
+HEAVY_MODULES = ('requests', 'urllib3', 'sqlite3', 'weather.api', 'weather.database')
+
+
+def run_scenario(argv: list[str], repeat: int, env: dict) -> dict:
+    """Запускает сценарий repeat раз и возвращает статистику времени (мс)."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 2), 'min_ms': round(min(timings), 2)}
+
+
+def loaded_heavy_modules() -> list[str]:
+    """Возвращает тяжёлые модули, загружаемые при импорте weather.main."""
+    code = ("import sys, json, weather.main; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени запуска weather CLI')
+    parser.add_argument('--repeat', type=int, default=5, help='Число запусков каждого сценария')
+    parser.add_argument('--max-ms', action='append', default=[], metavar='NAME=MS',
+                        help='Порог медианы для сценария (можно указывать несколько раз)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Отдельная база истории, чтобы замеры не трогали рабочую
+        env = dict(os.environ, WEATHER_HISTORY_DB=os.path.join(tmpdir, 'history.db'))
+        # Первый запуск создаёт схему и не должен попадать в замеры
+        subprocess.run([sys.executable, *SCENARIOS['history']], cwd=ROOT, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        report = {
+            'python': sys.version.split()[0],
+            'scenarios': {name: run_scenario(argv, args.repeat, env)
+                          for name, argv in SCENARIOS.items()},
+            'heavy_modules_on_import': loaded_heavy_modules(),
+        }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    failed = False
+    for limit in args.max_ms:
+        name, _, value = limit.partition('=')
+        median = report['scenarios'][name]['median_ms']
+        if median > float(value):
+            print(f"{name}: {median} мс > {value} мс", file=sys.stderr)
+            failed = True
+    if report['heavy_modules_on_import']:
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Локальная заглушка Open-Meteo для бенчмарков.
+
+Отвечает на запросы прогноза (/v1/forecast), архива (/v1/archive)
+и геокодирования (/v1/search) детерминированными данными без обращения к сети.
+Задержка ответа и доля ответов с ошибкой 500 настраиваются, чтобы
+воспроизводить медленный или нестабильный API.
+
+Запуск отдельно (например, для ручной проверки CLI):
+    python benchmarks/stub_server.py --port 8900 --latency 0.05 --error-rate 0.1
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubServer(ThreadingHTTPServer):
+    """HTTP-сервер, имитирующий API Open-Meteo."""
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 0):
+        """Инициализирует сервер.
+
+        Args:
+            address (tuple[str, int]): Адрес; порт 0 — выбрать свободный.
+            latency (float): Задержка перед каждым ответом, сек.
+            error_rate (float): Доля запросов, на которые отвечается 500.
+            seed (int): Начальное значение генератора ошибок.
+        """
+        super().__init__(address, StubRequestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def should_fail(self) -> bool:
+        """Учитывает запрос и решает, ответить ли на него ошибкой."""
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов заглушки."""
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело пишутся отдельно: без этого ответ ждёт задержанного ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self._send(500, {'error': True, 'reason': "stub failure"})
+        elif url.path == '/v1/forecast':
+            self._send(200, forecast_response(params))
+        elif url.path == '/v1/archive':
+            self._send(200, archive_response(params))
+        elif url.path == '/v1/search':
+            self._send(200, geocoding_response(params))
+        else:
+            self._send(404, {'error': True, 'reason': "not found"})
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _seed(*values) -> int:
+    return zlib.crc32(repr(values).encode('utf-8'))
+
+
+def forecast_response(params: dict):
+    """Формирует ответ прогноза для одной или нескольких точек."""
+    latitudes = params.get('latitude', '0').split(',')
+    longitudes = params.get('longitude', '0').split(',')
+    hourly = [name for name in params.get('hourly', '').split(',') if name]
+    days = int(params.get('forecast_days', 1))
+    start = int(time.time()) // 3600 * 3600
+
+    locations = []
+    for latitude, longitude in zip(latitudes, longitudes):
+        rng = random.Random(_seed(latitude, longitude))
+        location = {'latitude': float(latitude), 'longitude': float(longitude),
+                    'utc_offset_seconds': 0}
+        if params.get('current_weather') == 'true':
+            location['current_weather'] = {
+                'temperature': round(rng.uniform(-20, 30), 1),
+                'windspeed': round(rng.uniform(0, 40), 1),
+                'winddirection': rng.randrange(360),
+                'weathercode': rng.choice((0, 1, 2, 3, 45, 61, 71, 95)),
+                'time': time.strftime('%Y-%m-%dT%H:00', time.gmtime(start)),
+            }
+        if hourly:
+            hours = days * 24
+            location['hourly'] = {'time': [start + hour * 3600 for hour in range(hours)]}
+            for name in hourly:
+                location['hourly'][name] = [round(rng.uniform(0, 30), 1) for _ in range(hours)]
+        locations.append(location)
+    return locations[0] if len(locations) == 1 else locations
+
+
+def archive_response(params: dict) -> dict:
+    """Формирует почасовой архив за интервал start_date..end_date."""
+    start = datetime.strptime(params['start_date'], '%Y-%m-%d')
+    end = datetime.strptime(params['end_date'], '%Y-%m-%d')
+    hours = ((end - start).days + 1) * 24
+    rng = random.Random(_seed(params.get('latitude'), params.get('longitude'), params['start_date']))
+    hourly = {'time': [(start + timedelta(hours=hour)).strftime('%Y-%m-%dT%H:%M')
+                       for hour in range(hours)]}
+    for name in params.get('hourly', '').split(','):
+        if name == 'weathercode':
+            hourly[name] = [rng.choice((0, 1, 2, 3, 61)) for _ in range(hours)]
+        elif name:
+            hourly[name] = [round(rng.uniform(0, 30), 1) for _ in range(hours)]
+    return {'latitude': float(params.get('latitude', 0)), 'longitude': float(params.get('longitude', 0)),
+            'utc_offset_seconds': 0, 'hourly': hourly}
+
+
+def geocoding_response(params: dict) -> dict:
+    """Формирует ответ геокодирования; названия на "nowhere" не находятся."""
+    name = params.get('name', '')
+    if not name or name.casefold().startswith('nowhere'):
+        return {}
+    rng = random.Random(_seed(name.casefold()))
+    return {'results': [{
+        'name': name,
+        'latitude': round(rng.uniform(-60, 70), 4),
+        'longitude': round(rng.uniform(-180, 180), 4),
+        'country': "Stubland",
+    }]}
+
+
+def start_stub_server(latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> StubServer:
+    """Запускает заглушку на свободном порту в фоновом потоке."""
+    server = StubServer(latency=latency, error_rate=error_rate, seed=seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная заглушка Open-Meteo')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 500')
+    args = parser.parse_args()
+
+    server = StubServer(('127.0.0.1', args.port), args.latency, args.error_rate)
+    print(f"Прогноз: {server.url}/v1/forecast, архив: {server.url}/v1/archive, "
+          f"геокодирование: {server.url}/v1/search", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Набор бенчмарков WeatherAPI, WeatherCache и базы истории без сети.
+
+API обращается к локальной заглушке Open-Meteo (benchmarks/stub_server.py)
+с настраиваемыми задержкой и долей ошибок; кэш и база истории создаются
+во временном каталоге. Отчёт выводится в JSON: для каждого сценария —
+число операций, операций в секунду и перцентили времени операции (мс).
+
+Запуск:
+    python benchmarks/suite.py --quick
+    python benchmarks/suite.py --latency 0.02 --error-rate 0.05 -o bench.json
+    python benchmarks/suite.py --baseline bench.json --tolerance 0.3
+
+С --baseline скрипт завершается с кодом 1, если пропускная способность
+какого-либо сценария упала больше чем на долю --tolerance.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from stub_server import start_stub_server  # noqa: E402
+
+from weather import database  # noqa: E402
+from weather.api import WeatherAPI, create_session  # noqa: E402
+from weather.batch import fetch_weather_batch  # noqa: E402
+from weather.cache import WeatherCache  # noqa: E402
+
+
+def measure(operation, items) -> dict:
+    """Выполняет operation для каждого элемента и собирает статистику.
+
+    Исключения не прерывают замер, а учитываются в поле errors.
+    """
+    timings = []
+    errors = 0
+    started = time.perf_counter()
+    for item in items:
+        start = time.perf_counter()
+        try:
+            operation(item)
+        except Exception:
+            errors += 1
+        timings.append(time.perf_counter() - start)
+    total = time.perf_counter() - started
+    return summarize(timings, total, errors)
+
+
+def summarize(timings: list[float], total: float, errors: int = 0) -> dict:
+    """Сводит времена операций (сек) в запись отчёта."""
+    ordered = sorted(timings) or [0.0]
+
+    def percentile(share: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000, 3)
+
+    return {
+        'ops': len(timings),
+        'errors': errors,
+        'ops_per_sec': round(len(timings) / total, 1) if total else None,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def bench_api(workdir: str, stub, args) -> dict:
+    """Одиночные запросы без кэша и с кэшем, пакетные запросы."""
+    session = create_session(retries=args.retries, backoff_factor=args.backoff)
+    results = {}
+
+    def make_api(name: str, memory_entries: int = 1024) -> WeatherAPI:
+        cache = WeatherCache(os.path.join(workdir, f'{name}.db'), legacy_file=None,
+                             memory_entries=memory_entries)
+        return WeatherAPI(session=session, cache=cache, base_url=f"{stub.url}/v1/forecast",
+                          geocoding_url=f"{stub.url}/v1/search")
+
+    cities = [f"City {index}" for index in range(args.requests)]
+    for name, memory_entries in (('memory', 1024), ('sqlite', 0)):
+        api = make_api(f'api_{name}', memory_entries)
+        # Холодный проход заполняет кэш; в отчёт попадает первый из них
+        cold = measure(api.get_weather_by_city, cities)
+        results.setdefault('single_cold', cold)
+        results[f'single_warm_{name}'] = measure(api.get_weather_by_city, cities)
+        api.cache.close()
+
+    for size in args.batch_sizes:
+        api = make_api(f'batch_{size}')
+        batch = [f"Batch {size} {index}" for index in range(size)]
+        requests_before = stub.requests
+        start = time.perf_counter()
+        fetched = fetch_weather_batch(api, batch, args.workers)
+        total = time.perf_counter() - start
+        results[f'batch_cold_{size}'] = {
+            'ops': size,
+            'errors': sum(error is not None for _, _, error in fetched),
+            'ops_per_sec': round(size / total, 1),
+            'total_ms': round(total * 1000, 3),
+            'http_requests': stub.requests - requests_before,
+        }
+        api.cache.close()
+    return results
+
+
+def bench_cache(workdir: str, args) -> dict:
+    """Запись, попадания и промахи кэша при разном числе записей."""
+    results = {}
+    payload = {'temperature': 1.5, 'windspeed': 3.2, 'winddirection': 180,
+               'weathercode': 3, 'time': "2025-01-01T12:00", 'city': None}
+    for size in args.cache_sizes:
+        cache = WeatherCache(os.path.join(workdir, f'cache_{size}.db'), legacy_file=None,
+                             memory_entries=0, max_entries=size * 2, max_bytes=1 << 34)
+        keys = [f"weather_{index}_{index}" for index in range(size)]
+        results[f'cache_set_{size}'] = measure(lambda key: cache.set(key, payload), keys)
+
+        sample = keys[::max(1, size // args.lookups)][:args.lookups]
+        results[f'cache_hit_sqlite_{size}'] = measure(cache.get, sample)
+        results[f'cache_miss_{size}'] = measure(cache.get, [f"weather_missing_{key}" for key in sample])
+        cache.close()
+
+        cache = WeatherCache(os.path.join(workdir, f'cache_{size}.db'), legacy_file=None,
+                             memory_entries=len(sample), max_entries=size * 2, max_bytes=1 << 34)
+        for key in sample:
+            cache.get(key)
+        results[f'cache_hit_memory_{size}'] = measure(cache.get, sample)
+        cache.close()
+    return results
+
+
+def bench_history(workdir: str, args) -> dict:
+    """Скорость записи и чтения истории запросов."""
+    database.DB_PATH = os.path.join(workdir, 'history.db')
+    database.init_db()
+    results = {}
+    data = {'temperature': 4.2, 'windspeed': 5.0, 'winddirection': 90, 'weathercode': 61}
+    cities = [f"City {index % 50}" for index in range(args.history_rows)]
+
+    single = cities[:min(len(cities), 500)]
+    results['history_insert_single'] = measure(lambda city: database.save_request(city, data), single)
+
+    chunks = [cities[start:start + 500] for start in range(0, len(cities), 500)]
+    timings = []
+    start = time.perf_counter()
+    for chunk in chunks:
+        chunk_start = time.perf_counter()
+        database.save_requests([(city, data) for city in chunk])
+        timings.append(time.perf_counter() - chunk_start)
+    total = time.perf_counter() - start
+    results['history_insert_batch'] = dict(summarize(timings, total),
+                                           rows_per_sec=round(len(cities) / total, 1))
+
+    repeat = range(args.lookups // 10 or 1)
+    results['history_recent'] = measure(lambda _: database.get_history(10), repeat)
+    results['history_stats_day'] = measure(lambda _: database.get_stats('day'), repeat)
+    results['history_stats_city'] = measure(lambda _: database.get_stats('month', city="City 7"), repeat)
+
+    start = time.perf_counter()
+    rows = sum(1 for _ in database.iter_history())
+    total = time.perf_counter() - start
+    results['history_scan'] = {'rows': rows, 'rows_per_sec': round(rows / total, 1),
+                               'total_ms': round(total * 1000, 3)}
+    database.close_db()
+    return results
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Находит сценарии, пропускная способность которых упала больше допуска."""
+    regressions = []
+    for section, scenarios in baseline['results'].items():
+        for name, old in scenarios.items():
+            new = report['results'].get(section, {}).get(name)
+            for field in ('ops_per_sec', 'rows_per_sec'):
+                if new and old.get(field) and new.get(field) is not None:
+                    if new[field] < old[field] * (1 - tolerance):
+                        regressions.append(f"{section}.{name}.{field}: {new[field]} < {old[field]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки weather без обращения к сети')
+    parser.add_argument('--quick', action='store_true', help='Уменьшенные объёмы для быстрой проверки')
+    parser.add_argument('--latency', type=float, default=0.005, help='Задержка заглушки API, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 500 от заглушки')
+    parser.add_argument('--retries', type=int, default=3, help='Число повторов HTTP-запроса')
+    parser.add_argument('--backoff', type=float, default=0.05, help='Множитель задержки повторов')
+    parser.add_argument('--workers', type=int, default=8, help='Потоков в пакетном режиме')
+    parser.add_argument('--only', choices=['api', 'cache', 'history'], action='append',
+                        help='Запустить только указанные группы (можно повторять)')
+    parser.add_argument('--output', '-o', metavar='FILE', help='Записать отчёт в файл')
+    parser.add_argument('--baseline', metavar='FILE', help='Сравнить с ранее сохранённым отчётом')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Допустимое падение пропускной способности (доля)')
+    args = parser.parse_args()
+
+    args.requests = 20 if args.quick else 200
+    args.batch_sizes = (50,) if args.quick else (50, 500)
+    args.cache_sizes = (1_000,) if args.quick else (1_000, 10_000, 100_000)
+    args.lookups = 200 if args.quick else 2_000
+    args.history_rows = 2_000 if args.quick else 50_000
+    groups = args.only or ['api', 'cache', 'history']
+
+    stub = start_stub_server(args.latency, args.error_rate)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {}
+        if 'api' in groups:
+            results['api'] = bench_api(workdir, stub, args)
+        if 'cache' in groups:
+            results['cache'] = bench_cache(workdir, args)
+        if 'history' in groups:
+            results['history'] = bench_history(workdir, args)
+    stub.shutdown()
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'config': {'quick': args.quick, 'latency': args.latency, 'error_rate': args.error_rate,
+                   'retries': args.retries, 'workers': args.workers},
+        'stub': {'requests': stub.requests, 'errors': stub.errors},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(line, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,37 @@ import unittest
 from unittest.mock import patch, Mock
 import sys
 import os
+import io
+import json
+import subprocess
+import tempfile
+import threading
+import time
 import requests
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import date, datetime, timedelta
 
 # Добавляем корень проекта в путь
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from weather.api import WeatherAPI, get_weather_description
+from weather.api import WeatherAPI, create_session, get_weather_description
 from weather.parser import create_parser
+from weather.cache import WeatherCache
+from weather.geo import haversine_km
+from weather.gazetteer import Gazetteer, build_gazetteer, normalize_name
+from weather.batch import read_cities, fetch_weather_batch
+from weather import database
+from weather.export import export_history
+from weather.commands import get_weather_command, use_daemon, watch_command
+from weather.singleflight import SingleFlight
+from weather.client import request_daemon
+from weather.server import start_in_background
+from weather.scheduler import RateLimiter, WatchScheduler, parse_watch_target
+from weather.forecast import ForecastSeries, parse_alert
+from weather import metrics
+from weather.prefetch import prefetch_cities, prefetch_popular
+from weather.output import RECORD_FIELDS, make_record, write_records
+from weather.backfill import backfill, split_range
 
 
 class TestWeatherDescription(unittest.TestCase):
@@ -25,9 +49,15 @@ class TestWeatherDescription(unittest.TestCase):
 
 class TestWeatherAPI(unittest.TestCase):
     def setUp(self):
-        self.api = WeatherAPI()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = WeatherCache(os.path.join(self.tmpdir.name, 'cache.db'), legacy_file=None)
+        self.api = WeatherAPI(cache=self.cache)
 
-    @patch('requests.get')
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    @patch('requests.Session.get')
     def test_get_coordinates_success(self, mock_get):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -45,7 +75,7 @@ class TestWeatherAPI(unittest.TestCase):
         self.assertEqual(result['name'], "Москва")
         self.assertAlmostEqual(result['latitude'], 55.7558)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_coordinates_not_found(self, mock_get):
         mock_response = Mock()
         mock_response.status_code = 200
@@ -55,7 +85,7 @@ class TestWeatherAPI(unittest.TestCase):
         result = self.api.get_coordinates("НесуществующийГород123")
         self.assertIsNone(result)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_coordinates_network_error(self, mock_get):
         mock_get.side_effect = requests.RequestException("Нет интернета")
 
@@ -63,10 +93,908 @@ class TestWeatherAPI(unittest.TestCase):
             self.api.get_coordinates("Москва")
         self.assertIn("Ошибка при получении координат", str(context.exception))
 
+    @patch('requests.Session.get')
+    def test_get_weather_many_chunks_and_order(self, mock_get):
+        def fake_get(url, params, timeout):
+            latitudes = params['latitude'].split(',')
+            response = Mock()
+            response.json.return_value = [
+                {'current_weather': {'temperature': float(lat), 'windspeed': 1.0,
+                                     'winddirection': 90, 'weathercode': 0,
+                                     'time': "2025-01-01T00:00"}}
+                for lat in latitudes
+            ]
+            return response
+
+        mock_get.side_effect = fake_get
+        self.api.max_locations_per_request = 2
+        coords = [(10.5, 1.0), (20.5, 2.0), (30.5, 3.0)]
+
+        result = self.api.get_weather_many(coords, ["A", "B", "C"])
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual([w['temperature'] for w in result], [10.5, 20.5, 30.5])
+        self.assertEqual([w['city'] for w in result], ["A", "B", "C"])
+
+    @patch('requests.Session.get')
+    def test_requests_use_timeout(self, mock_get):
+        mock_get.return_value.json.return_value = {}
+        self.api.get_coordinates("Тайм-аут")
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], self.api.timeout)
+
+    def test_session_retry_policy(self):
+        session = create_session(retries=5, pool_maxsize=32)
+        adapter = session.get_adapter("https://api.open-meteo.com")
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertTrue(adapter.max_retries.respect_retry_after_header)
+        self.assertEqual(adapter._pool_maxsize, 32)
+
     def test_invalid_coordinates(self):
         with self.assertRaises(ValueError):
             self.api.get_weather_by_coords(100, 200)
 
+    @patch('requests.Session.get')
+    def test_custom_base_urls(self, mock_get):
+        api = WeatherAPI(cache=self.cache, base_url="http://127.0.0.1:9/v1/forecast",
+                         geocoding_url="http://127.0.0.1:9/v1/search")
+        mock_get.return_value.json.return_value = {}
+        api.get_coordinates("Нигде")
+        self.assertEqual(mock_get.call_args.args[0], "http://127.0.0.1:9/v1/search")
+
+
+class TestSpatialCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = WeatherCache(os.path.join(self.tmpdir.name, 'cache.db'), legacy_file=None)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_haversine(self):
+        # Москва — Санкт-Петербург ≈ 634 км
+        self.assertAlmostEqual(haversine_km(55.7558, 37.6173, 59.9343, 30.3351), 634, delta=5)
+
+    @patch('requests.Session.get')
+    def test_nearby_points_share_grid_cell(self, mock_get):
+        mock_get.return_value.json.return_value = {'current_weather': {
+            'temperature': 5.0, 'windspeed': 1.0, 'winddirection': 0,
+            'weathercode': 0, 'time': "2025-01-01T00:00"}}
+        api = WeatherAPI(cache=self.cache, grid_resolution=0.05)
+
+        api.get_weather(55.7558, 37.6173, "Москва")
+        result = api.get_weather(55.7560, 37.6175)
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(result['temperature'], 5.0)
+        self.assertIsNone(result['city'])
+        self.assertEqual((result['latitude'], result['longitude']), (55.7560, 37.6175))
+
+    def test_nearest_cell_within_tolerance(self):
+        api = WeatherAPI(cache=self.cache, grid_resolution=0.05, grid_tolerance_km=10)
+        api._store_weather(55.76, 37.62, {'temperature': 1.0})
+        api._store_weather(56.50, 37.62, {'temperature': 2.0})
+
+        self.assertEqual(api._get_cached_weather(55.81, 37.62)['temperature'], 1.0)
+        self.assertIsNone(api._get_cached_weather(56.10, 37.62))
+        # Каждый поиск в радиусе — одно попадание или один промах
+        self.assertEqual((self.cache.stats()['hits'], self.cache.stats()['misses']), (1, 1))
+
+    def test_tolerance_search_uses_cell_index(self):
+        api = WeatherAPI(cache=self.cache, grid_resolution=0.001, grid_tolerance_km=25)
+        api._store_weather(0.01, 179.99, {'temperature': 3.0})
+
+        statements = []
+        self.cache._conn.set_trace_callback(statements.append)
+        # Ячейка по другую сторону меридиана 180° в пределах радиуса
+        self.assertEqual(api._get_cached_weather(0.01, -179.99)['temperature'], 3.0)
+        self.assertIsNone(api._get_cached_weather(10.0, 10.0))
+        self.cache._conn.set_trace_callback(None)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        # Диапазон ячеек ищется по индексу: по запросу на полосу столбцов
+        # (две у меридиана 180°, одна вдали от него), а не по запросу на ячейку
+        cell_queries = [sql for sql in statements if "FROM cells" in sql]
+        self.assertEqual(len(cell_queries), 3)
+        for sql in cell_queries:
+            plan = " ".join(row[3] for row in self.cache._conn.execute("EXPLAIN QUERY PLAN " + sql))
+            self.assertIn("SEARCH cells USING PRIMARY KEY", plan)
+
+        with self.assertRaises(ValueError):
+            WeatherAPI(cache=self.cache, grid_resolution=0.001, grid_tolerance_km=100)
+
+
+GEONAMES_SAMPLE = "\n".join("\t".join(row) for row in [
+    ["524901", "Moscow", "Moscow", "Moskva,Москва,Moskau", "55.75222", "37.61556",
+     "P", "PPLC", "RU", "", "48", "", "", "", "10381222", "", "144", "Europe/Moscow", "2022-12-10"],
+    ["4401242", "Moscow", "Moscow", "", "46.73239", "-117.00017",
+     "P", "PPL", "US", "", "ID", "", "", "", "25060", "", "", "America/Los_Angeles", "2022-12-10"],
+    ["551487", "Kazan", "Kazan", "Kazan',Казань", "55.78874", "49.12214",
+     "P", "PPLA", "RU", "", "73", "", "", "", "1243500", "", "", "Europe/Moscow", "2022-12-10"],
+    ["2017370", "Russia", "Russia", "Россия", "60", "100",
+     "A", "PCLI", "RU", "", "00", "", "", "", "140702000", "", "", "Asia/Krasnoyarsk", "2022-12-10"],
+]) + "\n"
+
+
+class TestGazetteer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        source = os.path.join(self.tmpdir.name, 'cities.txt')
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write(GEONAMES_SAMPLE)
+        self.path = os.path.join(self.tmpdir.name, 'cities.idx')
+        self.counts = build_gazetteer(source, self.path)
+        self.gazetteer = Gazetteer(self.path)
+
+    def tearDown(self):
+        self.gazetteer.close()
+        self.tmpdir.cleanup()
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("  Санкт-Петербург "), "санкт петербург")
+        self.assertEqual(normalize_name("Zürich"), "zurich")
+
+    def test_exact_lookup_prefers_larger_city(self):
+        self.assertEqual(self.counts[0], 3)
+        moscow = self.gazetteer.lookup("москва ")
+        self.assertEqual((moscow['name'], moscow['country'], moscow['country_code']),
+                         ("Москва", "Россия", "RU"))
+        self.assertEqual(self.gazetteer.lookup("MOSCOW")['country_code'], "RU")
+        self.assertAlmostEqual(moscow['latitude'], 55.75222, places=4)
+        self.assertIsNone(self.gazetteer.lookup("Россия"))
+
+    def test_prefix_and_fuzzy(self):
+        self.assertEqual([c['name'] for c in self.gazetteer.prefix("каз")], ["Казань"])
+        self.assertEqual(self.gazetteer.find("Масква")['name'], "Москва")
+        self.assertEqual(self.gazetteer.fuzzy("Qwerty"), [])
+
+    def test_alternate_names_file_sets_russian_names(self):
+        alternate = os.path.join(self.tmpdir.name, 'alternateNamesV2.txt')
+        with open(alternate, 'w', encoding='utf-8') as f:
+            f.write("1\t4401242\tru\tМосква (Айдахо)\t\t\t\t\n"
+                    "2\t4401242\tru\tМоскоу\t1\t\t\t\n"
+                    "3\t4401242\tde\tMoskau\t1\t\t\t\n")
+        path = os.path.join(self.tmpdir.name, 'named.idx')
+        build_gazetteer(os.path.join(self.tmpdir.name, 'cities.txt'), path, alternate_names_path=alternate)
+        gazetteer = Gazetteer(path)
+        self.assertEqual([(c['name'], c['country']) for c in gazetteer.prefix("moscow")],
+                         [("Москва", "Россия"), ("Москоу", "США")])
+        gazetteer.close()
+
+    @patch('requests.Session.get')
+    def test_api_uses_gazetteer_before_network(self, mock_get):
+        cache = WeatherCache(os.path.join(self.tmpdir.name, 'cache.db'), legacy_file=None)
+        api = WeatherAPI(cache=cache, gazetteer=self.gazetteer)
+
+        coords = api.get_coordinates("Казань")
+        # Та же строка места, что и у сетевого геокодера с language=ru
+        self.assertEqual(f"{coords['name']}, {coords['country']}", "Казань, Россия")
+        mock_get.assert_not_called()
+
+        mock_get.return_value.json.return_value = {}
+        self.assertIsNone(api.get_coordinates("Неизвестный"))
+        self.assertIsNone(api.get_coordinates("неизвестный "))
+        self.assertEqual(mock_get.call_count, 1)
+        cache.close()
+
+
+class TestWeatherCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_set_get_persists_across_instances(self):
+        cache = WeatherCache(self.path, legacy_file=None)
+        cache.set("coords_москва", {"name": "Москва"})
+        cache.close()
+
+        cache = WeatherCache(self.path, legacy_file=None)
+        self.assertEqual(cache.get("coords_москва"), {"name": "Москва"})
+        self.assertIsNone(cache.get("missing"))
+        cache.close()
+
+    def test_expired_entry_is_removed(self):
+        cache = WeatherCache(self.path, ttl_hours=0, legacy_file=None, policies={})
+        cache.set("weather_1_2", {"temperature": 1})
+        self.assertIsNone(cache.get("weather_1_2"))
+        count = cache._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.assertEqual(count, 0)
+        cache.close()
+
+    def test_memory_tier_lru_eviction_and_stats(self):
+        cache = WeatherCache(self.path, legacy_file=None, memory_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)  # вытесняет "b" — к нему обращались раньше всех
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), 2)  # поднимается с диска
+        self.assertIsNone(cache.get("missing"))
+        stats = cache.stats()
+        self.assertEqual(stats['memory_hits'], 2)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['memory_evictions'], 2)
+        self.assertEqual(stats['memory_entries'], 2)
+        cache.close()
+
+    def test_compaction_enforces_disk_limits(self):
+        cache = WeatherCache(self.path, legacy_file=None, memory_entries=0,
+                             max_entries=3, compact_every=5)
+        for i in range(5):
+            cache.set(f"key_{i}", i)
+
+        count = cache._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.assertEqual(count, 3)
+        self.assertIsNone(cache.get("key_0"))
+        self.assertEqual(cache.get("key_4"), 4)
+        self.assertEqual(cache.stats()['disk_evictions'], 2)
+        cache.close()
+
+    def test_compaction_purges_memory_tier(self):
+        cache = WeatherCache(self.path, legacy_file=None, max_entries=3, compact_every=5)
+        for i in range(5):
+            cache.set(f"key_{i}", "Москва")
+
+        self.assertIsNone(cache.get("key_0"))
+        stats = cache.stats()
+        self.assertEqual(stats['memory_entries'], 3)
+        self.assertEqual(stats['memory_bytes'], 3 * len('"Москва"'.encode('utf-8')))
+        cache.close()
+
+    def test_imports_legacy_json_once(self):
+        legacy = os.path.join(self.tmpdir.name, 'weather_cache.json')
+        with open(legacy, 'w', encoding='utf-8') as f:
+            json.dump({"coords_казань": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "data": {"name": "Казань"}
+            }}, f, ensure_ascii=False)
+
+        cache = WeatherCache(self.path, legacy_file=legacy)
+        self.assertEqual(cache.get("coords_казань"), {"name": "Казань"})
+        cache.set("coords_казань", {"name": "Казань, Россия"})
+        cache.close()
+
+        cache = WeatherCache(self.path, legacy_file=legacy)
+        self.assertEqual(cache.get("coords_казань"), {"name": "Казань, Россия"})
+        cache.close()
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original_path = database.DB_PATH
+        database.DB_PATH = os.path.join(self.tmpdir.name, 'history.db')
+
+    def tearDown(self):
+        database.close_db()
+        database.DB_PATH = self.original_path
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def weather(temperature, code=0):
+        return {'temperature': temperature, 'windspeed': 3.0, 'winddirection': 180, 'weathercode': code}
+
+    def test_schema_migrated_with_index(self):
+        conn = database.get_connection()
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], len(database.MIGRATIONS))
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        indexes = [row[1] for row in conn.execute("PRAGMA index_list(history)")]
+        self.assertIn("idx_history_city_timestamp", indexes)
+
+    def test_batch_insert_and_history(self):
+        database.save_requests([("Москва", self.weather(1.0)), ("Казань", self.weather(2.0, 3))])
+        database.save_request("Омск", self.weather(3.0))
+
+        history = database.get_history(10)
+        self.assertEqual([row[1] for row in history], ["Омск", "Казань", "Москва"])
+        self.assertEqual(history[1][3], "Пасмурно")
+        self.assertIs(database.get_connection(), database.get_connection())
+
+    def test_rollups_updated_on_insert(self):
+        database.save_requests([("Москва, Россия", self.weather(1.0, 3)),
+                                ("Москва, Россия", self.weather(5.0, 3)),
+                                ("Москва, Россия", self.weather(3.0, 0)),
+                                ("Казань, Россия", self.weather(-2.0))])
+
+        stats = database.get_stats('day', city="Москва")
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['samples'], 3)
+        self.assertEqual((stats[0]['temp_min'], stats[0]['temp_max']), (1.0, 5.0))
+        self.assertAlmostEqual(stats[0]['temp_mean'], 3.0)
+        self.assertEqual(stats[0]['weathercode'], 3)
+
+        week = database.get_stats('week')
+        self.assertEqual(sorted(row['city'] for row in week), ["Казань, Россия", "Москва, Россия"])
+        with self.assertRaises(ValueError):
+            database.get_stats('year')
+
+    def test_city_filters_match_exactly(self):
+        database.save_requests([("Paris, France", self.weather(1.0)),
+                                ("Omsk, Russia", self.weather(2.0)),
+                                ("Paris-Plage, France", self.weather(3.0))])
+
+        self.assertEqual([row['city'] for row in database.get_stats('day', city="Paris")],
+                         ["Paris, France"])
+        for city in ("paris", "O_sk", "Om%"):
+            self.assertEqual(database.get_stats('day', city=city), [], city)
+        self.assertEqual([row['city'] for row in database.iter_history(city="Paris")],
+                         ["Paris, France"])
+        self.assertEqual(list(database.iter_history(city="O_sk")), [])
+
+    def test_export_streams_in_chunks_and_resumes(self):
+        database.save_requests([(f"Город {i}", self.weather(float(i))) for i in range(25)])
+        database.save_request("Москва, Россия", self.weather(1.5))
+
+        rows = list(database.iter_history(chunk_size=7))
+        self.assertEqual(len(rows), 26)
+        self.assertEqual([row['id'] for row in rows], sorted(row['id'] for row in rows))
+
+        buffer = io.StringIO()
+        count, last_id = export_history(buffer, 'jsonl', after_id=20, chunk_size=4)
+        lines = buffer.getvalue().splitlines()
+        self.assertEqual(count, 6)
+        self.assertEqual(json.loads(lines[-1])['city'], "Москва, Россия")
+        self.assertEqual(last_id, rows[-1]['id'])
+
+        buffer = io.StringIO()
+        count, _ = export_history(buffer, 'csv', city="Москва")
+        self.assertEqual(count, 1)
+        self.assertTrue(buffer.getvalue().startswith("id,timestamp,city"))
+
+    def test_prefetch_warms_most_frequent_cities(self):
+        database.save_requests([("Москва, Россия", self.weather(1.0))] * 3
+                               + [("Казань, Россия", self.weather(2.0))] * 2
+                               + [("Омск, Россия", self.weather(3.0))])
+        self.assertEqual(database.get_top_cities(2), [("Москва, Россия", 3), ("Казань, Россия", 2)])
+
+        api = Mock()
+        api.max_locations_per_request = 100
+        api.get_coordinates.side_effect = lambda city: (
+            None if city == "Казань" else
+            {'latitude': 1.0, 'longitude': 2.0, 'name': city, 'country': "Россия"})
+        api.get_weather_many.side_effect = lambda coords, names: [{'city': name} for name in names]
+
+        result = prefetch_popular(api, limit=2, workers=2)
+        self.assertEqual(result['cities'], ["Москва, Россия", "Казань, Россия"])
+        self.assertEqual((result['warmed'], result['failed']), (1, 1))
+        self.assertIn("Казань, Россия", result['errors'])
+        api.get_coordinates.assert_any_call("Москва")
+
+    def test_prefetch_fetches_coordinate_places_by_coordinates(self):
+        api = Mock()
+        api.max_locations_per_request = 100
+        api.get_coordinates.return_value = {'latitude': 1.0, 'longitude': 2.0,
+                                            'name': "Москва", 'country': "Россия"}
+        api.get_weather_many.side_effect = lambda coords, names=None: [{} for _ in coords]
+
+        result = prefetch_cities(api, ["Москва, Россия", database.coords_label(55.75, 37.62)])
+
+        self.assertEqual((result['warmed'], result['failed']), (2, 0))
+        api.get_coordinates.assert_called_once_with("Москва")
+        api.get_weather_many.assert_any_call([(55.75, 37.62)])
+
+    def test_backfilled_hours_do_not_rank_cities(self):
+        start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        rows = [((start + timedelta(hours=i)).isoformat(timespec='minutes'), "Омск, Россия",
+                 1.0, 2.0, 90, 0, None, 55.0, 73.4) for i in range(24)]
+        database.save_archive_rows(rows, [])
+        database.save_requests([("Москва, Россия", self.weather(1.0))] * 5
+                               + [("Казань, Россия", self.weather(2.0))] * 2)
+        self.assertEqual(database.get_top_cities(3), [("Москва, Россия", 5), ("Казань, Россия", 2)])
+
+        database.rebuild_rollups()
+        self.assertEqual(database.get_top_cities(3), [("Москва, Россия", 5), ("Казань, Россия", 2)])
+
+        api = Mock()
+        api.max_locations_per_request = 100
+        api.get_coordinates.side_effect = lambda city: {'latitude': 1.0, 'longitude': 2.0,
+                                                        'name': city, 'country': "Россия"}
+        api.get_weather_many.side_effect = lambda coords, names: [{'city': name} for name in names]
+        result = prefetch_popular(api, limit=2)
+        self.assertEqual(result['cities'], ["Москва, Россия", "Казань, Россия"])
+
+    def test_backfill_chunks_dedupes_and_resumes(self):
+        chunks = split_range(date(2024, 1, 1), date(2024, 3, 31), 30)
+        self.assertEqual(chunks[0][0], date(2024, 1, 1))
+        self.assertTrue(all(end.toordinal() % 30 == 29 for _, end in chunks[:-1]))
+        self.assertEqual(split_range(date(2024, 1, 5), date(2024, 3, 31), 30)[1:], chunks[1:])
+
+        def fake_archive(latitude, longitude, start, end):
+            hours = ((end - start).days + 1) * 24
+            first = datetime.combine(start, datetime.min.time())
+            return {'hourly': {
+                'time': [(first + timedelta(hours=h)).strftime('%Y-%m-%dT%H:%M') for h in range(hours)],
+                'temperature_2m': [1.0] * (hours - 1) + [None],
+                'windspeed_10m': [2.0] * hours,
+                'winddirection_10m': [90.4] * hours,
+                'weathercode': [3] * hours,
+            }}
+
+        api = Mock()
+        api.get_archive.side_effect = fake_archive
+        locations = [("Омск, Россия", 55.0, 73.4)]
+        first = backfill(api, locations, date(2024, 1, 1), date(2024, 1, 31), 10, batch_rows=100)
+        self.assertEqual((first['done'], first['skipped'], first['failed']), (first['chunks'], 0, 0))
+        self.assertEqual(first['inserted'], 31 * 24 - first['chunks'])
+
+        calls = api.get_archive.call_count
+        again = backfill(api, locations, date(2024, 1, 1), date(2024, 2, 5), 10)
+        # Последний кусок первого запуска был обрезан концом интервала и загружается снова
+        self.assertEqual(again['skipped'], first['chunks'] - 1)
+        self.assertEqual(api.get_archive.call_count - calls, again['done'])
+
+        conn = database.get_connection()
+        duplicates = conn.execute("SELECT COUNT(*) - COUNT(DISTINCT timestamp) FROM history").fetchone()[0]
+        self.assertEqual(duplicates, 0)
+        stats = database.get_stats('month', city="Омск")
+        self.assertEqual(stats[-1]['period'], "2024-01")
+
+    def test_spatial_queries_use_coordinates(self):
+        def at(latitude, longitude, temperature=1.0):
+            return dict(self.weather(temperature), latitude=latitude, longitude=longitude)
+
+        database.save_requests([("Москва, Россия", at(55.7558, 37.6173)),
+                                ("Зеленоград, Россия", at(55.9825, 37.1814)),
+                                ("Санкт-Петербург, Россия", at(59.9343, 30.3351)),
+                                ("Сува, Фиджи", at(-18.1416, 178.4419)),
+                                ("Тавеуни, Фиджи", at(-16.8, -179.97)),
+                                ("Без координат", self.weather(2.0))])
+        database.save_request("Москва, Россия", at(55.7558, 37.6173, 5.0))
+
+        near = database.get_history_near(55.7558, 37.6173, 50)
+        self.assertEqual([row['city'] for row in near],
+                         ["Москва, Россия", "Зеленоград, Россия", "Москва, Россия"])
+        self.assertEqual(near[0]['temperature'], 5.0)
+        self.assertAlmostEqual(near[1]['distance_km'], 36, delta=2)
+        self.assertEqual(len(database.get_history_near(55.7558, 37.6173, 50, limit=1)), 1)
+        self.assertEqual(database.get_history_near(55.7558, 37.6173, 50, since="2999-01-01"), [])
+
+        # Области через меридиан 180° ищутся с обеих сторон
+        pacific = database.get_history_in_box(-20, 175, -15, -175)
+        self.assertEqual(sorted(row['city'] for row in pacific), ["Сува, Фиджи", "Тавеуни, Фиджи"])
+        self.assertEqual(len(database.get_history_near(-17.5, 179.5, 250)), 2)
+
+        nearest = database.get_nearest_locations(59.0, 31.0, limit=2)
+        self.assertEqual([row['city'] for row in nearest], ["Санкт-Петербург, Россия", "Зеленоград, Россия"])
+        self.assertEqual(database.get_nearest_locations(59.0, 31.0, max_km=10), [])
+
+        plan = database.get_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM history WHERE latitude = 1 AND longitude = 2 "
+            "AND timestamp >= '2025' ORDER BY timestamp DESC").fetchall()
+        self.assertIn("idx_history_location", plan[0][3])
+
+    @patch('weather.commands.create_api')
+    def test_coords_request_saved_with_coordinates(self, mock_create_api):
+        mock_create_api.return_value.get_weather_by_coords.return_value = dict(
+            self.weather(4.0), time="2025-01-01T00:00", city=None, latitude=55.75, longitude=37.62)
+        args = create_parser().parse_args(['--coords', '55.75', '37.62', '--no-daemon'])
+
+        output = get_weather_command(args)
+
+        self.assertNotIn("Ошибка", output)
+        row = database.get_connection().execute(
+            "SELECT city, latitude, longitude FROM history").fetchone()
+        self.assertEqual(row, ("55.75, 37.62", 55.75, 37.62))
+        self.assertEqual(len(database.get_history_near(55.75, 37.62, 1)), 1)
+
+    @patch('weather.commands.create_api')
+    def test_watch_coords_saved_like_coords_request(self, mock_create_api):
+        mock_create_api.return_value.get_weather.return_value = dict(
+            self.weather(4.0), time="2025-01-01T00:00", city=None, latitude=55.75, longitude=37.62)
+        args = create_parser().parse_args(['--watch', '--coords', '55.75', '37.62', '--interval', '600'])
+
+        with patch.object(WatchScheduler, 'run', lambda self: self._run_one(self.targets[0])), \
+                redirect_stdout(io.StringIO()):
+            watch_command(args)
+
+        row = database.get_connection().execute("SELECT city FROM history").fetchone()
+        self.assertEqual(row, (database.coords_label(55.75, 37.62),))
+
+    def test_compact_history_keeps_stats(self):
+        start = datetime(2024, 1, 1)
+        rows = [((start + timedelta(minutes=20 * i)).isoformat(timespec='minutes'), "Омск, Россия",
+                 float(i % 10), 2.0, 90, i % 3, None, None, None) for i in range(24 * 3 * 10)]
+        database.save_archive_rows(rows, [])
+        stats = database.get_stats('day')
+
+        summary = database.compact_history(raw_days=5, hourly_days=8, batch_rows=50,
+                                           now=datetime(2024, 1, 15, 12))
+        conn = database.get_connection()
+        # Сырые записи до 10.01 сжаты, до 07.01 — удалены без почасовых сводок
+        self.assertEqual(conn.execute("SELECT MIN(timestamp) FROM history").fetchone()[0],
+                         "2024-01-10T00:00")
+        self.assertEqual(conn.execute("SELECT MIN(hour), SUM(samples) FROM history_hourly").fetchone(),
+                         ("2024-01-07T00", summary['compacted']))
+        self.assertEqual(summary['compacted'], 3 * 24 * 3)
+        self.assertGreater(summary['batches'], 1)
+        self.assertEqual(database.get_stats('day'), stats)
+
+        hourly = database.get_hourly("Омск", since="2024-01-09T23", until="2024-01-10T01")
+        self.assertEqual([(row['hour'], row['samples']) for row in hourly],
+                         [("2024-01-09T23", 3), ("2024-01-10T00", 3)])
+
+        # Обе ветки читаются по индексам, без просмотра всей таблицы
+        statements = []
+        conn.set_trace_callback(statements.append)
+        database.get_hourly("Омск", since="2024-01-09T23", until="2024-01-10T01")
+        conn.set_trace_callback(None)
+        plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statements[-1]))
+        self.assertNotIn("SCAN history", plan)
+        self.assertIn("idx_history_city_timestamp", plan)
+        database.rebuild_rollups()
+        self.assertEqual(database.get_stats('day'), stats)
+
+    def test_rebuild_rollups_matches_incremental(self):
+        database.save_requests([("Омск", self.weather(t, t % 2)) for t in range(10)])
+        incremental = database.get_stats('month')
+        database.rebuild_rollups()
+        self.assertEqual(database.get_stats('month'), incremental)
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original_path = database.DB_PATH
+        database.DB_PATH = os.path.join(self.tmpdir.name, 'history.db')
+
+    def tearDown(self):
+        database.close_db()
+        database.DB_PATH = self.original_path
+        self.tmpdir.cleanup()
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def slow():
+            calls.append(1)
+            release.wait(2)
+            return "результат"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do("k", slow)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["результат"] * 5)
+        self.assertEqual(flights.in_flight(), 0)
+
+    def test_server_answers_and_saves_history(self):
+        api = Mock()
+        api.get_weather_by_city.return_value = {
+            'temperature': 4.0, 'windspeed': 2.0, 'winddirection': 90,
+            'weathercode': 3, 'time': "2025-01-01T00:00", 'city': "Москва, Россия"}
+        server = start_in_background(('127.0.0.1', 0), api=api)
+        address = server.server_address
+        try:
+            response = request_daemon('/weather', {'city': "Москва"}, address=address)
+            self.assertTrue(response['ok'])
+            self.assertEqual(response['data']['description'], "Пасмурно")
+
+            response = request_daemon('/weather', {}, address=address)
+            self.assertFalse(response['ok'])
+
+            history = request_daemon('/history', {'limit': 5}, address=address)
+            self.assertEqual(history['data'][0][1], "Москва, Россия")
+
+            api.get_weather_by_coords.return_value = {
+                'temperature': 1.0, 'windspeed': 2.0, 'winddirection': 90, 'weathercode': 0,
+                'time': "2025-01-01T00:00", 'city': None, 'latitude': 55.75, 'longitude': 37.62}
+            response = request_daemon('/weather', {'lat': 55.75, 'lon': 37.62}, address=address)
+            self.assertTrue(response['ok'], response)
+            history = request_daemon('/history', {'limit': 1}, address=address)
+            self.assertEqual(history['data'][0][1], "55.75, 37.62")
+
+            stats = request_daemon('/metrics', {'format': 'json'}, address=address)
+            self.assertIn('stages', stats['data'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_server_answers_when_history_write_fails(self):
+        api = Mock()
+        api.get_weather_by_city.return_value = {
+            'temperature': 4.0, 'windspeed': 2.0, 'winddirection': 90,
+            'weathercode': 3, 'time': "2025-01-01T00:00", 'city': "Москва, Россия"}
+        server = start_in_background(('127.0.0.1', 0), api=api)
+        stderr = io.StringIO()
+        try:
+            with patch('weather.server.save_request', side_effect=Exception("database is locked")), \
+                    redirect_stderr(stderr):
+                response = request_daemon('/weather', {'city': "Москва"}, address=server.server_address)
+            self.assertTrue(response['ok'], response)
+            self.assertEqual(response['data']['temperature'], 4.0)
+            self.assertIn("database is locked", stderr.getvalue())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_client_settings_bypass_daemon(self):
+        parser = create_parser()
+        self.assertTrue(use_daemon(parser.parse_args(['--city', 'Москва'])))
+        for extra in (['--grid-resolution', '0.05'], ['--grid-tolerance', '5'],
+                      ['--gazetteer', 'cities.idx'], ['--no-daemon']):
+            self.assertFalse(use_daemon(parser.parse_args(['--city', 'Москва', *extra])), extra)
+
+    def test_client_returns_none_without_server(self):
+        self.assertIsNone(request_daemon('/health', address=('127.0.0.1', 9)))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = WeatherCache(os.path.join(self.tmpdir.name, 'cache.db'), legacy_file=None)
+        self.api = WeatherAPI(cache=self.cache)
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_disabled_records_nothing(self):
+        self.cache.set("weather_1_2", {'temperature': 1.0})
+        self.cache.get("weather_1_2")
+        with metrics.timer('format'):
+            pass
+        self.assertEqual(metrics.snapshot()['stages'], {})
+        self.assertEqual(metrics.snapshot()['counters'], {})
+
+    @patch('requests.Session.get')
+    def test_stages_and_counters(self, mock_get):
+        metrics.enable()
+        mock_get.return_value.content = b'{"current_weather": {}}'
+        mock_get.return_value.json.return_value = {
+            'current_weather': {'temperature': 3.0, 'windspeed': 1.0, 'winddirection': 0,
+                                'weathercode': 0, 'time': "2025-01-01T00:00"}}
+
+        self.api.get_weather(1.0, 2.0)
+        self.api.get_weather(1.0, 2.0)
+
+        data = metrics.snapshot()
+        self.assertEqual(data['stages']['http.forecast']['count'], 1)
+        self.assertEqual(data['counters']['http.requests'], 1)
+        self.assertEqual(data['counters']['http.bytes'], len(mock_get.return_value.content))
+        self.assertEqual(data['cache_hit_ratio'], 0.5)
+        self.assertIn('cache.set', data['stages'])
+
+        text = metrics.to_prometheus()
+        self.assertIn('weather_stage_seconds_count{stage="http.forecast"} 1', text)
+        self.assertIn('weather_http_requests_total 1', text)
+        self.assertIn("http.forecast", metrics.format_report(0.5))
+
+
+class TestScheduler(unittest.TestCase):
+    def test_parse_watch_target(self):
+        self.assertEqual(parse_watch_target("Москва@600")['interval'], 600)
+        target = parse_watch_target("55.75,37.62")
+        self.assertEqual((target['latitude'], target['longitude']), (55.75, 37.62))
+        self.assertIsNone(target['interval'])
+        with self.assertRaises(ValueError):
+            parse_watch_target("Москва@0")
+
+    def test_rate_limiter_spaces_requests(self):
+        sleeps = []
+        limiter = RateLimiter(rate=2.0, clock=lambda: 0.0, sleep=sleeps.append)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+    def test_refreshes_bypass_cache_and_reschedule(self):
+        api = Mock()
+        api.get_coordinates.return_value = {'latitude': 1.0, 'longitude': 2.0,
+                                            'name': "Москва", 'country': "Россия"}
+        api.get_weather.return_value = {'temperature': 1.0}
+        results = []
+        scheduler = WatchScheduler(api, [parse_watch_target("Москва"), parse_watch_target("3,4")],
+                                   interval=0.01, jitter=0, rate=1000,
+                                   on_result=lambda target, data: results.append(target['query']))
+
+        scheduler.run(max_refreshes=4)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(api.get_coordinates.call_count, 1)
+        self.assertTrue(all(call.kwargs['refresh'] for call in api.get_weather.call_args_list))
+
+    def test_callback_error_keeps_target_scheduled(self):
+        api = Mock()
+        api.get_weather.return_value = {'temperature': 1.0}
+        errors = []
+
+        def on_result(target, data):
+            raise Exception("database is locked")
+
+        scheduler = WatchScheduler(api, [parse_watch_target("3,4")], interval=0.01, jitter=0,
+                                   rate=1000, on_result=on_result,
+                                   on_error=lambda target, error: errors.append(error))
+
+        scheduler.run(max_refreshes=3)
+
+        self.assertEqual(api.get_weather.call_count, 3)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(len(scheduler._queue), 1)
+
+
+class TestStartup(unittest.TestCase):
+    def test_entry_point_does_not_import_heavy_modules(self):
+        code = ("import sys, weather.main, weather.commands; "
+                "print(','.join(m for m in ('requests', 'sqlite3', 'weather.api') if m in sys.modules))")
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "")
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    WEATHER = {'current_weather': {'temperature': 7.0, 'windspeed': 1.0, 'winddirection': 0,
+                                   'weathercode': 0, 'time': "2025-01-01T00:00"}}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = WeatherCache(os.path.join(self.tmpdir.name, 'cache.db'),
+                                  legacy_file=None, memory_entries=0)
+        self.api = WeatherAPI(cache=self.cache)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def age(self, key, seconds):
+        self.cache._conn.execute("UPDATE cache SET timestamp = ? WHERE key = ?",
+                                 (time.time() - seconds, key))
+
+    def test_policies_per_namespace(self):
+        self.cache.set("coords_москва", {'name': "Москва"})
+        self.cache.set("weather_1_2", {'temperature': 1.0})
+        self.age("coords_москва", 24 * 3600)
+        self.age("weather_1_2", 24 * 3600)
+
+        self.assertEqual(self.cache.get("coords_москва"), {'name': "Москва"})
+        self.assertIsNone(self.cache.get("weather_1_2"))
+        self.assertIsNone(self.cache.get_entry("weather_1_2"))
+
+    @patch('requests.Session.get')
+    def test_stale_value_returned_and_refreshed_in_background(self, mock_get):
+        self.cache.set("weather_1.0_2.0", {'temperature': 1.0})
+        self.age("weather_1.0_2.0", 20 * 60)
+        mock_get.return_value.json.return_value = self.WEATHER
+
+        result = self.api.get_weather(1.0, 2.0)
+        self.assertEqual(result['temperature'], 1.0)
+
+        self.api.wait_for_revalidation()
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(self.cache.get("weather_1.0_2.0")['temperature'], 7.0)
+
+    def test_revalidation_does_not_delay_exit(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch():
+            started.set()
+            release.wait(5)
+
+        self.api._revalidate_in_background("weather_slow", slow_fetch)
+        self.assertTrue(started.wait(5))
+        threads = [t for t in threading.enumerate() if t.name == 'weather-revalidate']
+        self.assertTrue(threads and all(t.daemon for t in threads))
+        release.set()
+        self.api.wait_for_revalidation()
+
+    @patch('requests.Session.get')
+    def test_stale_if_error(self, mock_get):
+        self.cache.set("weather_1.0_2.0", {'temperature': 1.0})
+        self.age("weather_1.0_2.0", 2 * 3600)
+        mock_get.side_effect = requests.ConnectionError("Нет сети")
+
+        self.assertEqual(self.api.get_weather(1.0, 2.0)['temperature'], 1.0)
+
+        self.age("weather_1.0_2.0", 7 * 3600)
+        with self.assertRaises(Exception):
+            self.api.get_weather(1.0, 2.0)
+
+
+    @patch('requests.Session.get')
+    def test_batch_serves_stale_on_upstream_failure(self, mock_get):
+        self.cache.set("weather_1.0_2.0", {'temperature': 1.0})
+        self.cache.set("weather_3.0_4.0", {'temperature': 3.0})
+        self.age("weather_1.0_2.0", 2 * 3600)
+        self.age("weather_3.0_4.0", 2 * 3600)
+        mock_get.side_effect = requests.ConnectionError("Нет сети")
+
+        results = self.api.get_weather_many([(1.0, 2.0), (3.0, 4.0)], ["А", "Б"])
+        self.assertEqual([(r['city'], r['temperature']) for r in results], [("А", 1.0), ("Б", 3.0)])
+
+        with self.assertRaises(Exception):
+            self.api.get_weather_many([(1.0, 2.0), (5.0, 6.0)])
+
+    @patch('requests.Session.get')
+    def test_batch_revalidates_stale_points_in_one_request(self, mock_get):
+        for key in ("weather_1.0_2.0", "weather_3.0_4.0"):
+            self.cache.set(key, {'temperature': 1.0})
+            self.age(key, 20 * 60)
+        mock_get.return_value.json.return_value = [self.WEATHER, self.WEATHER]
+
+        results = self.api.get_weather_many([(1.0, 2.0), (3.0, 4.0)])
+        self.assertEqual([r['temperature'] for r in results], [1.0, 1.0])
+
+        self.api.wait_for_revalidation()
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(self.cache.get("weather_3.0_4.0")['temperature'], 7.0)
+
+class TestForecast(unittest.TestCase):
+    # 48 часов с 2025-01-01 00:00 UTC, местное время UTC+3
+    RESPONSE = {
+        'utc_offset_seconds': 3 * 3600,
+        'hourly': {
+            'time': [1735689600 + hour * 3600 for hour in range(48)],
+            'temperature_2m': [float(hour % 24) - 10 for hour in range(48)],
+            'precipitation': [0.5] * 47 + [None],
+            'windspeed_10m': [50.0 if 10 <= hour % 24 < 13 else 5.0 for hour in range(48)],
+        }
+    }
+
+    def test_daily_aggregates_in_local_time(self):
+        series = ForecastSeries.from_response(self.RESPONSE)
+        self.assertEqual(len(series), 48)
+        days = series.daily_min_max()
+        # Первые сутки по местному времени начинаются в 21:00 UTC
+        self.assertEqual([day for day, _, _ in days], ['2025-01-01', '2025-01-02', '2025-01-03'])
+        self.assertEqual(days[0][1:], (-10.0, 10.0))
+        precipitation = series.daily('precipitation', 'sum')
+        self.assertEqual(precipitation[0], ('2025-01-01', 10.5))
+        self.assertEqual(precipitation[2], ('2025-01-03', 1.0))
+
+    def test_threshold_alerts(self):
+        series = ForecastSeries.from_response(self.RESPONSE)
+        alerts = series.threshold_alerts('windspeed_10m', above=40)
+        self.assertEqual(len(alerts), 2)
+        self.assertEqual(alerts[0], {'variable': 'windspeed_10m', 'start': '2025-01-01T13:00+03:00',
+                                     'end': '2025-01-01T15:00+03:00', 'peak': 50.0})
+        self.assertEqual(parse_alert("temperature_2m<-15"), ('temperature_2m', None, -15.0))
+        with self.assertRaises(ValueError):
+            parse_alert("temperature_2m=5")
+
+    def test_cache_roundtrip(self):
+        series = ForecastSeries.from_response(self.RESPONSE)
+        restored = ForecastSeries.from_cache(json.loads(json.dumps(series.to_cache())), "Москва")
+        self.assertEqual(restored.times, series.times)
+        self.assertEqual(restored.daily_min_max(), series.daily_min_max())
+        self.assertEqual(restored.city, "Москва")
+
+    @patch('requests.Session.get')
+    def test_get_forecast_many_uses_one_request_and_cache(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = WeatherCache(os.path.join(tmpdir, 'cache.db'), legacy_file=None)
+            api = WeatherAPI(cache=cache)
+            mock_get.return_value.json.return_value = [self.RESPONSE, self.RESPONSE]
+
+            series = api.get_forecast_many([(55.75, 37.62), (59.94, 30.31)], days=2,
+                                           city_names=["Москва", "Санкт-Петербург"])
+            self.assertEqual([item.city for item in series], ["Москва", "Санкт-Петербург"])
+            params = mock_get.call_args.kwargs['params']
+            self.assertEqual(params['latitude'], "55.75,59.94")
+            self.assertEqual(params['timeformat'], 'unixtime')
+
+            again = api.get_forecast(59.94, 30.31, days=2)
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertEqual(len(again), 48)
+            cache.close()
+
 
 class TestArgumentParser(unittest.TestCase):
     def test_city_argument(self):
@@ -86,6 +1014,97 @@ class TestArgumentParser(unittest.TestCase):
         with self.assertRaises(SystemExit):
             parser.parse_args(['--city', 'Москва', '--coords', '55', '37'])
 
+    def test_cities_argument(self):
+        parser = create_parser()
+        args = parser.parse_args(['--cities', 'Москва', 'Казань', '--workers', '4'])
+        self.assertEqual(args.cities, ['Москва', 'Казань'])
+        self.assertEqual(args.workers, 4)
+        self.assertIsNone(args.city)
+
+    def test_watch_interval_and_rate_positive(self):
+        parser = create_parser()
+        args = parser.parse_args(['--watch', '--city', 'Москва', '--interval', '60', '--rate', '0.5'])
+        self.assertEqual((args.interval, args.rate), (60.0, 0.5))
+        for option, value in (('--interval', '0'), ('--interval', '-5'), ('--rate', '0')):
+            with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                parser.parse_args(['--watch', '--city', 'Москва', option, value])
+
+    def test_forecast_days_range(self):
+        parser = create_parser()
+        self.assertEqual(parser.parse_args(['--forecast', '--city', 'Москва']).forecast, 3)
+        self.assertEqual(parser.parse_args(['--forecast', '16', '--city', 'Москва']).forecast, 16)
+        for days in ('0', '17', 'три'):
+            with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                parser.parse_args(['--forecast', days, '--city', 'Москва'])
+
+
+class TestBatch(unittest.TestCase):
+    def test_read_cities_skips_blank_and_comments(self):
+        lines = ["Москва\n", "\n", "# комментарий\n", "  Казань  \n"]
+        self.assertEqual(read_cities(lines), ["Москва", "Казань"])
+
+    def test_results_in_input_order_and_errors_isolated(self):
+        def fake_get_coordinates(city):
+            if city == "Ошибка":
+                raise Exception("Нет интернета")
+            if city == "Нигде":
+                return None
+            return {'latitude': len(city), 'longitude': 0.0, 'name': city, 'country': "Россия"}
+
+        api = Mock()
+        api.max_locations_per_request = 2
+        api.get_coordinates.side_effect = fake_get_coordinates
+        api.get_weather_many.side_effect = lambda coords, names: [{'city': name} for name in names]
+        cities = ["Москва", "Ошибка", "Казань", "Нигде", "Омск"]
+
+        results = fetch_weather_batch(api, cities, workers=3)
+
+        self.assertEqual([city for city, _, _ in results], cities)
+        self.assertEqual(results[2][1], {'city': "Казань, Россия"})
+        self.assertIsNone(results[4][2])
+        self.assertIn("Нет интернета", str(results[1][2]))
+        self.assertIn("не найден", str(results[3][2]))
+        self.assertEqual(api.get_weather_many.call_count, 2)
+
+
+class TestOutput(unittest.TestCase):
+    def test_streaming_records_keep_stable_fields(self):
+        data = {'temperature': 1.0, 'windspeed': 2.0, 'winddirection': 90,
+                'weathercode': 3, 'time': "2025-01-01T00:00", 'city': "Москва, Россия"}
+        records = [make_record(1, "Москва", data), make_record(0, "Нигде", error="не найден")]
+
+        buffer = io.StringIO()
+        self.assertEqual(write_records(buffer, records, 'ndjson'), (2, 1))
+        lines = [json.loads(line) for line in buffer.getvalue().splitlines()]
+        self.assertEqual([list(line) for line in lines], [list(RECORD_FIELDS)] * 2)
+        self.assertEqual(lines[0]['description'], "Пасмурно")
+        self.assertEqual((lines[1]['ok'], lines[1]['error'], lines[1]['temperature']),
+                         (False, "не найден", None))
+
+        buffer = io.StringIO()
+        write_records(buffer, iter(records), 'json')
+        self.assertEqual(len(json.loads(buffer.getvalue())), 2)
+        buffer = io.StringIO()
+        write_records(buffer, [], 'json')
+        self.assertEqual(json.loads(buffer.getvalue()), [])
+
+    @patch('weather.database.save_requests', side_effect=RuntimeError("database is locked"))
+    @patch('weather.commands.create_api')
+    def test_history_failure_keeps_result_and_stdout_clean(self, mock_create_api, _):
+        mock_create_api.return_value.get_weather_by_city.return_value = {
+            'temperature': 1.0, 'windspeed': 2.0, 'winddirection': 90, 'weathercode': 3,
+            'time': "2025-01-01T00:00", 'city': "Москва, Россия"}
+        args = create_parser().parse_args(['--city', 'Москва', '--no-daemon', '--format', 'ndjson'])
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            get_weather_command(args)
+
+        record = json.loads(stdout.getvalue())
+        self.assertTrue(record['ok'])
+        self.assertEqual(record['temperature'], 1.0)
+        self.assertIn("database is locked", stderr.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
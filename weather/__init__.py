@@ -6,8 +6,22 @@
 
 __all__ = [
     "api",
+    "backfill",
+    "batch",
     "cache",
+    "client",
+    "codes",
     "commands",
+    "export",
+    "forecast",
+    "gazetteer",
+    "geo",
+    "metrics",
+    "output",
     "parser",
+    "prefetch",
+    "scheduler",
+    "server",
+    "singleflight",
     "main"
 ]
\ No newline at end of file
@@ -1,25 +1,143 @@
 """Модуль для работы с API Open-Meteo.
 
-Содержит класс WeatherAPI для получения координат и текущей погоды,
-а также вспомогательную функцию преобразования кода погоды в текст.
+Содержит класс WeatherAPI для получения координат и текущей погоды.
+Функция преобразования кода погоды в текст живёт в weather.codes
+и реэкспортируется отсюда.
 """
 
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
 from .cache import WeatherCache
+from .codes import get_weather_description  # реэкспорт: исторически функция жила здесь
+from .forecast import HOURLY_VARIABLES, ForecastSeries
+from .gazetteer import Gazetteer, normalize_name
+from .geo import KM_PER_DEGREE, cell_center, cell_ranges, grid_cell, haversine_km, wrap_cell_col
+
+# Таймауты (подключение, чтение) в секундах
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Сколько фоновых обновлений кэша выполняется одновременно
+REVALIDATE_WORKERS = 2
+
+# Наибольший радиус поиска соседних ячеек сетки, в шагах сетки
+MAX_TOLERANCE_CELLS = 500
+
+# Значение в кэше для названий, которые геокодер не нашёл
+COORDS_NOT_FOUND = {'not_found': True}
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+# Почасовые переменные архива, соответствующие столбцам таблицы history
+ARCHIVE_VARIABLES = ('temperature_2m', 'windspeed_10m', 'winddirection_10m', 'weathercode')
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def create_session(retries: int = 3, backoff_factor: float = 0.5, backoff_jitter: float = 0.5,
+                   backoff_max: float = 10, pool_maxsize: int = 16) -> requests.Session:
+    """Создаёт HTTP-сессию с пулом соединений и повторами запросов.
+
+    Повторы выполняются при сетевых ошибках и ответах 429/5xx
+    с экспоненциальной задержкой со случайным разбросом; заголовок
+    Retry-After учитывается.
+
+    Args:
+        retries (int): Максимальное число повторов.
+        backoff_factor (float): Базовый множитель экспоненциальной задержки.
+        backoff_jitter (float): Максимальная случайная добавка к задержке (сек).
+        backoff_max (float): Верхняя граница задержки между повторами (сек).
+        pool_maxsize (int): Число соединений, хранимых в пуле для одного хоста.
+
+    Returns:
+        requests.Session: Настроенная сессия.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        backoff_max=backoff_max,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_shared_session() -> requests.Session:
+    """Возвращает общую для процесса HTTP-сессию, создавая её при первом вызове."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
 
 
 class WeatherAPI:
     """Клиент для работы с Open-Meteo API с поддержкой кэширования."""
 
-    def __init__(self):
-        """Инициализирует клиент API и объект кэша."""
-        self.base_url = "https://api.open-meteo.com/v1/forecast"
-        self.geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-        self.cache = WeatherCache()
+    def __init__(self, session: requests.Session | None = None, timeout=DEFAULT_TIMEOUT,
+                 cache: WeatherCache | None = None, grid_resolution: float | None = None,
+                 grid_tolerance_km: float = 0.0, gazetteer: Gazetteer | None = None,
+                 base_url: str = FORECAST_URL, geocoding_url: str = GEOCODING_URL,
+                 archive_url: str = ARCHIVE_URL):
+        """Инициализирует клиент API и объект кэша.
+
+        Args:
+            session (requests.Session | None): HTTP-сессия; по умолчанию —
+                                               общая сессия процесса.
+            timeout (float | tuple[float, float]): Таймауты подключения и чтения.
+            cache (WeatherCache | None): Кэш; по умолчанию — WeatherCache().
+            grid_resolution (float | None): Шаг сетки в градусах для ключей кэша
+                                            погоды; None — ключ по точным координатам.
+            grid_tolerance_km (float): Радиус, в котором при промахе ищется
+                                       ближайшая ячейка сетки со свежими данными
+                                       (не больше MAX_TOLERANCE_CELLS шагов сетки).
+            gazetteer (Gazetteer | None): Локальный справочник городов, к которому
+                                          get_coordinates обращается до сети.
+            base_url (str): Адрес API прогноза (например, локальной заглушки).
+            geocoding_url (str): Адрес API геокодирования.
+            archive_url (str): Адрес API архива погоды.
+
+        Raises:
+            ValueError: Если радиус поиска слишком велик для шага сетки.
+        """
+        if grid_resolution is not None and \
+                grid_tolerance_km > MAX_TOLERANCE_CELLS * grid_resolution * KM_PER_DEGREE:
+            raise ValueError(f"Радиус поиска {grid_tolerance_km} км больше {MAX_TOLERANCE_CELLS} "
+                             f"шагов сетки {grid_resolution}°: увеличьте шаг или уменьшите радиус")
+        self.session = session or get_shared_session()
+        self.timeout = timeout
+        self.base_url = base_url
+        self.geocoding_url = geocoding_url
+        self.archive_url = archive_url
+        self.max_locations_per_request = 100
+        self.cache = cache if cache is not None else WeatherCache()
+        self.grid_resolution = grid_resolution
+        self.grid_tolerance_km = grid_tolerance_km
+        self.gazetteer = gazetteer
+        self._revalidating = set()
+        self._revalidate_lock = threading.Lock()
+        self._revalidate_slots = threading.BoundedSemaphore(REVALIDATE_WORKERS)
+        self._revalidate_threads = set()
 
     def get_coordinates(self, city_name: str):
         """Получает географические координаты по названию города.
 
+        Сначала проверяются кэш и локальный справочник, и только затем
+        выполняется запрос к API геокодирования. Ненайденные названия
+        тоже кэшируются, чтобы повторные опечатки не уходили в сеть.
+
         Args:
             city_name (str): Название города (регистр не важен).
 
@@ -30,11 +148,29 @@ class WeatherAPI:
         Raises:
             Exception: При сетевых ошибках или проблемах с API.
         """
-        cache_key = f"coords_{city_name.lower()}"
-        cached_data = self.cache.get(cache_key)
-        if cached_data:
-            return cached_data
+        cache_key = f"coords_{normalize_name(city_name)}"
+        entry = self.cache.get_entry(cache_key)
+        if entry is not None and (entry['fresh'] or entry['revalidate']):
+            if not entry['fresh']:
+                self._revalidate_in_background(cache_key, self._fetch_coordinates,
+                                               city_name, cache_key)
+            return None if entry['data'] == COORDS_NOT_FOUND else entry['data']
+
+        if self.gazetteer is not None:
+            coords = self.gazetteer.find(city_name)
+            if coords:
+                self.cache.set(cache_key, coords)
+                return coords
 
+        try:
+            return self._fetch_coordinates(city_name, cache_key)
+        except Exception:
+            if entry is not None and entry['usable_on_error']:
+                return None if entry['data'] == COORDS_NOT_FOUND else entry['data']
+            raise
+
+    def _fetch_coordinates(self, city_name: str, cache_key: str):
+        """Запрашивает координаты у API геокодирования и кэширует ответ."""
         params = {
             'name': city_name,
             'count': 1,
@@ -43,9 +179,7 @@ class WeatherAPI:
         }
 
         try:
-            response = requests.get(self.geocoding_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = self._request(self.geocoding_url, params, 'http.geocoding')
 
             if data.get('results'):
                 result = data['results'][0]
@@ -53,34 +187,63 @@ class WeatherAPI:
                     'latitude': result['latitude'],
                     'longitude': result['longitude'],
                     'name': result['name'],
-                    'country': result['country']
+                    'country': result['country'],
+                    'country_code': result.get('country_code')
                 }
                 self.cache.set(cache_key, coords)
                 return coords
+            self.cache.set(cache_key, COORDS_NOT_FOUND)
             return None
 
         except requests.RequestException as e:
             raise Exception(f"Ошибка при получении координат: {e}")
 
-    def get_weather(self, latitude: float, longitude: float, city_name: str | None = None):
+    def get_weather(self, latitude: float, longitude: float, city_name: str | None = None,
+                    refresh: bool = False):
         """Получает текущую погоду по координатам.
 
+        Свежая запись кэша возвращается сразу. Устаревшая запись в окне
+        stale-while-revalidate тоже возвращается сразу, а обновление
+        запускается в фоне; при ошибке API отдаётся устаревшая запись
+        в окне stale-if-error.
+
         Args:
             latitude (float): Широта.
             longitude (float): Долгота.
             city_name (str | None): Название города для отображения (опционально).
+            refresh (bool): Не читать кэш, а запросить свежие данные и обновить кэш.
 
         Returns:
-            dict: Данные о погоде (temperature, windspeed, weathercode и др.).
+            dict: Данные о погоде (temperature, windspeed, weathercode и др.),
+                  а также запрошенные latitude и longitude.
 
         Raises:
             Exception: При сетевых ошибках или проблемах с API.
         """
-        cache_key = f"weather_{latitude}_{longitude}"
-        cached_data = self.cache.get(cache_key)
-        if cached_data:
-            return cached_data
+        cache_key = self._weather_cache_key(latitude, longitude)
+        entry = None if refresh else self.cache.get_entry(cache_key)
+        if entry is not None and entry['fresh']:
+            return self._located(entry['data'], city_name, latitude, longitude)
+
+        if not refresh and self.grid_tolerance_km > 0:
+            cached_data = self._get_cached_weather(latitude, longitude)
+            if cached_data:
+                return self._located(cached_data, city_name, latitude, longitude)
+
+        if entry is not None and entry['revalidate']:
+            self._revalidate_in_background(cache_key, self._fetch_weather, latitude, longitude)
+            return self._located(entry['data'], city_name, latitude, longitude)
 
+        try:
+            return self._located(self._fetch_weather(latitude, longitude, city_name),
+                                 city_name, latitude, longitude)
+        except Exception:
+            if entry is not None and entry['usable_on_error']:
+                return self._located(entry['data'], city_name, latitude, longitude)
+            raise
+
+    def _fetch_weather(self, latitude: float, longitude: float, city_name: str | None = None):
+        """Запрашивает текущую погоду у API и кэширует ответ."""
         params = {
             'latitude': latitude,
             'longitude': longitude,
@@ -90,25 +253,382 @@ class WeatherAPI:
         }
 
         try:
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            weather_data = {
-                'temperature': data['current_weather']['temperature'],
-                'windspeed': data['current_weather']['windspeed'],
-                'winddirection': data['current_weather']['winddirection'],
-                'weathercode': data['current_weather']['weathercode'],
-                'time': data['current_weather']['time'],
-                'city': city_name
-            }
+            data = self._request(self.base_url, params)
 
-            self.cache.set(cache_key, weather_data)
+            weather_data = self._parse_current_weather(data, city_name)
+            self._store_weather(latitude, longitude, weather_data)
             return weather_data
 
         except requests.RequestException as e:
             raise Exception(f"Ошибка при получении погоды: {e}")
 
+    def _revalidate_in_background(self, cache_key: str, fetch, *args):
+        """Обновляет запись кэша в фоновом потоке, не дублируя уже идущее обновление.
+
+        При ошибке в кэше остаётся устаревшая запись. Потоки обновления —
+        фоновые (daemon) и не задерживают выход из программы: разовый запуск
+        CLI печатает устаревшие данные и завершается сразу, а обновление
+        успевает записаться в кэш, только если процесс ещё работает. В долгих
+        режимах (--serve, --watch) обновление всегда доходит до конца, а
+        разовый запуск после окна stale-while-revalidate запросит данные сам.
+        """
+        with self._revalidate_lock:
+            if cache_key in self._revalidating:
+                return
+            self._revalidating.add(cache_key)
+        self._start_revalidation([cache_key], fetch, *args)
+
+    def _revalidate_weather_in_background(self, points: list[tuple[float, float]]):
+        """Обновляет в фоне погоду для нескольких точек пакетными запросами.
+
+        Точки, обновление которых уже идёт, пропускаются.
+        """
+        keys = {point: self._weather_cache_key(*point) for point in points}
+        with self._revalidate_lock:
+            points = [point for point in points if keys[point] not in self._revalidating]
+            self._revalidating.update(keys[point] for point in points)
+        if points:
+            self._start_revalidation([keys[point] for point in points],
+                                     self._fetch_weather_many, points)
+
+    def _start_revalidation(self, cache_keys: list[str], fetch, *args):
+        """Запускает фоновый поток обновления и освобождает ключи по его завершении."""
+        def task():
+            try:
+                with self._revalidate_slots:
+                    fetch(*args)
+            except Exception:
+                pass
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.difference_update(cache_keys)
+                    self._revalidate_threads.discard(threading.current_thread())
+
+        thread = threading.Thread(target=task, name='weather-revalidate', daemon=True)
+        with self._revalidate_lock:
+            self._revalidate_threads.add(thread)
+        thread.start()
+
+    def wait_for_revalidation(self, timeout: float | None = None):
+        """Ждёт завершения идущих фоновых обновлений кэша (например, перед выходом)."""
+        with self._revalidate_lock:
+            threads = list(self._revalidate_threads)
+        for thread in threads:
+            thread.join(timeout)
+
+    def get_weather_many(self, coords, city_names=None):
+        """Получает текущую погоду сразу для нескольких точек.
+
+        Записи из кэша отдаются без запросов, а промахи объединяются
+        в пачки по ``max_locations_per_request`` точек — по одному
+        HTTP-запросу на пачку. Устаревшие записи обрабатываются так же,
+        как в get_weather: в окне stale-while-revalidate отдаются сразу
+        и обновляются в фоне одним пакетным запросом, а при ошибке API
+        пачка отдаётся из кэша, если для всех её точек есть записи
+        в окне stale-if-error.
+
+        Args:
+            coords (list[tuple[float, float]]): Пары (широта, долгота).
+            city_names (list[str | None] | None): Названия для отображения,
+                                                  по одному на точку (опционально).
+
+        Returns:
+            list[dict]: Данные о погоде в порядке входных координат,
+                        в том же формате, что и у get_weather.
+
+        Raises:
+            Exception: При сетевых ошибках или проблемах с API.
+        """
+        if city_names is None:
+            city_names = [None] * len(coords)
+
+        results = [None] * len(coords)
+        misses = {}
+        stale = {}
+        revalidate = {}
+        for index, (latitude, longitude) in enumerate(coords):
+            # Тот же порядок, что у get_weather: свежая запись, соседняя ячейка,
+            # устаревшая запись с фоновым обновлением, запрос к API
+            entry = self.cache.get_entry(self._weather_cache_key(latitude, longitude))
+            data = entry['data'] if entry is not None and entry['fresh'] else None
+            if data is None and self.grid_tolerance_km > 0:
+                data = self._get_cached_weather(latitude, longitude)
+            if data is None and entry is not None and entry['revalidate']:
+                data = entry['data']
+                revalidate[(latitude, longitude)] = True
+            if data is None:
+                misses.setdefault((latitude, longitude), []).append(index)
+                if entry is not None and entry['usable_on_error']:
+                    stale[(latitude, longitude)] = entry['data']
+                continue
+            results[index] = self._located(data, city_names[index], latitude, longitude)
+
+        if revalidate:
+            self._revalidate_weather_in_background(list(revalidate))
+
+        def use_stale(chunk, error):
+            # Пачка, для каждой точки которой есть запись в окне stale-if-error,
+            # отдаётся из кэша; иначе ошибка прерывает весь запрос
+            if not all(point in stale for point in chunk):
+                raise error
+
+        fetched = self._fetch_weather_many(list(misses), on_error=use_stale)
+        for point, indexes in misses.items():
+            weather_data = fetched[point] if point in fetched else stale[point]
+            for index in indexes:
+                results[index] = self._located(weather_data, city_names[index], *point)
+
+        return results
+
+    def _fetch_weather_many(self, points: list[tuple[float, float]], on_error=None) -> dict:
+        """Запрашивает текущую погоду для точек пачками и кэширует ответы.
+
+        Args:
+            points (list[tuple[float, float]]): Различные пары (широта, долгота).
+            on_error (Callable[[list, Exception], None] | None): Вызывается с точками
+                пачки, запрос которой не удался; без него ошибка пробрасывается.
+
+        Returns:
+            dict: Данные о погоде по парам (широта, долгота) успешных пачек.
+        """
+        params = {'current_weather': 'true', 'timezone': 'auto', 'forecast_days': 1}
+        fetched = {}
+        for point, location in self._fetch_many(points, params, "погоды", on_error):
+            weather_data = self._parse_current_weather(location, None)
+            self._store_weather(*point, weather_data)
+            fetched[point] = weather_data
+        return fetched
+
+    def _fetch_many(self, points: list[tuple[float, float]], params: dict, what: str,
+                    on_error=None):
+        """Запрашивает API прогноза для точек пачками по max_locations_per_request.
+
+        Args:
+            points (list[tuple[float, float]]): Различные пары (широта, долгота).
+            params (dict): Параметры запроса, кроме координат.
+            what (str): Что запрашивается — для текста ошибки ("погоды", "прогноза").
+            on_error (Callable[[list, Exception], None] | None): Вызывается с точками
+                пачки, запрос которой не удался, после чего запрос продолжается
+                со следующей пачки; без него ошибка пробрасывается.
+
+        Yields:
+            tuple[tuple[float, float], dict]: Точка и относящаяся к ней часть ответа.
+
+        Raises:
+            Exception: При сетевых ошибках или ответе с другим числом точек.
+        """
+        for start in range(0, len(points), self.max_locations_per_request):
+            chunk = points[start:start + self.max_locations_per_request]
+            chunk_params = {
+                'latitude': ','.join(str(latitude) for latitude, _ in chunk),
+                'longitude': ','.join(str(longitude) for _, longitude in chunk),
+                **params
+            }
+
+            try:
+                data = self._request(self.base_url, chunk_params)
+            except requests.RequestException as e:
+                error = Exception(f"Ошибка при получении {what}: {e}")
+            else:
+                # Для одной точки API возвращает объект, для нескольких — список
+                locations = data if isinstance(data, list) else [data]
+                if len(locations) == len(chunk):
+                    yield from zip(chunk, locations)
+                    continue
+                error = Exception(f"Ошибка при получении {what}: число точек в ответе не совпадает с запросом")
+            if on_error is None:
+                raise error
+            on_error(chunk, error)
+
+    def get_forecast(self, latitude: float, longitude: float, days: int = 7,
+                     variables=HOURLY_VARIABLES, city_name: str | None = None) -> ForecastSeries:
+        """Получает почасовой прогноз для одной точки.
+
+        Args:
+            latitude (float): Широта.
+            longitude (float): Долгота.
+            days (int): Число дней прогноза (1–16).
+            variables (Sequence[str]): Почасовые переменные Open-Meteo.
+            city_name (str | None): Название места для отображения.
+
+        Returns:
+            ForecastSeries: Ряд прогноза.
+
+        Raises:
+            Exception: При сетевых ошибках или проблемах с API.
+        """
+        return self.get_forecast_many([(latitude, longitude)], days, variables, [city_name])[0]
+
+    def get_forecast_many(self, coords, days: int = 7, variables=HOURLY_VARIABLES,
+                          city_names=None) -> list[ForecastSeries]:
+        """Получает почасовой прогноз для нескольких точек.
+
+        Как и get_weather_many, берёт попадания из кэша, а промахи
+        запрашивает пачками по max_locations_per_request точек. В кэше
+        ряды хранятся в упакованном виде (массивы в base64).
+
+        Returns:
+            list[ForecastSeries]: Ряды в порядке входных координат.
+
+        Raises:
+            Exception: При сетевых ошибках или проблемах с API.
+        """
+        variables = tuple(variables)
+        if city_names is None:
+            city_names = [None] * len(coords)
+
+        def cache_key(latitude, longitude):
+            return f"forecast_{latitude}_{longitude}_{days}_{','.join(variables)}"
+
+        results = [None] * len(coords)
+        misses = {}
+        for index, (latitude, longitude) in enumerate(coords):
+            cached = self.cache.get(cache_key(latitude, longitude))
+            if cached:
+                results[index] = ForecastSeries.from_cache(cached, city_names[index])
+            else:
+                misses.setdefault((latitude, longitude), []).append(index)
+
+        params = {'hourly': ','.join(variables), 'forecast_days': days,
+                  'timezone': 'auto', 'timeformat': 'unixtime'}
+        for (latitude, longitude), location in self._fetch_many(list(misses), params, "прогноза"):
+            series = ForecastSeries.from_response(location, variables)
+            self.cache.set(cache_key(latitude, longitude), series.to_cache())
+            for index in misses[(latitude, longitude)]:
+                results[index] = ForecastSeries(series.times, series.columns,
+                                                series.utc_offset, city_names[index])
+
+        return results
+
+    def get_archive(self, latitude: float, longitude: float, start_date, end_date,
+                    variables=ARCHIVE_VARIABLES) -> dict:
+        """Получает почасовые архивные данные за интервал дат.
+
+        Ответ не кэшируется: архив загружается в базу истории.
+
+        Args:
+            latitude (float): Широта.
+            longitude (float): Долгота.
+            start_date (date): Первый день (включительно).
+            end_date (date): Последний день (включительно).
+            variables (Sequence[str]): Почасовые переменные.
+
+        Returns:
+            dict: Ответ API с ключами hourly (time — местное время ISO
+                  и по списку значений на переменную) и utc_offset_seconds.
+
+        Raises:
+            Exception: При сетевых ошибках или проблемах с API.
+        """
+        params = {
+            'latitude': latitude,
+            'longitude': longitude,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'hourly': ','.join(variables),
+            'timezone': 'auto'
+        }
+        try:
+            return self._request(self.archive_url, params, 'http.archive')
+        except requests.RequestException as e:
+            raise Exception(f"Ошибка при получении архива погоды: {e}")
+
+    def _weather_cache_key(self, latitude: float, longitude: float) -> str:
+        """Возвращает ключ кэша погоды: по точным координатам или по ячейке сетки."""
+        if self.grid_resolution is None:
+            return f"weather_{latitude}_{longitude}"
+        return self._grid_cache_key(*self._grid_cell(latitude, longitude))
+
+    def _grid_cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        """Возвращает индексы ячейки сетки для точки."""
+        row, col = grid_cell(latitude, longitude, self.grid_resolution)
+        return row, wrap_cell_col(col, self.grid_resolution)
+
+    def _grid_space(self) -> str:
+        """Возвращает пространство ячеек сетки в кэше (общий префикс их ключей)."""
+        return f"weather_grid_{self.grid_resolution}"
+
+    def _grid_cache_key(self, row: int, col: int) -> str:
+        """Возвращает ключ кэша погоды для ячейки сетки."""
+        return f"{self._grid_space()}_{row}_{col}"
+
+    def _store_weather(self, latitude: float, longitude: float, weather_data: dict):
+        """Кэширует погоду для точки; в режиме сетки ячейка попадает в индекс ячеек кэша."""
+        if self.grid_resolution is None:
+            self.cache.set(self._weather_cache_key(latitude, longitude), weather_data)
+            return
+        row, col = self._grid_cell(latitude, longitude)
+        self.cache.set(self._grid_cache_key(row, col), weather_data, cell=(self._grid_space(), row, col))
+
+    def _get_cached_weather(self, latitude: float, longitude: float):
+        """Ищет в кэше свежие данные о погоде для точки.
+
+        В режиме сетки с grid_tolerance_km заполненные ячейки в радиусе
+        находятся одним запросом к индексу ячеек кэша, и берётся ближайшая
+        (своя — в первую очередь). Весь поиск учитывается в статистике
+        кэша как одно попадание или один промах.
+        """
+        if self.grid_resolution is None or self.grid_tolerance_km <= 0:
+            return self.cache.get(self._weather_cache_key(latitude, longitude))
+        own = self._grid_cell(latitude, longitude)
+        rows, col_ranges = cell_ranges(latitude, longitude, self.grid_resolution, self.grid_tolerance_km)
+        candidates = []
+        for row, col, key in self.cache.find_cells(self._grid_space(), rows, col_ranges):
+            if (row, col) == own:
+                distance = 0.0
+            else:
+                distance = haversine_km(latitude, longitude, *cell_center(row, col, self.grid_resolution))
+            if distance <= self.grid_tolerance_km:
+                candidates.append((distance, key))
+        return self.cache.get_first(key for _, key in sorted(candidates))
+
+    def _request(self, url: str, params: dict, stage: str = 'http.forecast'):
+        """Выполняет GET-запрос через сессию и возвращает разобранный JSON.
+
+        Args:
+            url (str): Адрес API.
+            params (dict): Параметры запроса.
+            stage (str): Имя этапа в метриках.
+
+        Raises:
+            requests.RequestException: При сетевых ошибках, таймаутах
+                                       или ответе с кодом ошибки.
+        """
+        with metrics.timer(stage):
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException:
+                metrics.incr('http.errors')
+                raise
+            finally:
+                metrics.incr('http.requests')
+            if metrics.is_enabled():
+                metrics.incr('http.bytes', len(response.content))
+            return response.json()
+
+    @staticmethod
+    def _located(data: dict, city_name: str | None, latitude: float, longitude: float) -> dict:
+        """Дополняет данные о погоде названием и запрошенными координатами.
+
+        Координаты берутся из запроса, а не из ответа API (он возвращает
+        ближайший узел своей сетки), поэтому совпадают с геокодированным
+        местом и не зависят от того, из какой записи кэша взяты данные.
+        """
+        return dict(data, city=city_name, latitude=latitude, longitude=longitude)
+
+    @staticmethod
+    def _parse_current_weather(data: dict, city_name: str | None) -> dict:
+        """Извлекает текущую погоду из ответа API для одной точки."""
+        return {
+            'temperature': data['current_weather']['temperature'],
+            'windspeed': data['current_weather']['windspeed'],
+            'winddirection': data['current_weather']['winddirection'],
+            'weathercode': data['current_weather']['weathercode'],
+            'time': data['current_weather']['time'],
+            'city': city_name
+        }
+
     def get_weather_by_city(self, city_name: str):
         """Получает погоду по названию города.
 
@@ -146,28 +666,3 @@ class WeatherAPI:
             raise ValueError("Неверные координаты. Широта: -90..90, Долгота: -180..180")
 
         return self.get_weather(latitude, longitude)
-
-
-def get_weather_description(weathercode: int) -> str:
-    """Преобразует числовой код погоды Open-Meteo в человекочитаемое описание.
-
-    Args:
-        weathercode (int): Код погоды по классификации WMO.
-
-    Returns:
-        str: Описание погоды на русском языке или "Неизвестно".
-    """
-    weather_codes = {
-        0: "Ясно", 1: "Преимущественно ясно", 2: "Переменная облачность", 3: "Пасмурно",
-        45: "Туман", 48: "Туман с инеем",
-        51: "Лёгкая морось", 53: "Умеренная морось", 55: "Сильная морось",
-        56: "Лёгкая ледяная морось", 57: "Сильная ледяная морось",
-        61: "Небольшой дождь", 63: "Умеренный дождь", 65: "Сильный дождь",
-        66: "Лёдный дождь (слабый)", 67: "Лёдный дождь (сильный)",
-        71: "Небольшой снег", 73: "Умеренный снег", 75: "Сильный снег",
-        77: "Снежные зёрна",
-        80: "Небольшие ливни", 81: "Умеренные ливни", 82: "Сильные ливни",
-        85: "Небольшие снежные ливни", 86: "Сильные снежные ливни",
-        95: "Гроза", 96: "Гроза с небольшим градом", 99: "Гроза с сильным градом"
-    }
-    return weather_codes.get(weathercode, "Неизвестно")
\ No newline at end of file
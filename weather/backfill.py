@@ -0,0 +1,159 @@
+"""Модуль загрузки архива погоды в базу истории.
+
+Интервал дат делится на куски по chunk_days дней, выровненные по общей
+сетке (границы не зависят от начала интервала), куски загружаются
+параллельно пулом потоков ограниченного размера. Полученные часы
+вставляются в history большими транзакциями вместе с отметками
+о загруженных кусках (таблица backfill_progress): повторный запуск
+пропускает готовые куски, а повторяющиеся записи не дублируются.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from weather.codes import get_weather_description
+from weather.database import get_backfill_done, save_archive_rows
+
+DEFAULT_CHUNK_DAYS = 90
+DEFAULT_WORKERS = 4
+# Сколько записей накапливать перед записью в базу одной транзакцией
+DEFAULT_BATCH_ROWS = 50_000
+# Архив заполняется с задержкой: более свежие куски загружаются, но не отмечаются
+# как готовые, чтобы следующий запуск дозагрузил появившиеся часы
+ARCHIVE_DELAY_DAYS = 5
+
+
+def split_range(start: date, end: date, chunk_days: int = DEFAULT_CHUNK_DAYS) -> list[tuple[date, date]]:
+    """Делит интервал дат на куски не длиннее chunk_days дней.
+
+    Границы кусков кратны chunk_days от начала календаря, поэтому два
+    пересекающихся интервала делятся одинаково и загруженные куски
+    одного запуска совпадают с кусками другого.
+
+    Args:
+        start (date): Первый день (включительно).
+        end (date): Последний день (включительно).
+        chunk_days (int): Длина куска в днях.
+
+    Returns:
+        list[tuple[date, date]]: Пары (первый день, последний день).
+
+    Raises:
+        ValueError: Если интервал пуст или длина куска не положительна.
+    """
+    if chunk_days <= 0:
+        raise ValueError("Длина куска должна быть положительной")
+    if end < start:
+        raise ValueError(f"Конец интервала {end} раньше начала {start}")
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        grid_end = date.fromordinal((chunk_start.toordinal() // chunk_days + 1) * chunk_days - 1)
+        chunk_end = min(grid_end, end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def archive_rows(city: str, data: dict, latitude: float | None = None,
+                 longitude: float | None = None) -> list[tuple]:
+    """Преобразует ответ архива в строки для save_archive_rows.
+
+    Часы без температуры (архив ещё не заполнен) пропускаются. Записям
+    присваиваются координаты места из запроса, а не узла сетки архива.
+    """
+    hourly = data['hourly']
+    descriptions = {}
+    rows = []
+    for timestamp, temperature, windspeed, winddirection, code in zip(
+            hourly['time'], hourly['temperature_2m'], hourly['windspeed_10m'],
+            hourly['winddirection_10m'], hourly['weathercode']):
+        if temperature is None:
+            continue
+        if code not in descriptions:
+            descriptions[code] = None if code is None else get_weather_description(code)
+        rows.append((timestamp, city, temperature, windspeed,
+                     None if winddirection is None else round(winddirection),
+                     code, descriptions[code], latitude, longitude))
+    return rows
+
+
+def backfill(api, locations, start: date, end: date, chunk_days: int = DEFAULT_CHUNK_DAYS,
+             workers: int = DEFAULT_WORKERS, batch_rows: int = DEFAULT_BATCH_ROWS,
+             on_progress=None) -> dict:
+    """Загружает архив погоды для мест за интервал дат.
+
+    Args:
+        api (WeatherAPI): Клиент API (используется get_archive).
+        locations (list[tuple[str, float, float]]): Название места (как в
+            истории), широта и долгота.
+        start (date): Первый день (включительно).
+        end (date): Последний день (включительно).
+        chunk_days (int): Длина куска в днях.
+        workers (int): Максимальное число одновременных запросов.
+        batch_rows (int): Сколько записей накапливать перед записью в базу.
+        on_progress (Callable[[dict], None] | None): Вызывается после каждой
+            записи в базу с текущим итогом.
+
+    Returns:
+        dict: Итог с ключами chunks (всего), skipped (уже были загружены),
+              done, failed, rows (получено), inserted (добавлено новых)
+              и errors (список текстов ошибок).
+    """
+    chunks = split_range(start, end, chunk_days)
+    summary = {'chunks': len(chunks) * len(locations), 'skipped': 0, 'done': 0, 'failed': 0,
+               'rows': 0, 'inserted': 0, 'errors': []}
+
+    tasks = []
+    for city, latitude, longitude in locations:
+        done = get_backfill_done(city)
+        for chunk_start, chunk_end in chunks:
+            if (chunk_start.isoformat(), chunk_end.isoformat()) in done:
+                summary['skipped'] += 1
+            else:
+                tasks.append((city, latitude, longitude, chunk_start, chunk_end))
+
+    settled = date.today() - timedelta(days=ARCHIVE_DELAY_DAYS)
+    pending_rows, pending_chunks = [], []
+    pending_count = 0
+
+    def flush():
+        nonlocal pending_count
+        if not pending_count:
+            return
+        summary['inserted'] += save_archive_rows(pending_rows, pending_chunks)
+        summary['done'] += pending_count
+        pending_rows.clear()
+        pending_chunks.clear()
+        pending_count = 0
+        if on_progress is not None:
+            on_progress(dict(summary))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {}
+        for task in tasks:
+            _, latitude, longitude, chunk_start, chunk_end = task
+            futures[executor.submit(api.get_archive, latitude, longitude, chunk_start, chunk_end)] = task
+        try:
+            for future in as_completed(futures):
+                city, latitude, longitude, chunk_start, chunk_end = futures[future]
+                try:
+                    rows = archive_rows(city, future.result(), latitude, longitude)
+                except Exception as e:
+                    summary['failed'] += 1
+                    summary['errors'].append(f"{city} {chunk_start}..{chunk_end}: {e}")
+                    continue
+                pending_rows.extend(rows)
+                pending_count += 1
+                if chunk_end < settled:
+                    pending_chunks.append((city, chunk_start.isoformat(), chunk_end.isoformat(),
+                                           latitude, longitude, len(rows)))
+                summary['rows'] += len(rows)
+                if len(pending_rows) >= batch_rows:
+                    flush()
+        finally:
+            # При прерывании не ждём оставшиеся запросы, но сохраняем полученное
+            for future in futures:
+                future.cancel()
+            flush()
+    return summary
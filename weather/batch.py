@@ -0,0 +1,104 @@
+"""Модуль пакетного получения погоды для множества городов.
+
+Содержит функции чтения списка городов и параллельного получения погоды
+через пул потоков ограниченного размера. Ошибка по одному городу
+не прерывает обработку остальных.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WORKERS = 8
+
+
+def read_cities(stream) -> list[str]:
+    """Читает названия городов из текстового потока — по одному на строку.
+
+    Пустые строки и строки, начинающиеся с '#', пропускаются.
+
+    Args:
+        stream: Итерируемый текстовый поток (файл или sys.stdin).
+
+    Returns:
+        list[str]: Названия городов в исходном порядке.
+    """
+    cities = []
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            cities.append(line)
+    return cities
+
+
+def iter_weather_batch(api, cities: list[str], workers: int = DEFAULT_WORKERS):
+    """Параллельно получает погоду для списка городов.
+
+    Сначала параллельно определяются координаты всех городов, затем
+    погода запрашивается пачками через WeatherAPI.get_weather_many —
+    по одному HTTP-запросу на пачку точек. Результаты выдаются по мере
+    готовности, а не в порядке ввода.
+
+    Args:
+        api (WeatherAPI): Клиент API.
+        cities (list[str]): Названия городов.
+        workers (int): Максимальное число одновременных запросов.
+
+    Yields:
+        tuple[int, str, dict | None, Exception | None]: Индекс города во входном
+            списке, название, данные о погоде (или None) и ошибка (или None).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(api.get_coordinates, city): (index, city)
+            for index, city in enumerate(cities)
+        }
+        resolved = []
+        for future in as_completed(futures):
+            index, city = futures[future]
+            try:
+                coords = future.result()
+            except Exception as e:
+                yield index, city, None, e
+                continue
+            if not coords:
+                yield index, city, None, Exception(f"Город '{city}' не найден")
+                continue
+            resolved.append((index, city, coords))
+
+        chunk_size = api.max_locations_per_request
+        futures = {}
+        for start in range(0, len(resolved), chunk_size):
+            chunk = resolved[start:start + chunk_size]
+            future = executor.submit(
+                api.get_weather_many,
+                [(coords['latitude'], coords['longitude']) for _, _, coords in chunk],
+                [f"{coords['name']}, {coords['country']}" for _, _, coords in chunk]
+            )
+            futures[future] = chunk
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                weather_list = future.result()
+            except Exception as e:
+                for index, city, _ in chunk:
+                    yield index, city, None, e
+                continue
+            for (index, city, _), weather_data in zip(chunk, weather_list):
+                yield index, city, weather_data, None
+
+
+def fetch_weather_batch(api, cities: list[str], workers: int = DEFAULT_WORKERS):
+    """Получает погоду для списка городов и возвращает результаты в порядке ввода.
+
+    Args:
+        api (WeatherAPI): Клиент API.
+        cities (list[str]): Названия городов.
+        workers (int): Максимальное число одновременных запросов.
+
+    Returns:
+        list[tuple[str, dict | None, Exception | None]]: Для каждого города —
+            название, данные о погоде и ошибка (одно из двух равно None).
+    """
+    results = [None] * len(cities)
+    for index, city, weather_data, error in iter_weather_batch(api, cities, workers):
+        results[index] = (city, weather_data, error)
+    return results
@@ -1,71 +1,478 @@
-"""Модуль кэширования данных о погоде на диск в JSON-файл.
+"""Модуль кэширования данных о погоде на диск в базе SQLite.
 
-Кэш имеет TTL (время жизни) — по умолчанию 1 час.
+Кэш имеет TTL (время жизни) — по умолчанию 1 час. Записи хранятся в таблице
+с первичным ключом, поэтому чтение и запись по ключу не зависят от размера
+кэша. База работает в режиме WAL: каждая запись атомарна, а несколько
+процессов могут безопасно работать с одним файлом. Старый JSON-кэш
+(weather_cache.json) импортируется при первом использовании.
+
+Перед базой стоит ограниченный по размеру LRU-кэш в памяти процесса, так что
+повторные обращения к «горячим» ключам не идут на диск. Размер базы тоже
+ограничен: периодическое уплотнение удаляет просроченные и самые старые
+записи и возвращает освободившееся место файловой системе.
+
+Время жизни задаётся отдельно для каждого пространства ключей (coords_,
+weather_ и т. д.). После истечения TTL запись ещё какое-то время хранится:
+в окне stale_while_revalidate её можно сразу отдать, запустив обновление
+в фоне, а в окне stale_if_error — отдать, если источник недоступен.
 """
 
 import json
 import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from . import metrics
+
+# Политики по пространствам ключей (префиксам). Координаты городов меняются
+# крайне редко, а текущая погода в Open-Meteo обновляется раз в 15 минут.
+DEFAULT_POLICIES = {
+    'coords_': {
+        'ttl': timedelta(days=30),
+        'stale_while_revalidate': timedelta(days=335),
+        'stale_if_error': timedelta(days=335),
+    },
+    'weather_': {
+        'ttl': timedelta(minutes=15),
+        'stale_while_revalidate': timedelta(minutes=45),
+        'stale_if_error': timedelta(hours=6),
+    },
+    'forecast_': {
+        'ttl': timedelta(hours=1),
+        'stale_while_revalidate': timedelta(hours=2),
+        'stale_if_error': timedelta(hours=12),
+    },
+}
+
 
 class WeatherCache:
     """Кэш погоды с хранением на диске и автоматической очисткой устаревших записей."""
 
-    def __init__(self, cache_file: str = 'weather_cache.json', ttl_hours: int = 1):
+    def __init__(self, cache_file: str = 'weather_cache.db', ttl_hours: int = 1,
+                 legacy_file: str | None = 'weather_cache.json',
+                 memory_entries: int = 1024, memory_bytes: int = 8 * 1024 * 1024,
+                 max_entries: int = 100_000, max_bytes: int = 64 * 1024 * 1024,
+                 compact_every: int = 500, policies: dict[str, dict] | None = None):
         """Инициализирует кэш.
 
         Args:
-            cache_file (str): Путь к файлу кэша.
-            ttl_hours (int): Время жизни записи в часах.
+            cache_file (str): Путь к файлу базы кэша.
+            ttl_hours (int): Время жизни записи в часах для ключей, не попавших
+                             ни в одно пространство из policies.
+            legacy_file (str | None): JSON-файл старого формата для однократного
+                                      импорта; None — не импортировать.
+            memory_entries (int): Максимум записей в памяти (0 — без кэша в памяти).
+            memory_bytes (int): Максимальный суммарный размер записей в памяти (байты UTF-8).
+            max_entries (int): Максимум записей в базе на диске.
+            max_bytes (int): Максимальный суммарный размер данных в базе.
+            compact_every (int): Через сколько записей запускать уплотнение базы.
+            policies (dict[str, dict] | None): Политики по префиксам ключей:
+                {'ttl', 'stale_while_revalidate', 'stale_if_error'} (timedelta);
+                по умолчанию DEFAULT_POLICIES.
         """
         self.cache_file = cache_file
         self.ttl = timedelta(hours=ttl_hours)
-        self._ensure_cache_file()
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self._default_policy = {'ttl': self.ttl, 'stale_while_revalidate': timedelta(0),
+                                'stale_if_error': timedelta(0)}
+        self.legacy_file = legacy_file
+        self.memory_entries = memory_entries
+        self.memory_bytes = memory_bytes
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._sets_since_compact = 0
+        self._stats = {
+            'hits': 0, 'memory_hits': 0, 'stale_hits': 0, 'misses': 0, 'expired': 0,
+            'sets': 0, 'memory_evictions': 0, 'disk_evictions': 0, 'compactions': 0
+        }
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._import_legacy_json()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает базу кэша в режиме WAL и создаёт таблицы, если их нет."""
+        conn = sqlite3.connect(self.cache_file, timeout=10, isolation_level=None,
+                               check_same_thread=False)
+        # Действует только для новой базы: позволяет возвращать место по частям
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                data TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_timestamp ON cache (timestamp)")
+        # Заполненные ячейки сетки: поиск соседей идёт диапазоном по (space, row, col)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cells (
+                space TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                col INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (space, row, col)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        return conn
+
+    def _import_legacy_json(self):
+        """Однократно переносит записи из JSON-кэша старого формата."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE name = 'legacy_imported'").fetchone():
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой процесс мог успеть импортировать, пока мы ждали блокировку
+                if not self._conn.execute("SELECT 1 FROM meta WHERE name = 'legacy_imported'").fetchone():
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO cache (key, timestamp, data) VALUES (?, ?, ?)",
+                        self._read_legacy_entries()
+                    )
+                    self._conn.execute("INSERT INTO meta (name, value) VALUES ('legacy_imported', ?)",
+                                       (datetime.now().isoformat(),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _read_legacy_entries(self) -> list[tuple[str, float, str]]:
+        """Читает записи JSON-кэша в виде строк (key, timestamp, data)."""
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return []
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            return [
+                (key, datetime.fromisoformat(entry['timestamp']).timestamp(),
+                 json.dumps(entry['data'], ensure_ascii=False))
+                for key, entry in legacy.items()
+            ]
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError, OSError) as e:
+            print(f"Ошибка импорта старого кэша: {e}", file=sys.stderr)
+            return []
+
+    def policy_for(self, key: str) -> dict:
+        """Возвращает политику времени жизни для ключа по его префиксу."""
+        for prefix, policy in self.policies.items():
+            if key.startswith(prefix):
+                return policy
+        return self._default_policy
 
-    def _ensure_cache_file(self):
-        """Создаёт пустой файл кэша, если его нет."""
-        if not os.path.exists(self.cache_file):
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump({}, f, ensure_ascii=False)
+    @staticmethod
+    def _retention(policy: dict) -> timedelta:
+        """Возвращает, сколько всего хранится запись с данной политикой."""
+        return policy['ttl'] + max(policy['stale_while_revalidate'], policy['stale_if_error'])
+
+    def _lookup(self, key: str, policy: dict):
+        """Читает запись из памяти или с диска (под блокировкой).
+
+        Устаревшая запись из памяти перечитывается с диска: её мог
+        обновить другой процесс.
+
+        Returns:
+            tuple[float, str, bool] | None: Метка времени, JSON-данные
+                и признак попадания в память.
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            if time.time() - entry[0] < policy['ttl'].total_seconds():
+                self._memory.move_to_end(key)
+                return entry[0], entry[1], True
+        row = self._conn.execute(
+            "SELECT timestamp, data FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._memory_discard(key)
+            return None
+        self._memory_put(key, row[0], row[1])
+        return row[0], row[1], False
 
     def get(self, key: str):
         """Получает данные из кэша по ключу, если они не устарели.
 
+        Сначала проверяется кэш в памяти, затем база на диске.
+
         Returns:
             Any | None: Данные или None, если кэш пустой/просрочен.
         """
-        # ... (код без изменений, только докстринг выше)
+        entry = self.get_entry(key, count_stale=False)
+        return entry['data'] if entry is not None and entry['fresh'] else None
+
+    @metrics.timed('cache.get')
+    def get_entry(self, key: str, count_stale: bool = True) -> dict | None:
+        """Получает запись вместе со сведениями о её свежести.
+
+        Args:
+            key (str): Ключ кэша.
+            count_stale (bool): Учитывать устаревшую запись в статистике
+                                как stale_hits (иначе — как промах).
+
+        Returns:
+            dict | None: Словарь с ключами data, age (секунды), fresh,
+                revalidate (можно отдать, обновив в фоне) и usable_on_error
+                (можно отдать при ошибке источника) или None, если записи
+                нет или она хранится дольше всех окон политики.
+        """
         try:
-            if not os.path.exists(self.cache_file):
-                return None
+            policy = self.policy_for(key)
+            with self._lock:
+                found = self._lookup(key, policy)
+                if found is None:
+                    self._count('misses')
+                    return None
 
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                cache = json.load(f)
+                cached_time, data, from_memory = found
+                age = time.time() - cached_time
+                ttl = policy['ttl'].total_seconds()
+                if age < ttl:
+                    self._count('hits', from_memory)
+                    return {'data': json.loads(data), 'age': age, 'fresh': True,
+                            'revalidate': False, 'usable_on_error': True}
 
-            if key not in cache:
-                return None
+                if age < self._retention(policy).total_seconds():
+                    self._count('stale_hits' if count_stale else 'misses')
+                    return {
+                        'data': json.loads(data), 'age': age, 'fresh': False,
+                        'revalidate': age < ttl + policy['stale_while_revalidate'].total_seconds(),
+                        'usable_on_error': age < ttl + policy['stale_if_error'].total_seconds(),
+                    }
 
-            entry = cache[key]
-            cached_time = datetime.fromisoformat(entry['timestamp'])
-            if datetime.now() - cached_time < self.ttl:
-                return entry['data']
-            else:
-                self._remove_expired()
-                return None
+                self._memory_discard(key)
+                self._count('misses')
+                self._stats['expired'] += 1
 
-        except (json.JSONDecodeError, KeyError, ValueError, OSError) as e:
-            print(f"Ошибка чтения кэша: {e}")
+            self._remove_expired()
             return None
 
-    def set(self, key: str, data):
+        except (json.JSONDecodeError, sqlite3.Error) as e:
+            print(f"Ошибка чтения кэша: {e}", file=sys.stderr)
+            return None
+
+    def _count(self, outcome: str, from_memory: bool = False):
+        """Учитывает результат чтения (hits, stale_hits, misses) в статистике и метриках.
+
+        Вызывается под блокировкой.
+        """
+        self._stats[outcome] += 1
+        metrics.incr(f'cache.{outcome}')
+        if outcome == 'hits':
+            self._stats['memory_hits'] += from_memory
+            metrics.incr('cache.memory_hits', from_memory)
+
+    @metrics.timed('cache.get')
+    def get_first(self, keys):
+        """Возвращает свежие данные первого из ключей, для которого они есть.
+
+        Весь поиск учитывается в статистике как одно попадание или один
+        промах, сколько бы ключей ни было проверено.
+
+        Args:
+            keys (Iterable[str]): Ключи в порядке предпочтения.
+
+        Returns:
+            Any | None: Данные или None, если ни для одного ключа свежих нет.
+        """
+        try:
+            with self._lock:
+                for key in keys:
+                    policy = self.policy_for(key)
+                    found = self._lookup(key, policy)
+                    if found is not None and time.time() - found[0] < policy['ttl'].total_seconds():
+                        self._count('hits', found[2])
+                        return json.loads(found[1])
+                self._count('misses')
+                return None
+        except (json.JSONDecodeError, sqlite3.Error) as e:
+            print(f"Ошибка чтения кэша: {e}", file=sys.stderr)
+            return None
+
+    def find_cells(self, space: str, rows: tuple[int, int], col_ranges) -> list[tuple[int, int, str]]:
+        """Находит ячейки сетки со свежими записями в диапазоне индексов.
+
+        Поиск идёт по первичному ключу (space, row, col), поэтому его
+        стоимость зависит от числа заполненных ячеек, а не от площади
+        диапазона. Статистику попаданий поиск не меняет.
+
+        Args:
+            space (str): Пространство сетки (префикс ключей её ячеек).
+            rows (tuple[int, int]): Диапазон строк (включительно).
+            col_ranges (Iterable[tuple[int, int]]): Диапазоны столбцов (включительно).
+
+        Returns:
+            list[tuple[int, int, str]]: Строка, столбец и ключ кэша ячеек.
+        """
+        fresh_since = time.time() - self.policy_for(space)['ttl'].total_seconds()
+        found = []
+        try:
+            with self._lock:
+                for min_col, max_col in col_ranges:
+                    found += self._conn.execute("""
+                        SELECT cells.row, cells.col, cells.key
+                        FROM cells JOIN cache ON cache.key = cells.key
+                        WHERE cells.space = ? AND cells.row BETWEEN ? AND ?
+                          AND cells.col BETWEEN ? AND ? AND cache.timestamp >= ?
+                    """, (space, *rows, min_col, max_col, fresh_since)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Ошибка чтения кэша: {e}", file=sys.stderr)
+        return found
+
+    @metrics.timed('cache.set')
+    def set(self, key: str, data, cell: tuple[str, int, int] | None = None):
         """Сохраняет данные в кэш с текущей меткой времени.
 
         Args:
             key (str): Ключ кэша.
             data (Any): Данные (должны быть JSON-serializable).
+            cell (tuple[str, int, int] | None): Пространство, строка и столбец
+                ячейки сетки, к которой относится запись (для find_cells).
         """
-        # ... код без изменений
+        try:
+            payload = json.dumps(data, ensure_ascii=False)
+            now = time.time()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, timestamp, data) VALUES (?, ?, ?)",
+                    (key, now, payload)
+                )
+                if cell is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cells (space, row, col, key) VALUES (?, ?, ?, ?)",
+                        (*cell, key)
+                    )
+                self._memory_put(key, now, payload)
+                self._stats['sets'] += 1
+                self._sets_since_compact += 1
+                need_compact = self.compact_every and self._sets_since_compact >= self.compact_every
+            if need_compact:
+                self.compact()
+        except (TypeError, ValueError, sqlite3.Error) as e:
+            print(f"Ошибка записи кэша: {e}", file=sys.stderr)
+
+    def _memory_put(self, key: str, timestamp: float, payload: str):
+        """Кладёт запись в LRU-кэш в памяти, вытесняя самые давние при переполнении.
+
+        Размер записи считается в байтах UTF-8, а не в символах:
+        кириллица занимает по два байта на символ.
+        """
+        size = len(payload.encode('utf-8'))
+        if self.memory_entries <= 0 or size > self.memory_bytes:
+            return
+        self._memory_discard(key)
+        self._memory[key] = (timestamp, payload, size)
+        self._memory_size += size
+        while len(self._memory) > self.memory_entries or self._memory_size > self.memory_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_size -= evicted_size
+            self._stats['memory_evictions'] += 1
+
+    def _memory_discard(self, key: str):
+        """Удаляет запись из кэша в памяти, если она там есть."""
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= entry[2]
+
+    def _memory_prune(self):
+        """Удаляет из памяти записи, которых больше нет в базе (под блокировкой).
+
+        Вызывается после удаления записей из базы, чтобы память не отдавала
+        уже удалённые данные и stats() сообщал её действительный размер.
+        """
+        keys = list(self._memory)
+        present = set()
+        # Не больше 500 параметров в запросе — ниже лимита старых версий SQLite
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            present.update(row[0] for row in self._conn.execute(
+                f"SELECT key FROM cache WHERE key IN ({placeholders})", chunk))
+        for key in keys:
+            if key not in present:
+                self._memory_discard(key)
 
     def _remove_expired(self):
-        """Удаляет все просроченные записи из кэша."""
-        # ... код без изменений
\ No newline at end of file
+        """Удаляет все просроченные записи из кэша.
+
+        Для каждого пространства ключей учитывается его срок хранения;
+        условие по диапазону ключей позволяет использовать индексы.
+        """
+        now = time.time()
+        with self._lock:
+            outside = []
+            params = []
+            for prefix, policy in self.policies.items():
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key >= ? AND key < ? AND timestamp < ?",
+                    (prefix, upper, now - self._retention(policy).total_seconds())
+                )
+                outside.append("NOT (key >= ? AND key < ?)")
+                params += [prefix, upper]
+            condition = " AND ".join(["timestamp < ?", *outside])
+            self._conn.execute(f"DELETE FROM cache WHERE {condition}",
+                               [now - self._retention(self._default_policy).total_seconds(), *params])
+            self._memory_prune()
+
+    def compact(self):
+        """Уплотняет базу: удаляет просроченные записи и соблюдает лимиты размера.
+
+        При превышении max_entries или max_bytes вытесняются записи,
+        которые дольше всего не обновлялись. Освободившиеся страницы
+        возвращаются файловой системе без полного VACUUM.
+        """
+        self._remove_expired()
+        with self._lock:
+            cursor = self._conn.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key,
+                               ROW_NUMBER() OVER w AS position,
+                               SUM(length(CAST(data AS BLOB))) OVER w AS total_bytes
+                        FROM cache
+                        WINDOW w AS (ORDER BY timestamp DESC, key)
+                    )
+                    WHERE position > ? OR total_bytes > ?
+                )
+            """, (self.max_entries, self.max_bytes))
+            self._stats['disk_evictions'] += max(cursor.rowcount, 0)
+            self._conn.execute("DELETE FROM cells WHERE key NOT IN (SELECT key FROM cache)")
+            self._memory_prune()
+            self._stats['compactions'] += 1
+            self._sets_since_compact = 0
+            # Каждый шаг incremental_vacuum освобождает одну страницу
+            self._conn.execute("PRAGMA incremental_vacuum").fetchall()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> dict:
+        """Возвращает счётчики попаданий, промахов и вытеснений.
+
+        Returns:
+            dict: Счётчики, доля попаданий (hit_ratio) и текущий размер
+                  кэша в памяти (memory_entries, memory_bytes).
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        """Закрывает соединение с базой кэша."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,54 @@
+"""Модуль тонкого клиента фонового сервера погоды.
+
+Намеренно использует только стандартную библиотеку, чтобы обращение
+к уже запущенному серверу не требовало загрузки HTTP-стека и базы.
+"""
+
+import http.client
+import json
+import os
+from urllib.parse import urlencode
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Подключение к локальному серверу либо мгновенное, либо сервера нет
+CONNECT_TIMEOUT = 0.2
+REQUEST_TIMEOUT = 30
+
+
+def daemon_address() -> tuple[str, int]:
+    """Возвращает адрес сервера из переменной WEATHER_DAEMON ("host:port")."""
+    value = os.environ.get('WEATHER_DAEMON', '')
+    host, _, port = value.rpartition(':')
+    if port.isdigit():
+        return host or DEFAULT_HOST, int(port)
+    return DEFAULT_HOST, DEFAULT_PORT
+
+
+def request_daemon(path: str, params: dict | None = None, address: tuple[str, int] | None = None):
+    """Отправляет запрос фоновому серверу.
+
+    Args:
+        path (str): Путь, например "/weather".
+        params (dict | None): Параметры строки запроса.
+        address (tuple[str, int] | None): Адрес сервера; по умолчанию daemon_address().
+
+    Returns:
+        dict | None: Разобранный JSON-ответ или None, если сервер не запущен.
+    """
+    host, port = address or daemon_address()
+    url = path + ('?' + urlencode(params) if params else '')
+    conn = http.client.HTTPConnection(host, port, timeout=CONNECT_TIMEOUT)
+    try:
+        conn.connect()
+    except OSError:
+        conn.close()
+        return None
+    try:
+        conn.sock.settimeout(REQUEST_TIMEOUT)
+        conn.request('GET', url)
+        return json.loads(conn.getresponse().read().decode('utf-8'))
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+    finally:
+        conn.close()
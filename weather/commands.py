@@ -1,15 +1,53 @@
-"""Модуль обработки команд приложения."""
+"""Модуль обработки команд приложения.
 
-from weather.api import WeatherAPI, get_weather_description
-from weather.database import save_request, get_history
+Тяжёлые модули (HTTP-клиент, SQLite, справочник городов) импортируются
+внутри команд, которым они нужны, чтобы --help, история и запросы
+к фоновому серверу запускались быстро.
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from weather import metrics
+from weather.client import daemon_address, request_daemon
+from weather.codes import get_weather_description
 
 
 def get_weather_command(args):
     """Выполняет команду получения погоды или выводит историю."""
-    api = WeatherAPI()
+    # --- Построение локального справочника городов ---
+    if getattr(args, 'build_gazetteer', None):
+        from weather.gazetteer import build_gazetteer
+
+        source, target = args.build_gazetteer
+        try:
+            records, keys = build_gazetteer(source, target,
+                                            alternate_names_path=getattr(args, 'alternate_names', None))
+        except (OSError, ValueError) as e:
+            return f"Ошибка построения справочника: {e}"
+        return f"Справочник сохранён в {target}: {records} городов, {keys} названий."
+
+    # --- Фоновый сервер ---
+    if getattr(args, 'serve', False):
+        return serve_command(args)
+
+    # --- Загрузка архива погоды ---
+    if getattr(args, 'backfill', None):
+        return backfill_command(args)
+
+    # --- Прогрев кэша по истории ---
+    if getattr(args, 'prefetch', None):
+        return prefetch_command(args)
+
+    # --- Поиск по истории вокруг точки и в области ---
+    if any(getattr(args, name, None) for name in ('near', 'bbox', 'nearest')):
+        return spatial_history_command(args)
 
     # --- Новая команда: история ---
     if getattr(args, 'history', False):
+        from weather.database import get_history
+
         history = get_history(10)
         if not history:
             return "История запросов пуста."
@@ -21,6 +59,47 @@ def get_weather_command(args):
         lines.append("=" * 60)
         return "\n".join(lines)
 
+    # --- Почасовой прогноз ---
+    if getattr(args, 'forecast', None) is not None:
+        return forecast_command(args)
+
+    # --- Статистика по истории ---
+    if getattr(args, 'stats', None):
+        return get_stats_command(args)
+
+    # --- Сжатие старой истории ---
+    if getattr(args, 'compact_history', False):
+        return compact_history_command(args)
+
+    # --- Выгрузка истории ---
+    if getattr(args, 'export', None):
+        return export_history_command(args)
+
+    # --- Непрерывное обновление набора мест ---
+    if getattr(args, 'watch', False):
+        return watch_command(args)
+
+    fmt = getattr(args, 'format', 'text')
+
+    # --- Запрос через запущенный фоновый сервер ---
+    if (args.city or args.coords) and use_daemon(args):
+        response = query_daemon(args)
+        if response is not None:
+            error = None if response.get('ok') else response.get('error')
+            if fmt != 'text':
+                return write_single_record(args, response.get('data'), error, fmt)
+            if error is not None:
+                return f"Ошибка: {error}"
+            return format_weather_output(response['data'])
+
+    api = create_api(args)
+
+    # --- Пакетный запрос для нескольких городов ---
+    if getattr(args, 'cities', None) or getattr(args, 'cities_file', None):
+        if fmt != 'text':
+            return stream_batch_weather_command(api, args, fmt)
+        return get_batch_weather_command(api, args)
+
     # --- Обычный запрос погоды ---
     try:
         if args.city:
@@ -28,17 +107,455 @@ def get_weather_command(args):
         else:
             latitude, longitude = args.coords
             weather_data = api.get_weather_by_coords(latitude, longitude)
+        weather_data['description'] = get_weather_description(weather_data['weathercode'])
+    except Exception as e:
+        if fmt != 'text':
+            return write_single_record(args, None, e, fmt)
+        return f"Ошибка: {e}"
+
+    # Погода уже получена: ошибка записи в историю её не отменяет
+    save_history([(weather_data['city'], weather_data)])
+    if fmt != 'text':
+        return write_single_record(args, weather_data, None, fmt)
+    return format_weather_output(weather_data)
+
+
+def save_history(items) -> bool:
+    """Сохраняет результаты в историю; ошибку базы сообщает в stderr.
+
+    Returns:
+        bool: Удалось ли сохранить.
+    """
+    from weather.database import save_requests
+
+    try:
+        save_requests(items)
+    except Exception as e:
+        print(f"Ошибка сохранения в историю: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def forecast_command(args):
+    """Выводит суточную сводку почасового прогноза и оповещения о порогах."""
+    from weather.forecast import HOURLY_VARIABLES, parse_alert
+
+    try:
+        alerts = [parse_alert(spec) for spec in args.alert]
+    except ValueError as e:
+        return f"Ошибка: {e}"
+    variables = tuple(dict.fromkeys(HOURLY_VARIABLES + tuple(name for name, _, _ in alerts)))
+
+    api = create_api(args)
+    try:
+        if args.city or getattr(args, 'cities', None) or getattr(args, 'cities_file', None):
+            places = []
+            for city in [args.city] if args.city else load_cities(args):
+                coords = api.get_coordinates(city)
+                if not coords:
+                    raise Exception(f"Город '{city}' не найден")
+                places.append(((coords['latitude'], coords['longitude']),
+                               f"{coords['name']}, {coords['country']}"))
+        elif args.coords:
+            places = [(tuple(args.coords), f"{args.coords[0]}, {args.coords[1]}")]
+        else:
+            return "Для прогноза укажите --city, --coords, --cities или --cities-file."
+        series_list = api.get_forecast_many([coords for coords, _ in places], args.forecast,
+                                            variables, [name for _, name in places])
+    except Exception as e:
+        return f"Ошибка: {e}"
+
+    lines = []
+    for series in series_list:
+        lines += ["=" * 70, f"ПРОГНОЗ: {series.city}", "=" * 70]
+        rows = zip(series.daily_min_max('temperature_2m'),
+                   series.daily('precipitation', 'sum'),
+                   series.daily('windspeed_10m', 'max'))
+        for (day, low, high), (_, precipitation), (_, wind) in rows:
+            lines.append(f"{day}  |  {_format_value(low)}..{_format_value(high)}°C  |  "
+                         f"осадки {_format_value(precipitation)} мм  |  "
+                         f"ветер до {_format_value(wind)} км/ч")
+        for name, above, below in alerts:
+            for alert in series.threshold_alerts(name, above, below):
+                lines.append(f"ВНИМАНИЕ: {name} = {alert['peak']} "
+                             f"с {alert['start']} по {alert['end']}")
+        lines.append("=" * 70)
+    return "\n".join(lines)
+
+
+def _format_value(value: float | None) -> str:
+    """Округляет значение сводки прогноза для вывода."""
+    return "—" if value is None else f"{value:.1f}"
+
+
+def spatial_history_command(args):
+    """Ищет записи истории по координатам (--near, --bbox) или ближайшие места (--nearest)."""
+    from weather.database import get_history_in_box, get_history_near, get_nearest_locations
+
+    if args.nearest:
+        latitude, longitude = args.nearest
+        locations = get_nearest_locations(latitude, longitude, args.limit or 5)
+        if not locations:
+            return "В истории нет мест с координатами."
+        lines = ["", f"БЛИЖАЙШИЕ МЕСТА К {latitude}, {longitude}:", "=" * 60]
+        for row in locations:
+            lines.append(f"{row['distance_km']:>9.1f} км  |  {row['city']:<25}  |  "
+                         f"{row['latitude']:.4f}, {row['longitude']:.4f}")
+        lines.append("=" * 60)
+        return "\n".join(lines)
+
+    if args.radius <= 0:
+        return "Ошибка: радиус должен быть положительным."
+    since = args.since
+    if getattr(args, 'days', None):
+        since = (datetime.now() - timedelta(days=args.days)).isoformat(timespec='seconds')
+    filters = dict(since=since, until=args.until, limit=args.limit or 50)
+    if args.near:
+        latitude, longitude = args.near
+        rows = get_history_near(latitude, longitude, args.radius, **filters)
+        title = f"ИСТОРИЯ В РАДИУСЕ {args.radius:g} КМ ОТ {latitude}, {longitude}"
+    else:
+        min_lat, min_lon, max_lat, max_lon = args.bbox
+        if min_lat > max_lat:
+            return "Ошибка: южная граница области больше северной."
+        rows = get_history_in_box(min_lat, min_lon, max_lat, max_lon, **filters)
+        title = f"ИСТОРИЯ В ОБЛАСТИ {min_lat}..{max_lat}, {min_lon}..{max_lon}"
+    if not rows:
+        return "В истории нет записей в этой области."
+
+    lines = ["", f"{title}:", "=" * 80]
+    for row in rows:
+        day, _, clock = row['timestamp'].partition("T")
+        distance = f"  |  {row['distance_km']:>7.1f} км" if 'distance_km' in row else ""
+        lines.append(f"{day} {clock[:5]}  |  {row['city']:<15}  |  {row['temperature']:>5}°C  |  "
+                     f"{row['description'] or '—'}{distance}")
+    lines.append("=" * 80)
+    return "\n".join(lines)
+
+
+def get_stats_command(args):
+    """Выводит статистику погоды за периоды из дневных сводок истории."""
+    from weather.database import get_stats
+
+    since = None
+    if getattr(args, 'days', None):
+        since = (date.today() - timedelta(days=args.days - 1)).isoformat()
+    stats = get_stats(args.stats, city=args.city, since=since)
+    if not stats:
+        return "Нет данных для статистики."
+
+    titles = {'day': "ПО ДНЯМ", 'week': "ПО НЕДЕЛЯМ", 'month': "ПО МЕСЯЦАМ"}
+    lines = ["", f"СТАТИСТИКА ПОГОДЫ {titles[args.stats]}:", "=" * 90]
+    for row in stats:
+        wind = "—" if row['wind_mean'] is None else f"{row['wind_mean']:.1f} км/ч"
+        desc = "—" if row['weathercode'] is None else get_weather_description(row['weathercode'])
+        lines.append(
+            f"{row['period']:<10}  |  {row['city']:<15}  |  "
+            f"{row['temp_min']:>5}..{row['temp_max']:<5}°C (ср. {row['temp_mean']:.1f})  |  "
+            f"ветер {wind}  |  {desc}  |  n={row['samples']}"
+        )
+    lines.append("=" * 90)
+    return "\n".join(lines)
+
+
+def compact_history_command(args):
+    """Сжимает старую историю по политике хранения и освобождает место."""
+    from weather.database import compact_history
+
+    if args.keep_raw_days < 0 or args.keep_hourly_days < 0:
+        return "Ошибка: срок хранения не может быть отрицательным."
+    summary = compact_history(args.keep_raw_days, args.keep_hourly_days, vacuum=args.vacuum)
+    return (f"История сжата: {summary['compacted']} записей в почасовые сводки, "
+            f"удалено записей {summary['deleted']}, почасовых сводок {summary['hourly_deleted']}, "
+            f"освобождено страниц {summary['freed_pages']} (транзакций: {summary['batches']}).")
+
+
+def export_history_command(args):
+    """Выгружает историю в файл или стандартный вывод.
+
+    Итог (число записей и последний id для продолжения) пишется в stderr,
+    чтобы не смешиваться с выгружаемыми данными.
+    """
+    from weather.export import export_history
+
+    filters = dict(city=args.city, since=args.since, until=args.until, after_id=args.after_id)
+    try:
+        if args.output:
+            # При продолжении выгрузки файл дописывается без повторного заголовка
+            append = args.after_id > 0 and os.path.exists(args.output)
+            with open(args.output, 'a' if append else 'w', encoding='utf-8', newline='') as f:
+                count, last_id = export_history(f, args.export, header=not append, **filters)
+        else:
+            count, last_id = export_history(sys.stdout, args.export, **filters)
+    except OSError as e:
+        return f"Ошибка выгрузки: {e}"
+
+    print(f"Выгружено записей: {count}, последний id: {last_id if last_id is not None else '—'}",
+          file=sys.stderr)
+    return None
+
+
+def watch_command(args):
+    """Запускает планировщик, обновляющий погоду для набора мест до прерывания.
 
-        # Добавляем описание и сохраняем в БД
+    Каждое обновление сохраняется в историю и выводится одной строкой.
+    """
+    from weather.database import coords_label
+    from weather.scheduler import WatchScheduler, parse_watch_target
+
+    try:
+        if args.city:
+            queries = [args.city]
+        elif args.coords:
+            queries = [coords_label(*args.coords)]
+        else:
+            queries = load_cities(args)
+        targets = [parse_watch_target(query) for query in queries]
+    except (OSError, TypeError, ValueError) as e:
+        return f"Ошибка списка мест: {e}"
+    if not targets:
+        return "Список мест для наблюдения пуст."
+
+    def on_result(target, weather_data):
         weather_data['description'] = get_weather_description(weather_data['weathercode'])
-        save_request(weather_data['city'], weather_data)
+        # Места из координат называются так же, как в истории запросов --coords
+        city = weather_data['city'] or (coords_label(target['latitude'], target['longitude'])
+                                        if target['latitude'] is not None else target['query'])
+        save_history([(city, weather_data)])
+        print(f"{datetime.now():%H:%M:%S}  |  {city:<20}  |  "
+              f"{weather_data['temperature']:>5}°C  |  {weather_data['description']}", flush=True)
+
+    def on_error(target, error):
+        print(f"{datetime.now():%H:%M:%S}  |  Ошибка ({target['query']}): {error}",
+              file=sys.stderr, flush=True)
+
+    scheduler = WatchScheduler(create_api(args), targets, interval=args.interval,
+                               jitter=args.jitter, rate=args.rate, workers=args.workers,
+                               on_result=on_result, on_error=on_error)
+    print(f"Наблюдение за {len(targets)} местами, Ctrl+C — остановка.", flush=True)
+    scheduler.run()
+    return None
+
 
-        return format_weather_output(weather_data)
+def use_daemon(args) -> bool:
+    """Проверяет, можно ли передать запрос фоновому серверу.
+
+    Сервер работает со своими настройками кэша и справочника городов,
+    поэтому запросы с --grid-resolution, --grid-tolerance или --gazetteer
+    выполняются локально, чтобы эти параметры не терялись.
+    """
+    if getattr(args, 'no_daemon', False):
+        return False
+    return not (getattr(args, 'grid_resolution', None) or getattr(args, 'grid_tolerance', 0.0)
+                or getattr(args, 'gazetteer', None))
+
+
+def query_daemon(args):
+    """Запрашивает погоду у фонового сервера.
+
+    Returns:
+        dict | None: Ответ сервера или None, если сервер не запущен.
+    """
+    if args.city:
+        return request_daemon('/weather', {'city': args.city})
+    latitude, longitude = args.coords
+    return request_daemon('/weather', {'lat': latitude, 'lon': longitude})
+
+
+def backfill_command(args):
+    """Загружает архив погоды для мест из --city/--coords/--cities/--cities-file."""
+    from weather.backfill import backfill
+    from weather.database import coords_label
+
+    try:
+        start, end = (date.fromisoformat(value) for value in args.backfill)
+    except ValueError as e:
+        return f"Ошибка: неверная дата: {e}"
 
+    api = create_api(args)
+    try:
+        if args.coords:
+            latitude, longitude = args.coords
+            locations = [(coords_label(latitude, longitude), latitude, longitude)]
+        elif args.city or getattr(args, 'cities', None) or getattr(args, 'cities_file', None):
+            locations = []
+            for city in [args.city] if args.city else load_cities(args):
+                coords = api.get_coordinates(city)
+                if not coords:
+                    raise Exception(f"Город '{city}' не найден")
+                locations.append((f"{coords['name']}, {coords['country']}",
+                                  coords['latitude'], coords['longitude']))
+        else:
+            return "Для загрузки архива укажите --city, --coords, --cities или --cities-file."
     except Exception as e:
         return f"Ошибка: {e}"
 
+    def on_progress(summary):
+        print(f"Загружено кусков: {summary['done'] + summary['skipped']} из {summary['chunks']}, "
+              f"новых записей: {summary['inserted']}", file=sys.stderr, flush=True)
+
+    try:
+        summary = backfill(api, locations, start, end, args.chunk_days, args.workers,
+                           on_progress=on_progress)
+    except ValueError as e:
+        return f"Ошибка: {e}"
+    lines = [f"Архив загружен: кусков {summary['done']} (пропущено готовых: {summary['skipped']}, "
+             f"с ошибкой: {summary['failed']}), записей получено {summary['rows']}, "
+             f"добавлено {summary['inserted']}."]
+    lines += [f"Ошибка: {error}" for error in summary['errors']]
+    return "\n".join(lines)
+
+
+def prefetch_command(args):
+    """Прогревает кэш координат и погоды для самых частых городов из истории."""
+    from weather.prefetch import DEFAULT_DAYS, prefetch_popular
+
+    days = getattr(args, 'days', None) or DEFAULT_DAYS
+    result = prefetch_popular(create_api(args), args.prefetch, days, args.workers)
+    if not result['cities']:
+        return "В истории нет городов для прогрева."
+    lines = [f"Прогрет кэш: {result['warmed']} из {result['requested']} городов "
+             f"(за последние {days} дн.)."]
+    for city, error in result['errors'].items():
+        lines.append(f"Ошибка ({city}): {error}")
+    return "\n".join(lines)
+
+
+def serve_command(args):
+    """Запускает фоновый сервер с прогретыми кэшами и соединением с базой.
+
+    С --prefetch кэш для частых городов прогревается в фоне, пока
+    сервер уже принимает запросы.
+    """
+    from weather.database import init_db
+    from weather.server import serve
+
+    init_db()
+    api = create_api(args)
+    if getattr(args, 'prefetch', None):
+        from weather.prefetch import DEFAULT_DAYS, start_prefetch
+
+        def on_done(result):
+            print(f"Прогрев кэша: {result['warmed']} из {result['requested']} городов",
+                  flush=True)
+
+        start_prefetch(api, args.prefetch, getattr(args, 'days', None) or DEFAULT_DAYS,
+                       args.workers, on_done)
+    try:
+        serve(daemon_address(), api)
+    except OSError as e:
+        return f"Ошибка запуска сервера: {e}"
+    return None
+
+
+def create_api(args):
+    """Создаёт клиент API с учётом параметров командной строки."""
+    from weather.api import WeatherAPI
+
+    gazetteer = None
+    gazetteer_path = getattr(args, 'gazetteer', None) or os.environ.get('WEATHER_GAZETTEER')
+    if gazetteer_path and os.path.exists(gazetteer_path):
+        from weather.gazetteer import Gazetteer
+
+        gazetteer = Gazetteer(gazetteer_path)
+
+    options = {}
+    archive_url = getattr(args, 'archive_url', None) or os.environ.get('WEATHER_ARCHIVE_URL')
+    if archive_url:
+        options['archive_url'] = archive_url
+
+    return WeatherAPI(
+        grid_resolution=getattr(args, 'grid_resolution', None),
+        grid_tolerance_km=getattr(args, 'grid_tolerance', 0.0),
+        gazetteer=gazetteer,
+        **options
+    )
+
+
+def get_batch_weather_command(api, args):
+    """Получает погоду для нескольких городов параллельно.
+
+    Результаты выводятся в порядке ввода; ошибка по одному городу
+    попадает в вывод и не прерывает остальные.
+    """
+    from weather.batch import fetch_weather_batch
+
+    try:
+        cities = load_cities(args)
+    except OSError as e:
+        return f"Ошибка чтения списка городов: {e}"
+    if not cities:
+        return "Список городов пуст."
+
+    blocks = []
+    fetched = []
+    for city, weather_data, error in fetch_weather_batch(api, cities, args.workers):
+        if error is not None:
+            blocks.append(f"Ошибка ({city}): {error}")
+            continue
+        weather_data['description'] = get_weather_description(weather_data['weathercode'])
+        fetched.append((weather_data['city'], weather_data))
+        blocks.append(format_weather_output(weather_data))
+
+    # Вся пачка сохраняется в историю одной транзакцией
+    save_history(fetched)
+    return "\n".join(blocks)
+
+
+def stream_batch_weather_command(api, args, fmt: str):
+    """Получает погоду для нескольких городов и пишет записи в stdout по мере готовности.
+
+    Записи идут в порядке получения, а не ввода; номер места во входном
+    списке передаётся в поле index. Ошибки выводятся записями с ok=false.
+    """
+    from weather.batch import iter_weather_batch
+    from weather.output import make_record, write_records
+
+    try:
+        cities = load_cities(args)
+    except OSError as e:
+        write_records(sys.stdout, [make_record(0, args.cities_file, error=e)], fmt)
+        return None
+
+    fetched = []
+
+    def records():
+        for index, city, weather_data, error in iter_weather_batch(api, cities, args.workers):
+            if error is None:
+                weather_data['description'] = get_weather_description(weather_data['weathercode'])
+                fetched.append((weather_data['city'], weather_data))
+            yield make_record(index, city, weather_data, error)
+
+    try:
+        write_records(sys.stdout, records(), fmt)
+    finally:
+        # Всё, что успели получить, сохраняется в историю одной транзакцией
+        save_history(fetched)
+    return None
+
+
+def write_single_record(args, weather_data: dict | None, error, fmt: str):
+    """Пишет в stdout результат запроса по --city или --coords одной записью."""
+    from weather.output import make_record, write_records
+
+    query = args.city if args.city else f"{args.coords[0]},{args.coords[1]}"
+    write_records(sys.stdout, [make_record(0, query, weather_data, error)], fmt)
+    return None
+
+
+def load_cities(args) -> list[str]:
+    """Собирает список городов из --cities и --cities-file ("-" — stdin)."""
+    from weather.batch import read_cities
+
+    if getattr(args, 'cities', None):
+        return list(args.cities)
+    if args.cities_file == '-':
+        return read_cities(sys.stdin)
+    with open(args.cities_file, 'r', encoding='utf-8') as f:
+        return read_cities(f)
+
 
+@metrics.timed('format')
 def format_weather_output(weather_data: dict) -> str:
     """Форматирует данные о погоде в красивый вывод."""
     city = weather_data.get('city', 'Неизвестно')
@@ -1,59 +1,1033 @@
 # weather/database.py
+"""Модуль хранения истории запросов погоды в SQLite.
+
+Процесс держит одно соединение с базой (режим WAL, настроенные PRAGMA),
+записи вставляются пачками в одной транзакции, а схема обновляется
+через нумерованные миграции (номер версии хранится в PRAGMA user_version).
+Записи с координатами попадают в справочник мест с индексом R*Tree,
+по которому выполняется поиск истории в прямоугольнике, в радиусе
+и ближайших мест.
+"""
+
+import atexit
+import math
+import os
 import sqlite3
-from weather.api import get_weather_description  # ← ВОТ СЮДА!
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from weather import metrics
+from weather.codes import get_weather_description
+from weather.geo import EARTH_RADIUS_KM, bounding_box, haversine_km
+from datetime import datetime, timedelta
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent.parent / "weather_history.db"
+DB_PATH = Path(os.environ.get('WEATHER_HISTORY_DB', Path(__file__).parent.parent / "weather_history.db"))
+
+# Миграции схемы: элемент с индексом i переводит базу на версию i + 1.
+# Элемент — SQL-скрипт или функция, принимающая соединение.
+# Новые изменения схемы добавляются только в конец списка.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        city TEXT NOT NULL,
+        temperature REAL NOT NULL,
+        windspeed REAL,
+        winddirection INTEGER,
+        weathercode INTEGER,
+        description TEXT
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_history_city_timestamp ON history (city, timestamp)
+    """,
+    # Дневные сводки по городам: обновляются триггером при каждой вставке
+    """
+    CREATE TABLE IF NOT EXISTS history_daily (
+        city TEXT NOT NULL,
+        day TEXT NOT NULL,
+        samples INTEGER NOT NULL,
+        temp_min REAL,
+        temp_max REAL,
+        temp_sum REAL NOT NULL,
+        wind_min REAL,
+        wind_max REAL,
+        wind_sum REAL NOT NULL,
+        wind_samples INTEGER NOT NULL,
+        PRIMARY KEY (city, day)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_history_daily_day ON history_daily (day);
+    CREATE TABLE IF NOT EXISTS history_daily_codes (
+        city TEXT NOT NULL,
+        day TEXT NOT NULL,
+        weathercode INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        PRIMARY KEY (city, day, weathercode)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS trg_history_rollup AFTER INSERT ON history
+    BEGIN
+        INSERT INTO history_daily
+            (city, day, samples, temp_min, temp_max, temp_sum,
+             wind_min, wind_max, wind_sum, wind_samples)
+        VALUES
+            (NEW.city, substr(NEW.timestamp, 1, 10), 1, NEW.temperature, NEW.temperature,
+             NEW.temperature, NEW.windspeed, NEW.windspeed, coalesce(NEW.windspeed, 0),
+             NEW.windspeed IS NOT NULL)
+        ON CONFLICT (city, day) DO UPDATE SET
+            samples = samples + 1,
+            temp_min = min(temp_min, excluded.temp_min),
+            temp_max = max(temp_max, excluded.temp_max),
+            temp_sum = temp_sum + excluded.temp_sum,
+            wind_min = coalesce(min(wind_min, excluded.wind_min), wind_min, excluded.wind_min),
+            wind_max = coalesce(max(wind_max, excluded.wind_max), wind_max, excluded.wind_max),
+            wind_sum = wind_sum + excluded.wind_sum,
+            wind_samples = wind_samples + excluded.wind_samples;
+        INSERT INTO history_daily_codes (city, day, weathercode, samples)
+        SELECT NEW.city, substr(NEW.timestamp, 1, 10), NEW.weathercode, 1
+        WHERE NEW.weathercode IS NOT NULL
+        ON CONFLICT (city, day, weathercode) DO UPDATE SET samples = samples + 1;
+    END;
+    """,
+    # Перенос уже накопленной истории в сводки
+    lambda conn: rebuild_rollups(conn),
+    # Загрузка архива: источник записи, защита от повторов и контрольные точки
+    """
+    ALTER TABLE history ADD COLUMN source TEXT NOT NULL DEFAULT 'live';
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_history_archive
+        ON history (city, timestamp) WHERE source = 'archive';
+    CREATE TABLE IF NOT EXISTS backfill_progress (
+        city TEXT NOT NULL,
+        chunk_start TEXT NOT NULL,
+        chunk_end TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        rows INTEGER NOT NULL,
+        completed_at TEXT NOT NULL,
+        PRIMARY KEY (city, chunk_start, chunk_end)
+    ) WITHOUT ROWID;
+    """,
+    # Почасовые сводки для сжатых старых записей (hour — YYYY-MM-DDTHH)
+    """
+    CREATE TABLE IF NOT EXISTS history_hourly (
+        city TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        samples INTEGER NOT NULL,
+        temp_min REAL,
+        temp_max REAL,
+        temp_sum REAL NOT NULL,
+        wind_min REAL,
+        wind_max REAL,
+        wind_sum REAL NOT NULL,
+        wind_samples INTEGER NOT NULL,
+        weathercode INTEGER,
+        PRIMARY KEY (city, hour)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_history_hourly_hour ON history_hourly (hour);
+    """,
+    # Координаты записей и справочник мест с индексом R*Tree для поиска
+    # по области и радиусу; координаты архивных записей берутся из backfill_progress
+    """
+    ALTER TABLE history ADD COLUMN latitude REAL;
+    ALTER TABLE history ADD COLUMN longitude REAL;
+    CREATE INDEX IF NOT EXISTS idx_history_location
+        ON history (latitude, longitude, timestamp) WHERE latitude IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS history_locations (
+        id INTEGER PRIMARY KEY,
+        city TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        UNIQUE (city, latitude, longitude)
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS history_locations_rtree
+        USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+    CREATE TRIGGER IF NOT EXISTS trg_history_locations_rtree AFTER INSERT ON history_locations
+    BEGIN
+        INSERT INTO history_locations_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_history_location AFTER INSERT ON history
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT INTO history_locations (city, latitude, longitude)
+        VALUES (NEW.city, NEW.latitude, NEW.longitude)
+        ON CONFLICT (city, latitude, longitude) DO NOTHING;
+    END;
+    UPDATE history SET (latitude, longitude) = (
+        SELECT p.latitude, p.longitude FROM backfill_progress p WHERE p.city = history.city LIMIT 1
+    ) WHERE city IN (SELECT city FROM backfill_progress);
+    INSERT OR IGNORE INTO history_locations (city, latitude, longitude)
+    SELECT DISTINCT city, latitude, longitude FROM history WHERE latitude IS NOT NULL;
+    """,
+    # Число живых запросов в дневных сводках: архивные часы загрузки
+    # учитываются в samples, но не в частоте запросов. Для дней, сырые
+    # записи которых уже сжаты, архивными считаются дни загруженных интервалов
+    """
+    ALTER TABLE history_daily ADD COLUMN request_count INTEGER NOT NULL DEFAULT 0;
+    DROP TRIGGER IF EXISTS trg_history_rollup;
+    CREATE TRIGGER trg_history_rollup AFTER INSERT ON history
+    BEGIN
+        INSERT INTO history_daily
+            (city, day, samples, temp_min, temp_max, temp_sum,
+             wind_min, wind_max, wind_sum, wind_samples, request_count)
+        VALUES
+            (NEW.city, substr(NEW.timestamp, 1, 10), 1, NEW.temperature, NEW.temperature,
+             NEW.temperature, NEW.windspeed, NEW.windspeed, coalesce(NEW.windspeed, 0),
+             NEW.windspeed IS NOT NULL, NEW.source = 'live')
+        ON CONFLICT (city, day) DO UPDATE SET
+            samples = samples + 1,
+            temp_min = min(temp_min, excluded.temp_min),
+            temp_max = max(temp_max, excluded.temp_max),
+            temp_sum = temp_sum + excluded.temp_sum,
+            wind_min = coalesce(min(wind_min, excluded.wind_min), wind_min, excluded.wind_min),
+            wind_max = coalesce(max(wind_max, excluded.wind_max), wind_max, excluded.wind_max),
+            wind_sum = wind_sum + excluded.wind_sum,
+            wind_samples = wind_samples + excluded.wind_samples,
+            request_count = request_count + excluded.request_count;
+        INSERT INTO history_daily_codes (city, day, weathercode, samples)
+        SELECT NEW.city, substr(NEW.timestamp, 1, 10), NEW.weathercode, 1
+        WHERE NEW.weathercode IS NOT NULL
+        ON CONFLICT (city, day, weathercode) DO UPDATE SET samples = samples + 1;
+    END;
+    UPDATE history_daily SET request_count = CASE
+        WHEN EXISTS (SELECT 1 FROM history h
+                     WHERE h.city = history_daily.city AND h.timestamp >= history_daily.day
+                       AND h.timestamp < history_daily.day || 'U')
+        THEN (SELECT COUNT(*) FROM history h
+              WHERE h.city = history_daily.city AND h.timestamp >= history_daily.day
+                AND h.timestamp < history_daily.day || 'U' AND h.source = 'live')
+        WHEN EXISTS (SELECT 1 FROM backfill_progress p
+                     WHERE p.city = history_daily.city
+                       AND history_daily.day BETWEEN p.chunk_start AND p.chunk_end)
+        THEN 0
+        ELSE samples
+    END;
+    """,
+]
+
+# Сколько хранить данные при сжатии истории: сырые записи — raw_days дней,
+# затем почасовые сводки — до hourly_days дней; дневные сводки хранятся всегда
+HISTORY_RETENTION = {'raw_days': 30, 'hourly_days': 365}
+
+# Начальный радиус (км) расширяющегося поиска ближайших мест
+NEAREST_START_KM = 25.0
+
+# Выражения, переводящие день (YYYY-MM-DD) в начало периода статистики
+STATS_PERIODS = {
+    'day': "day",
+    'week': "date(day, 'weekday 0', '-6 days')",
+    'month': "substr(day, 1, 7)",
+}
+
+_connection = None
+_connection_path = None
+_lock = threading.RLock()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Возвращает общее для процесса соединение с базой истории.
+
+    При первом вызове (или после смены DB_PATH) открывает базу,
+    настраивает её и применяет недостающие миграции.
+    """
+    global _connection, _connection_path
+    with _lock:
+        if _connection is None or _connection_path != DB_PATH:
+            if _connection is not None:
+                _connection.close()
+            start = time.perf_counter()
+            conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            # Действует только для новой базы; существующую переводит compact_history(vacuum=True)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-8000")
+            _migrate(conn)
+            metrics.observe('db.connect', time.perf_counter() - start)
+            _connection, _connection_path = conn, DB_PATH
+        return _connection
+
+
+@contextmanager
+def transaction():
+    """Выполняет блок в одной транзакции с блокировкой на запись.
+
+    Yields:
+        sqlite3.Connection: Общее соединение с базой.
+    """
+    with _lock:
+        conn = get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Применяет миграции, номера которых больше текущей версии схемы."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Версию перечитываем под блокировкой: другой процесс мог уже обновить схему
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            if callable(migration):
+                migration(conn)
+            else:
+                for statement in _split_statements(migration):
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _split_statements(script: str):
+    """Разбивает SQL-скрипт на отдельные команды с учётом тел триггеров."""
+    statement = ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                yield statement
+            statement = ""
+
+
+def close_db():
+    """Закрывает общее соединение с базой, если оно открыто."""
+    global _connection, _connection_path
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection, _connection_path = None, None
+
+
+atexit.register(close_db)
+
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            city TEXT NOT NULL,
-            temperature REAL NOT NULL,
-            windspeed REAL,
-            winddirection INTEGER,
-            weathercode INTEGER,
-            description TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    get_connection()
+
 
 def save_request(city: str, data: dict):
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    desc = data.get('description', get_weather_description(data['weathercode']))
-    cursor.execute("""
-        INSERT INTO history 
-        (timestamp, city, temperature, windspeed, winddirection, weathercode, description)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
-        datetime.now().isoformat(),
-        city,
-        data['temperature'],
-        data.get('windspeed'),
-        data.get('winddirection'),
-        data['weathercode'],
-        desc
-    ))
-    conn.commit()
-    conn.close()
+    save_requests([(city, data)])
+
+
+def coords_label(latitude: float, longitude: float) -> str:
+    """Возвращает название места из координат ("55.75, 37.62").
+
+    Под этим названием в истории хранятся все места, заданные координатами:
+    запросы --coords, наблюдение и загрузка архива.
+    """
+    return f"{latitude}, {longitude}"
+
+
+def parse_coords_label(label: str) -> tuple[float, float] | None:
+    """Возвращает координаты из названия вида coords_label или None для названия города."""
+    latitude, separator, longitude = label.partition(', ')
+    if not separator:
+        return None
+    try:
+        return float(latitude), float(longitude)
+    except ValueError:
+        return None
+
+
+def _coords_label(data: dict) -> str | None:
+    """Возвращает название места из координат данных или None, если их нет."""
+    if data.get('latitude') is None or data.get('longitude') is None:
+        return None
+    return coords_label(data['latitude'], data['longitude'])
 
+
+@metrics.timed('db.write')
+def save_requests(items):
+    """Сохраняет несколько результатов одной пачкой в одной транзакции.
+
+    Координаты latitude и longitude из данных (если есть) сохраняются
+    вместе с записью, и место попадает в пространственный индекс.
+    Для запроса по координатам без названия города (city=None) записью
+    места становятся координаты — как у загрузки архива для --coords.
+
+    Args:
+        items (Iterable[tuple[str, dict]]): Пары (город, данные о погоде).
+    """
+    now = datetime.now().isoformat()
+    rows = [
+        (
+            now,
+            city or _coords_label(data),
+            data['temperature'],
+            data.get('windspeed'),
+            data.get('winddirection'),
+            data['weathercode'],
+            data.get('description', get_weather_description(data['weathercode'])),
+            data.get('latitude'),
+            data.get('longitude')
+        )
+        for city, data in items
+    ]
+    if not rows:
+        return
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO history
+            (timestamp, city, temperature, windspeed, winddirection, weathercode, description,
+             latitude, longitude)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    metrics.incr('db.rows_written', len(rows))
+
+
+@metrics.timed('db.write')
+def save_archive_rows(rows, chunks) -> int:
+    """Вставляет архивные записи и отмечает загруженные интервалы одной транзакцией.
+
+    Записи, уже имеющиеся в истории (тот же город и момент времени),
+    пропускаются. Так как записи и контрольные точки фиксируются вместе,
+    прерванная загрузка продолжается ровно с первого незаписанного интервала.
+
+    Args:
+        rows (Iterable[tuple]): Кортежи (timestamp, city, temperature, windspeed,
+                                winddirection, weathercode, description,
+                                latitude, longitude).
+        chunks (Iterable[tuple]): Кортежи (city, chunk_start, chunk_end,
+                                  latitude, longitude, rows) загруженных интервалов.
+
+    Returns:
+        int: Число действительно добавленных записей.
+    """
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        cursor = conn.executemany("""
+            INSERT OR IGNORE INTO history
+            (timestamp, city, temperature, windspeed, winddirection, weathercode, description,
+             latitude, longitude, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'archive')
+        """, rows)
+        inserted = max(cursor.rowcount, 0)
+        conn.executemany("""
+            INSERT OR REPLACE INTO backfill_progress
+            (city, chunk_start, chunk_end, latitude, longitude, rows, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(*chunk, now) for chunk in chunks])
+    metrics.incr('db.rows_written', inserted)
+    return inserted
+
+
+def get_backfill_done(city: str) -> set[tuple[str, str]]:
+    """Возвращает уже загруженные интервалы архива для города.
+
+    Returns:
+        set[tuple[str, str]]: Пары (chunk_start, chunk_end) в формате YYYY-MM-DD.
+    """
+    with _lock:
+        cursor = get_connection().execute(
+            "SELECT chunk_start, chunk_end FROM backfill_progress WHERE city = ?", (city,))
+        return set(cursor.fetchall())
+
+
+@metrics.timed('db.read')
 def get_history(limit: int = 10):
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT timestamp, city, temperature, description 
-        FROM history 
-        ORDER BY id DESC LIMIT ?
-    """, (limit,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
\ No newline at end of file
+    with _lock:
+        cursor = get_connection().execute("""
+            SELECT timestamp, city, temperature, description
+            FROM history
+            ORDER BY id DESC LIMIT ?
+        """, (limit,))
+        return cursor.fetchall()
+
+
+@metrics.timed('db.read')
+def get_top_cities(limit: int = 20, days: int | None = 30):
+    """Возвращает самые часто запрашиваемые города.
+
+    Частота считается по дневным сводкам, поэтому запрос не зависит
+    от числа сырых записей истории. Учитываются только живые запросы:
+    часы, загруженные из архива (--backfill), частоту не увеличивают.
+
+    Args:
+        limit (int): Сколько городов вернуть.
+        days (int | None): Учитывать только последние days дней
+                           (None — всю историю).
+
+    Returns:
+        list[tuple[str, int]]: Город и число запросов, от частых к редким;
+            при равной частоте выше город, запрошенный позже.
+    """
+    where, params = "", []
+    if days:
+        where = "WHERE day >= date('now', 'localtime', ?)"
+        params.append(f"-{days - 1} days")
+    with _lock:
+        cursor = get_connection().execute(f"""
+            SELECT city, SUM(request_count) AS requests
+            FROM history_daily {where}
+            GROUP BY city
+            HAVING requests > 0
+            ORDER BY requests DESC, MAX(day) DESC, city
+            LIMIT ?
+        """, (*params, limit))
+        return cursor.fetchall()
+
+
+def _city_condition(city: str) -> tuple[str, list]:
+    """Возвращает условие отбора записей города и его параметры.
+
+    Город совпадает точно или по части до запятой ("Омск" — "Омск, Россия").
+    Часть до запятой ищется диапазоном "Омск," <= city < "Омск-", а не LIKE:
+    сравнение учитывает регистр, не толкует % и _ в названии и использует
+    индексы, начинающиеся со столбца city.
+    """
+    return "(city = ? OR (city >= ? AND city < ?))", [city, f"{city},", f"{city}-"]
+
+
+HISTORY_COLUMNS = ('id', 'timestamp', 'city', 'temperature', 'windspeed',
+                   'winddirection', 'weathercode', 'description', 'latitude', 'longitude')
+
+
+def iter_history(city: str | None = None, since: str | None = None, until: str | None = None,
+                 after_id: int = 0, chunk_size: int = 1000):
+    """Последовательно выдаёт записи истории в порядке возрастания id.
+
+    Записи читаются порциями по chunk_size с продолжением от последнего
+    выданного id, поэтому память не зависит от размера таблицы, а между
+    порциями не удерживается открытая транзакция чтения.
+
+    Args:
+        city (str | None): Город (точное название или часть до запятой).
+        since (str | None): Начало интервала (ISO-дата или время), включительно.
+        until (str | None): Конец интервала (ISO-дата или время), не включительно.
+        after_id (int): Выдавать только записи с id больше заданного.
+        chunk_size (int): Размер порции чтения.
+
+    Yields:
+        dict: Запись с ключами из HISTORY_COLUMNS.
+    """
+    conditions, params = ["id > ?"], []
+    if city:
+        condition, city_params = _city_condition(city)
+        conditions.append(condition)
+        params += city_params
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    query = f"""
+        SELECT {', '.join(HISTORY_COLUMNS)}
+        FROM history
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id LIMIT ?
+    """
+
+    last_id = after_id
+    while True:
+        with _lock:
+            rows = get_connection().execute(query, [last_id, *params, chunk_size]).fetchall()
+        for row in rows:
+            yield dict(zip(HISTORY_COLUMNS, row))
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _locations_in_box(conn: sqlite3.Connection, min_lat: float, min_lon: float,
+                      max_lat: float, max_lon: float) -> list[tuple[str, float, float]]:
+    """Находит места справочника в прямоугольнике по индексу R*Tree.
+
+    Западная граница больше восточной означает прямоугольник через
+    меридиан 180°: он ищется двумя частями. Индекс хранит координаты
+    с округлением наружу, поэтому точная проверка выполняется по
+    значениям из history_locations.
+
+    Returns:
+        list[tuple[str, float, float]]: Название, широта и долгота мест.
+    """
+    spans = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    rows = []
+    for west, east in spans:
+        rows += conn.execute("""
+            SELECT l.city, l.latitude, l.longitude
+            FROM history_locations_rtree AS r
+            JOIN history_locations AS l ON l.id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+              AND l.latitude BETWEEN ? AND ? AND l.longitude BETWEEN ? AND ?
+        """, (min_lat, max_lat, west, east, min_lat, max_lat, west, east)).fetchall()
+    return rows
+
+
+def _history_at(conn: sqlite3.Connection, points, since: str | None, until: str | None,
+                limit: int | None) -> list[dict]:
+    """Читает записи истории в точках, новые первыми.
+
+    Для каждой точки выполняется поиск по индексу (latitude, longitude,
+    timestamp), так что время не зависит от числа записей в других местах.
+
+    Args:
+        points (Iterable[tuple[float, float]]): Различные пары (широта, долгота).
+    """
+    conditions, params = ["latitude = ?", "longitude = ?"], []
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    query = f"""
+        SELECT {', '.join(HISTORY_COLUMNS)}
+        FROM history
+        WHERE {' AND '.join(conditions)}
+        ORDER BY timestamp DESC
+    """
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    rows = []
+    for latitude, longitude in points:
+        rows += conn.execute(query, [latitude, longitude, *params]).fetchall()
+    rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+    return [dict(zip(HISTORY_COLUMNS, row)) for row in rows[:limit]]
+
+
+@metrics.timed('db.read')
+def get_history_in_box(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                       since: str | None = None, until: str | None = None,
+                       limit: int | None = None) -> list[dict]:
+    """Возвращает записи истории с координатами внутри прямоугольника.
+
+    Места ищутся по индексу R*Tree, записи мест — по индексу координат,
+    поэтому таблица history целиком не просматривается. Записи без
+    координат (сохранённые до их появления) не находятся.
+
+    Args:
+        min_lat (float): Южная граница.
+        min_lon (float): Западная граница (больше восточной — через меридиан 180°).
+        max_lat (float): Северная граница.
+        max_lon (float): Восточная граница.
+        since (str | None): Начало интервала (ISO-дата или время), включительно.
+        until (str | None): Конец интервала (ISO-дата или время), не включительно.
+        limit (int | None): Максимальное число записей (None — все).
+
+    Returns:
+        list[dict]: Записи с ключами из HISTORY_COLUMNS, новые первыми.
+    """
+    with _lock:
+        conn = get_connection()
+        locations = _locations_in_box(conn, min_lat, min_lon, max_lat, max_lon)
+        points = {(latitude, longitude) for _, latitude, longitude in locations}
+        return _history_at(conn, points, since, until, limit)
+
+
+@metrics.timed('db.read')
+def get_history_near(latitude: float, longitude: float, radius_km: float,
+                     since: str | None = None, until: str | None = None,
+                     limit: int | None = None) -> list[dict]:
+    """Возвращает записи истории не дальше radius_km от точки.
+
+    Кандидаты выбираются по индексу в описанном вокруг круга
+    прямоугольнике, затем отсеиваются по точному расстоянию.
+
+    Args:
+        latitude (float): Широта центра.
+        longitude (float): Долгота центра.
+        radius_km (float): Радиус поиска в километрах.
+        since, until, limit: Как в get_history_in_box.
+
+    Returns:
+        list[dict]: Записи с ключами из HISTORY_COLUMNS и distance_km, новые первыми.
+    """
+    distances = {}
+    with _lock:
+        conn = get_connection()
+        for _, point_lat, point_lon in _locations_in_box(conn, *bounding_box(latitude, longitude, radius_km)):
+            distance = haversine_km(latitude, longitude, point_lat, point_lon)
+            if distance <= radius_km:
+                distances[(point_lat, point_lon)] = distance
+        rows = _history_at(conn, distances, since, until, limit)
+    for row in rows:
+        row['distance_km'] = round(distances[(row['latitude'], row['longitude'])], 3)
+    return rows
+
+
+@metrics.timed('db.read')
+def get_nearest_locations(latitude: float, longitude: float, limit: int = 5,
+                          max_km: float | None = None) -> list[dict]:
+    """Возвращает ближайшие к точке места, для которых есть история.
+
+    Поиск идёт по индексу в расширяющемся круге: радиус удваивается,
+    пока в круге не наберётся limit мест или круг не покроет max_km
+    (или весь земной шар).
+
+    Args:
+        latitude (float): Широта точки.
+        longitude (float): Долгота точки.
+        limit (int): Сколько мест вернуть.
+        max_km (float | None): Не искать дальше этого расстояния.
+
+    Returns:
+        list[dict]: Места с ключами city, latitude, longitude и distance_km,
+            от ближних к дальним.
+    """
+    furthest = math.pi * EARTH_RADIUS_KM
+    max_km = furthest if max_km is None else min(max_km, furthest)
+    radius = min(NEAREST_START_KM, max_km)
+    with _lock:
+        conn = get_connection()
+        while True:
+            found = []
+            for city, point_lat, point_lon in _locations_in_box(conn, *bounding_box(latitude, longitude, radius)):
+                distance = haversine_km(latitude, longitude, point_lat, point_lon)
+                if distance <= radius:
+                    found.append((distance, city, point_lat, point_lon))
+            if len(found) >= limit or radius >= max_km:
+                break
+            radius = min(radius * 2, max_km)
+    found.sort()
+    return [{'city': city, 'latitude': point_lat, 'longitude': point_lon,
+             'distance_km': round(distance, 3)}
+            for distance, city, point_lat, point_lon in found[:limit]]
+
+
+def rebuild_rollups(conn: sqlite3.Connection | None = None):
+    """Пересчитывает дневные сводки по всей таблице history.
+
+    Обычно сводки поддерживаются триггером при вставке; полный пересчёт
+    нужен как догоняющая задача — при первой миграции или после
+    изменения history в обход триггеров. Пересчитываются только дни,
+    по которым в history есть записи: сводки дней, сырые записи которых
+    уже удалены compact_history, сохраняются.
+
+    Args:
+        conn (sqlite3.Connection | None): Соединение с уже открытой
+            транзакцией; если не задано, пересчёт идёт в своей транзакции.
+    """
+    if conn is None:
+        with transaction() as conn:
+            rebuild_rollups(conn)
+        return
+    for table in ('history_daily', 'history_daily_codes'):
+        conn.execute(f"""
+            DELETE FROM {table}
+            WHERE (city, day) IN (SELECT DISTINCT city, substr(timestamp, 1, 10) FROM history)
+        """)
+    # При миграции, создающей сводки, столбцов source и request_count ещё нет
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(history_daily)")}
+    requests = (", request_count", ", SUM(source = 'live')") if 'request_count' in columns else ("", "")
+    conn.execute(f"""
+        INSERT INTO history_daily
+            (city, day, samples, temp_min, temp_max, temp_sum,
+             wind_min, wind_max, wind_sum, wind_samples{requests[0]})
+        SELECT city, substr(timestamp, 1, 10), COUNT(*), MIN(temperature), MAX(temperature),
+               SUM(temperature), MIN(windspeed), MAX(windspeed), coalesce(SUM(windspeed), 0),
+               COUNT(windspeed){requests[1]}
+        FROM history
+        GROUP BY city, substr(timestamp, 1, 10)
+    """)
+    conn.execute("""
+        INSERT INTO history_daily_codes (city, day, weathercode, samples)
+        SELECT city, substr(timestamp, 1, 10), weathercode, COUNT(*)
+        FROM history
+        WHERE weathercode IS NOT NULL
+        GROUP BY city, substr(timestamp, 1, 10), weathercode
+    """)
+
+
+def _next_hour(hour: str) -> str:
+    """Возвращает час, следующий за hour (YYYY-MM-DDTHH)."""
+    return (datetime.strptime(hour, '%Y-%m-%dT%H') + timedelta(hours=1)).strftime('%Y-%m-%dT%H')
+
+
+def _compact_batch(conn: sqlite3.Connection, city: str, start: str, end: str, to_hourly: bool) -> int:
+    """Сжимает записи города за часы [start, end) и удаляет их из history.
+
+    Границы — строки YYYY-MM-DDTHH: при сравнении строк все записи часа
+    лежат между его началом и началом следующего часа.
+
+    Returns:
+        int: Число удалённых сырых записей.
+    """
+    if to_hourly:
+        conn.execute("""
+            WITH raw AS (
+                SELECT substr(timestamp, 1, 13) AS hour, temperature, windspeed, weathercode
+                FROM history
+                WHERE city = ? AND timestamp >= ? AND timestamp < ?
+            ),
+            hours AS (
+                SELECT hour, COUNT(*) AS samples, MIN(temperature) AS temp_min,
+                       MAX(temperature) AS temp_max, SUM(temperature) AS temp_sum,
+                       MIN(windspeed) AS wind_min, MAX(windspeed) AS wind_max,
+                       coalesce(SUM(windspeed), 0) AS wind_sum, COUNT(windspeed) AS wind_samples
+                FROM raw
+                GROUP BY hour
+            ),
+            codes AS (
+                SELECT hour, weathercode,
+                       ROW_NUMBER() OVER (PARTITION BY hour ORDER BY COUNT(*) DESC, weathercode) AS position
+                FROM raw
+                WHERE weathercode IS NOT NULL
+                GROUP BY hour, weathercode
+            )
+            INSERT INTO history_hourly
+                (city, hour, samples, temp_min, temp_max, temp_sum,
+                 wind_min, wind_max, wind_sum, wind_samples, weathercode)
+            SELECT ?, hours.hour, samples, temp_min, temp_max, temp_sum,
+                   wind_min, wind_max, wind_sum, wind_samples, codes.weathercode
+            FROM hours LEFT JOIN codes ON codes.hour = hours.hour AND codes.position = 1
+            WHERE true
+            ON CONFLICT (city, hour) DO UPDATE SET
+                samples = samples + excluded.samples,
+                temp_min = min(temp_min, excluded.temp_min),
+                temp_max = max(temp_max, excluded.temp_max),
+                temp_sum = temp_sum + excluded.temp_sum,
+                wind_min = coalesce(min(wind_min, excluded.wind_min), wind_min, excluded.wind_min),
+                wind_max = coalesce(max(wind_max, excluded.wind_max), wind_max, excluded.wind_max),
+                wind_sum = wind_sum + excluded.wind_sum,
+                wind_samples = wind_samples + excluded.wind_samples,
+                weathercode = coalesce(weathercode, excluded.weathercode)
+        """, (city, start, end, city))
+    cursor = conn.execute("DELETE FROM history WHERE city = ? AND timestamp >= ? AND timestamp < ?",
+                          (city, start, end))
+    return cursor.rowcount
+
+
+def compact_history(raw_days: int = HISTORY_RETENTION['raw_days'],
+                    hourly_days: int = HISTORY_RETENTION['hourly_days'],
+                    batch_rows: int = 5000, vacuum_pages: int = 256, pause: float = 0.0,
+                    vacuum: bool = False, now: datetime | None = None) -> dict:
+    """Сжимает старую историю по политике хранения.
+
+    Сырые записи старше raw_days дней переносятся в почасовые сводки
+    (history_hourly), а записи и почасовые сводки старше hourly_days дней
+    удаляются — по ним остаются дневные сводки, которые триггер уже
+    заполнил при вставке, так что статистика не меняется. Границы
+    выравниваются по началу суток.
+
+    Работа идёт короткими транзакциями по batch_rows записей, между
+    которыми база свободна для записи (например, save_request из других
+    процессов); освободившееся место возвращается файловой системе
+    порциями по vacuum_pages страниц через incremental_vacuum.
+
+    Args:
+        raw_days (int): Сколько дней хранить сырые записи.
+        hourly_days (int): Сколько дней хранить почасовые сводки
+                           (не больше raw_days — без почасовых сводок).
+        batch_rows (int): Примерный размер одной транзакции в записях.
+        vacuum_pages (int): Сколько страниц освобождать за один шаг.
+        pause (float): Пауза между транзакциями, сек.
+        vacuum (bool): Однократно выполнить полный VACUUM, чтобы включить
+                       incremental_vacuum в базе, созданной без него
+                       (блокирует базу на время выполнения).
+        now (datetime | None): Текущее время (для тестов).
+
+    Returns:
+        dict: Итог с ключами compacted (сжато в почасовые сводки), deleted
+              (удалено сырых записей всего), hourly_deleted, batches и
+              freed_pages.
+    """
+    now = now or datetime.now()
+    raw_cutoff = (now - timedelta(days=raw_days)).strftime('%Y-%m-%dT00')
+    hourly_cutoff = (now - timedelta(days=max(hourly_days, raw_days))).strftime('%Y-%m-%dT00')
+    summary = {'compacted': 0, 'deleted': 0, 'hourly_deleted': 0, 'batches': 0, 'freed_pages': 0}
+
+    with _lock:
+        cities = [row[0] for row in get_connection().execute(
+            "SELECT DISTINCT city FROM history WHERE timestamp < ?", (raw_cutoff,))]
+
+    for city in cities:
+        start = ''
+        while start < raw_cutoff:
+            with transaction() as conn:
+                row = conn.execute("""
+                    SELECT timestamp FROM history
+                    WHERE city = ? AND timestamp >= ? AND timestamp < ?
+                    ORDER BY timestamp LIMIT 1 OFFSET ?
+                """, (city, start, raw_cutoff, batch_rows)).fetchone()
+                end = raw_cutoff if row is None else row[0][:13]
+                if end <= start:
+                    # В одном часе больше batch_rows записей — берём час целиком
+                    end = _next_hour(start)
+                # Часы до hourly_cutoff сразу удаляются, остальные — в почасовые сводки
+                if start < hourly_cutoff:
+                    middle = min(end, hourly_cutoff)
+                    summary['deleted'] += _compact_batch(conn, city, start, middle, False)
+                    start = middle
+                if start < end:
+                    deleted = _compact_batch(conn, city, start, end, True)
+                    summary['compacted'] += deleted
+                    summary['deleted'] += deleted
+            summary['batches'] += 1
+            start = end
+            if pause:
+                time.sleep(pause)
+
+    while True:
+        with transaction() as conn:
+            cursor = conn.execute("""
+                DELETE FROM history_hourly WHERE (city, hour) IN (
+                    SELECT city, hour FROM history_hourly WHERE hour < ? LIMIT ?
+                )
+            """, (hourly_cutoff, batch_rows))
+        summary['hourly_deleted'] += cursor.rowcount
+        if cursor.rowcount < batch_rows:
+            break
+        summary['batches'] += 1
+
+    with _lock:
+        conn = get_connection()
+        if vacuum and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    # Место освобождается короткими шагами, между которыми база доступна для записи
+    while incremental:
+        with _lock:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            # Шаги incremental_vacuum выполняются при чтении результата
+            conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        summary['freed_pages'] += free - remaining
+    with _lock:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return summary
+
+
+@metrics.timed('db.read')
+def get_hourly(city: str, since: str | None = None, until: str | None = None) -> list[dict]:
+    """Возвращает почасовую погоду города из сырых записей и почасовых сводок.
+
+    Args:
+        city (str): Город (целиком или часть до запятой, как в get_stats).
+        since (str | None): Начало интервала (включительно), например 2025-01-01.
+        until (str | None): Конец интервала (не включительно).
+
+    Returns:
+        list[dict]: Строки с ключами city, hour, samples, temp_min, temp_max,
+            temp_mean, wind_mean по возрастанию часа.
+    """
+    # Границы интервала — в каждой ветке по своему столбцу, чтобы работали
+    # индексы (city, hour) и (city, timestamp)
+    city_condition, city_params = _city_condition(city)
+
+    def arm_conditions(column: str) -> tuple[str, list]:
+        conditions, params = [city_condition], list(city_params)
+        if since:
+            conditions.append(f"{column} >= ?")
+            params.append(since)
+        if until:
+            conditions.append(f"{column} < ?")
+            params.append(until)
+        return ' AND '.join(conditions), params
+
+    hourly_where, hourly_params = arm_conditions('hour')
+    raw_where, raw_params = arm_conditions('timestamp')
+    query = f"""
+        WITH combined AS (
+            SELECT city, hour, samples, temp_min, temp_max, temp_sum, wind_sum, wind_samples
+            FROM history_hourly
+            WHERE {hourly_where}
+            UNION ALL
+            SELECT city, substr(timestamp, 1, 13), 1, temperature, temperature, temperature,
+                   coalesce(windspeed, 0), windspeed IS NOT NULL
+            FROM history
+            WHERE {raw_where}
+        )
+        SELECT city, hour, SUM(samples), MIN(temp_min), MAX(temp_max),
+               SUM(temp_sum) / SUM(samples), SUM(wind_sum) / NULLIF(SUM(wind_samples), 0)
+        FROM combined
+        GROUP BY city, hour
+        ORDER BY hour, city
+    """
+    params = hourly_params + raw_params
+    columns = ('city', 'hour', 'samples', 'temp_min', 'temp_max', 'temp_mean', 'wind_mean')
+    with _lock:
+        rows = get_connection().execute(query, params).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+@metrics.timed('db.read')
+def get_stats(period: str = 'day', city: str | None = None,
+              since: str | None = None, until: str | None = None):
+    """Возвращает статистику погоды по городам за дни, недели или месяцы.
+
+    Данные берутся из дневных сводок, а не из полной таблицы history,
+    поэтому запрос не зависит от числа сырых записей.
+
+    Args:
+        period (str): Период группировки: 'day', 'week' или 'month'.
+        city (str | None): Город; совпадает с названием целиком
+                           или с его частью до запятой ("Москва").
+        since (str | None): Первый день (YYYY-MM-DD) включительно.
+        until (str | None): Последний день (YYYY-MM-DD) включительно.
+
+    Returns:
+        list[dict]: Строки с ключами city, period, samples, temp_min,
+            temp_max, temp_mean, wind_min, wind_max, wind_mean, weathercode
+            (самый частый код за период), от новых периодов к старым.
+
+    Raises:
+        ValueError: Если период неизвестен.
+    """
+    if period not in STATS_PERIODS:
+        raise ValueError(f"Неизвестный период '{period}': ожидается day, week или month")
+    period_expr = STATS_PERIODS[period]
+
+    conditions, params = [], []
+    if city:
+        condition, city_params = _city_condition(city)
+        conditions.append(condition)
+        params += city_params
+    if since:
+        conditions.append("day >= ?")
+        params.append(since)
+    if until:
+        conditions.append("day <= ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = f"""
+        WITH stats AS (
+            SELECT city, {period_expr} AS period, SUM(samples) AS samples,
+                   MIN(temp_min) AS temp_min, MAX(temp_max) AS temp_max,
+                   SUM(temp_sum) / SUM(samples) AS temp_mean,
+                   MIN(wind_min) AS wind_min, MAX(wind_max) AS wind_max,
+                   SUM(wind_sum) / NULLIF(SUM(wind_samples), 0) AS wind_mean
+            FROM history_daily {where}
+            GROUP BY city, period
+        ),
+        codes AS (
+            SELECT city, {period_expr} AS period, weathercode,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY city, {period_expr}
+                       ORDER BY SUM(samples) DESC, weathercode
+                   ) AS position
+            FROM history_daily_codes {where}
+            GROUP BY city, period, weathercode
+        )
+        SELECT s.city, s.period, s.samples, s.temp_min, s.temp_max, s.temp_mean,
+               s.wind_min, s.wind_max, s.wind_mean, c.weathercode
+        FROM stats s
+        LEFT JOIN codes c ON c.city = s.city AND c.period = s.period AND c.position = 1
+        ORDER BY s.period DESC, s.city
+    """
+    columns = ('city', 'period', 'samples', 'temp_min', 'temp_max', 'temp_mean',
+               'wind_min', 'wind_max', 'wind_mean', 'weathercode')
+    with _lock:
+        rows = get_connection().execute(query, params * 2).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
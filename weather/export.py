@@ -0,0 +1,57 @@
+"""Модуль потоковой выгрузки истории запросов в CSV или JSON Lines.
+
+Записи читаются из базы порциями и сразу пишутся в выходной поток,
+поэтому потребление памяти не зависит от размера таблицы history.
+Выгрузку можно продолжить с последнего выгруженного id.
+"""
+
+import csv
+import json
+
+from weather.database import HISTORY_COLUMNS, iter_history
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def export_history(stream, fmt: str = 'csv', header: bool = True, flush_every: int = 1000,
+                   **filters) -> tuple[int, int | None]:
+    """Выгружает историю в текстовый поток.
+
+    Args:
+        stream: Текстовый поток для записи (файл или sys.stdout).
+        fmt (str): Формат: 'csv' или 'jsonl'.
+        header (bool): Писать ли строку заголовка CSV.
+        flush_every (int): Через сколько записей сбрасывать буфер потока.
+        **filters: Параметры фильтрации для database.iter_history
+                   (city, since, until, after_id, chunk_size).
+
+    Returns:
+        tuple[int, int | None]: Число выгруженных записей и id последней
+                                из них (None, если записей не было).
+
+    Raises:
+        ValueError: Если формат неизвестен.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат '{fmt}': ожидается csv или jsonl")
+
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        if header:
+            writer.writerow(HISTORY_COLUMNS)
+
+        def write(row):
+            writer.writerow([row[column] for column in HISTORY_COLUMNS])
+    else:
+        def write(row):
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    count, last_id = 0, None
+    for row in iter_history(**filters):
+        write(row)
+        count += 1
+        last_id = row['id']
+        if count % flush_every == 0:
+            stream.flush()
+    stream.flush()
+    return count, last_id
@@ -0,0 +1,197 @@
+"""Модуль почасового прогноза погоды в компактном столбцовом виде.
+
+Ряд прогноза хранится не как список словарей, а как общая ось времени
+(array('q'), секунды Unix) и по одному типизированному массиву array('f')
+на каждую переменную. Агрегации (суточные минимумы/максимумы, суммы)
+и поиск превышений порогов работают по срезам этих массивов.
+"""
+
+import base64
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone, timedelta
+
+# Почасовые переменные Open-Meteo, запрашиваемые по умолчанию
+HOURLY_VARIABLES = ('temperature_2m', 'precipitation', 'windspeed_10m')
+
+SECONDS_PER_DAY = 86400
+
+_AGGREGATES = {
+    'min': min,
+    'max': max,
+    'sum': math.fsum,
+    'mean': lambda values: math.fsum(values) / len(values),
+}
+
+
+def parse_alert(spec: str) -> tuple[str, float | None, float | None]:
+    """Разбирает условие оповещения вида "temperature_2m>30" или "temperature_2m<-10".
+
+    Returns:
+        tuple[str, float | None, float | None]: Переменная, порог сверху и порог снизу.
+
+    Raises:
+        ValueError: Если условие записано неверно.
+    """
+    for operator in ('>', '<'):
+        name, sep, value = spec.partition(operator)
+        if sep and name.strip():
+            try:
+                threshold = float(value)
+            except ValueError:
+                break
+            if operator == '>':
+                return name.strip(), threshold, None
+            return name.strip(), None, threshold
+    raise ValueError(f"Неверное условие '{spec}': ожидается ПЕРЕМЕННАЯ>ЧИСЛО или ПЕРЕМЕННАЯ<ЧИСЛО")
+
+
+class ForecastSeries:
+    """Почасовой ряд прогноза для одной точки с общей осью времени."""
+
+    def __init__(self, times: array, columns: dict[str, array], utc_offset: int = 0,
+                 city: str | None = None):
+        """Инициализирует ряд.
+
+        Args:
+            times (array): Моменты времени (секунды Unix), array('q').
+            columns (dict[str, array]): Значения переменных, array('f')
+                                        той же длины; пропуски — NaN.
+            utc_offset (int): Смещение местного времени от UTC в секундах.
+            city (str | None): Название места для отображения.
+        """
+        self.times = times
+        self.columns = columns
+        self.utc_offset = utc_offset
+        self.city = city
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @classmethod
+    def from_response(cls, data: dict, variables=HOURLY_VARIABLES, city: str | None = None):
+        """Создаёт ряд из ответа Open-Meteo, запрошенного с timeformat=unixtime."""
+        hourly = data['hourly']
+        columns = {
+            name: array('f', (math.nan if value is None else value for value in hourly[name]))
+            for name in variables
+        }
+        return cls(array('q', hourly['time']), columns, data.get('utc_offset_seconds', 0), city)
+
+    def to_cache(self) -> dict:
+        """Упаковывает ряд в JSON-совместимый словарь (массивы — base64)."""
+        def pack(values: array) -> str:
+            return base64.b64encode(values.tobytes()).decode('ascii')
+
+        return {
+            'byteorder': sys.byteorder,
+            'utc_offset': self.utc_offset,
+            'times': pack(self.times),
+            'columns': {name: pack(values) for name, values in self.columns.items()},
+        }
+
+    @classmethod
+    def from_cache(cls, payload: dict, city: str | None = None):
+        """Восстанавливает ряд из словаря, созданного to_cache."""
+        def unpack(typecode: str, encoded: str) -> array:
+            values = array(typecode)
+            values.frombytes(base64.b64decode(encoded))
+            if payload['byteorder'] != sys.byteorder:
+                values.byteswap()
+            return values
+
+        columns = {name: unpack('f', encoded) for name, encoded in payload['columns'].items()}
+        return cls(unpack('q', payload['times']), columns, payload['utc_offset'], city)
+
+    def local_time(self, index: int) -> datetime:
+        """Возвращает местное время точки ряда с номером index."""
+        tz = timezone(timedelta(seconds=self.utc_offset))
+        return datetime.fromtimestamp(self.times[index], tz)
+
+    def _day_slices(self):
+        """Делит ось времени на местные сутки.
+
+        Yields:
+            tuple[str, int, int]: Дата (YYYY-MM-DD) и границы среза [start, end).
+        """
+        if not self.times:
+            return
+        first_day = (self.times[0] + self.utc_offset) // SECONDS_PER_DAY
+        last_day = (self.times[-1] + self.utc_offset) // SECONDS_PER_DAY
+        start = 0
+        for day in range(first_day, last_day + 1):
+            end = bisect_left(self.times, (day + 1) * SECONDS_PER_DAY - self.utc_offset, start)
+            if end > start:
+                yield self.local_time(start).date().isoformat(), start, end
+            start = end
+
+    def daily(self, name: str, how: str = 'mean') -> list[tuple[str, float | None]]:
+        """Агрегирует переменную по местным суткам.
+
+        Args:
+            name (str): Имя переменной, например 'temperature_2m'.
+            how (str): 'min', 'max', 'sum' или 'mean'.
+
+        Returns:
+            list[tuple[str, float | None]]: Дата и значение (None, если
+                                            за сутки нет данных).
+
+        Raises:
+            KeyError: Если переменной нет в ряду.
+            ValueError: Если способ агрегации неизвестен.
+        """
+        if how not in _AGGREGATES:
+            raise ValueError(f"Неизвестная агрегация '{how}': ожидается min, max, sum или mean")
+        aggregate = _AGGREGATES[how]
+        values = self.columns[name]
+        result = []
+        for day, start, end in self._day_slices():
+            # NaN != NaN: так отбрасываются пропуски
+            present = [value for value in values[start:end] if value == value]
+            result.append((day, aggregate(present) if present else None))
+        return result
+
+    def daily_min_max(self, name: str = 'temperature_2m') -> list[tuple[str, float | None, float | None]]:
+        """Возвращает суточные минимум и максимум переменной."""
+        minimums = self.daily(name, 'min')
+        maximums = self.daily(name, 'max')
+        return [(day, low, high) for (day, low), (_, high) in zip(minimums, maximums)]
+
+    def threshold_alerts(self, name: str, above: float | None = None,
+                         below: float | None = None) -> list[dict]:
+        """Находит интервалы, когда переменная выходит за порог.
+
+        Args:
+            name (str): Имя переменной.
+            above (float | None): Сигнализировать о значениях выше порога.
+            below (float | None): Сигнализировать о значениях ниже порога.
+
+        Returns:
+            list[dict]: Интервалы с ключами variable, start, end (местное время
+                        ISO) и peak — самое экстремальное значение интервала.
+        """
+        values = self.columns[name]
+        alerts = []
+        start = None
+        for index, value in enumerate(values):
+            hit = (above is not None and value > above) or (below is not None and value < below)
+            if hit and start is None:
+                start = index
+            elif not hit and start is not None:
+                alerts.append(self._alert(name, start, index, above is not None))
+                start = None
+        if start is not None:
+            alerts.append(self._alert(name, start, len(values), above is not None))
+        return alerts
+
+    def _alert(self, name: str, start: int, end: int, high: bool) -> dict:
+        """Формирует описание интервала превышения порога [start, end)."""
+        segment = self.columns[name][start:end]
+        return {
+            'variable': name,
+            'start': self.local_time(start).isoformat(timespec='minutes'),
+            'end': self.local_time(end - 1).isoformat(timespec='minutes'),
+            'peak': round(max(segment) if high else min(segment), 2),
+        }
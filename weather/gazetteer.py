@@ -0,0 +1,303 @@
+"""Модуль локального справочника населённых пунктов (газеттира).
+
+Позволяет определять координаты города без обращения к сети. Справочник
+строится из выгрузки GeoNames (формат cities*.txt / allCountries.txt)
+в компактный двоичный файл, который затем отображается в память (mmap):
+загрузка не зависит от размера файла, а поиск по отсортированным ключам
+выполняется двоичным поиском прямо в отображении.
+
+Поддерживаются точный поиск, поиск по префиксу и нечёткий поиск
+по нормализованному названию (регистр, диакритика, ё/е, дефисы).
+
+Города хранятся под русскими названиями, а страна выдаётся полным
+названием — так же, как отвечает сетевой геокодер с language=ru, поэтому
+название места в истории не зависит от того, откуда взяты координаты.
+"""
+
+import difflib
+import mmap
+import re
+import struct
+import unicodedata
+
+from . import metrics
+from .codes import get_country_name
+
+# Версия 2: города хранятся под русскими названиями
+MAGIC = b'WGZ2'
+# magic, число записей, число ключей, смещения секций записей, ключей и строк
+HEADER = struct.Struct('<4sIIQQQ')
+# широта, долгота, население, смещение и длина названия, код страны
+RECORD = struct.Struct('<ffIIH2s')
+# смещение и длина ключа, номер записи
+KEY = struct.Struct('<IHI')
+
+_SEPARATORS = re.compile(r"[\s\-‐–—'’`.,()]+")
+_RUSSIAN_NAME = re.compile(r"[А-Яа-яЁё][А-Яа-яЁё\s\-]*")
+
+
+def normalize_name(name: str) -> str:
+    """Приводит название города к виду для сравнения.
+
+    Убирает регистр и диакритику, заменяет дефисы и знаки препинания
+    пробелами и схлопывает повторяющиеся пробелы.
+
+    Args:
+        name (str): Название города.
+
+    Returns:
+        str: Нормализованное название, например "санкт петербург".
+    """
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _SEPARATORS.sub(' ', stripped).strip()
+
+
+def read_russian_names(path: str) -> dict[str, str]:
+    """Читает русские названия из файла альтернативных названий GeoNames.
+
+    Из alternateNamesV2.txt берутся названия с языком "ru"; предпочтительное
+    (isPreferredName) название важнее остальных, разговорные и исторические
+    пропускаются.
+
+    Returns:
+        dict[str, str]: geonameid -> русское название.
+    """
+    names, preferred = {}, set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 4 or fields[2] != 'ru' or '1' in fields[6:8]:
+                continue
+            geoname_id, is_preferred = fields[1], fields[4:5] == ['1']
+            if geoname_id not in names or (is_preferred and geoname_id not in preferred):
+                names[geoname_id] = fields[3]
+                if is_preferred:
+                    preferred.add(geoname_id)
+    return names
+
+
+def _russian_name(fields: list[str], russian_names: dict[str, str] | None) -> str:
+    """Выбирает русское название города из строки GeoNames.
+
+    Без файла альтернативных названий берётся первое альтернативное
+    название, записанное русскими буквами; если такого нет — основное.
+    """
+    if russian_names is not None and fields[0] in russian_names:
+        return russian_names[fields[0]]
+    for name in fields[3].split(','):
+        if _RUSSIAN_NAME.fullmatch(name):
+            return name
+    return fields[1]
+
+
+def build_gazetteer(source_path: str, target_path: str, min_population: int = 0,
+                    alternate_names_path: str | None = None) -> tuple[int, int]:
+    """Строит двоичный файл справочника из выгрузки GeoNames.
+
+    Учитываются только населённые пункты (feature class "P"). Ключами
+    служат основное, ASCII- и альтернативные названия; при совпадении
+    ключа у нескольких городов первым идёт самый крупный.
+
+    Args:
+        source_path (str): Путь к TSV-файлу GeoNames.
+        target_path (str): Путь к создаваемому файлу справочника.
+        min_population (int): Минимальное население для включения города.
+        alternate_names_path (str | None): Файл alternateNamesV2.txt для точных
+            русских названий; без него название выбирается среди альтернативных.
+
+    Returns:
+        tuple[int, int]: Число записей и число ключей в справочнике.
+    """
+    russian_names = read_russian_names(alternate_names_path) if alternate_names_path else None
+    strings = bytearray()
+    records = []
+    keys = []
+
+    def add_string(value: bytes) -> int:
+        offset = len(strings)
+        strings.extend(value)
+        return offset
+
+    with open(source_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 15 or fields[6] != 'P':
+                continue
+            population = int(fields[14] or 0)
+            if population < min_population:
+                continue
+
+            name = _russian_name(fields, russian_names).encode('utf-8')[:0xFFFF]
+            index = len(records)
+            records.append((float(fields[4]), float(fields[5]), min(population, 0xFFFFFFFF),
+                            add_string(name), len(name), fields[8].encode('ascii', 'replace')[:2]))
+
+            names = {fields[1], fields[2], *fields[3].split(','), name.decode('utf-8', 'ignore')}
+            for key in {normalize_name(n) for n in names if n}:
+                if key:
+                    keys.append((key.encode('utf-8')[:0xFFFF], population, index))
+
+    # Порядок байтов UTF-8 совпадает с порядком кодовых точек
+    keys.sort(key=lambda item: (item[0], -item[1]))
+    key_entries = [(add_string(key), len(key), index) for key, _, index in keys]
+
+    records_offset = HEADER.size
+    keys_offset = records_offset + RECORD.size * len(records)
+    strings_offset = keys_offset + KEY.size * len(key_entries)
+    with open(target_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), len(key_entries),
+                            records_offset, keys_offset, strings_offset))
+        for record in records:
+            f.write(RECORD.pack(*record))
+        for entry in key_entries:
+            f.write(KEY.pack(*entry))
+        f.write(strings)
+    return len(records), len(key_entries)
+
+
+class Gazetteer:
+    """Справочник городов, отображённый в память из двоичного файла."""
+
+    def __init__(self, path: str):
+        """Открывает файл справочника.
+
+        Args:
+            path (str): Путь к файлу, созданному build_gazetteer.
+
+        Raises:
+            ValueError: Если файл не является справочником текущей версии.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.record_count, self.key_count, self._records_offset, self._keys_offset, \
+            self._strings_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"Файл '{path}' не является справочником городов этой версии: "
+                             f"постройте его заново через --build-gazetteer")
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def _key_at(self, position: int) -> tuple[bytes, int]:
+        """Возвращает ключ и номер записи по позиции в отсортированном списке ключей."""
+        offset, length, index = KEY.unpack_from(self._mm, self._keys_offset + position * KEY.size)
+        start = self._strings_offset + offset
+        return self._mm[start:start + length], index
+
+    def _record(self, index: int) -> dict:
+        """Возвращает запись справочника в формате WeatherAPI.get_coordinates."""
+        latitude, longitude, _, name_offset, name_length, country = RECORD.unpack_from(
+            self._mm, self._records_offset + index * RECORD.size)
+        start = self._strings_offset + name_offset
+        country_code = country.decode('ascii').strip('\x00')
+        return {
+            'latitude': round(latitude, 5),
+            'longitude': round(longitude, 5),
+            'name': self._mm[start:start + name_length].decode('utf-8'),
+            'country': get_country_name(country_code),
+            'country_code': country_code
+        }
+
+    def _lower_bound(self, key: bytes) -> int:
+        """Находит первую позицию, ключ в которой не меньше заданного."""
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, name: str) -> dict | None:
+        """Ищет город по точному совпадению нормализованного названия.
+
+        Returns:
+            dict | None: Словарь с ключами latitude, longitude, name (русское
+                         название), country (название страны), country_code
+                         (код ISO) или None.
+        """
+        key = normalize_name(name).encode('utf-8')
+        if not key:
+            return None
+        position = self._lower_bound(key)
+        if position < self.key_count:
+            found, index = self._key_at(position)
+            if found == key:
+                return self._record(index)
+        return None
+
+    def prefix(self, name: str, limit: int = 10) -> list[dict]:
+        """Ищет города, названия которых начинаются с заданной строки.
+
+        Returns:
+            list[dict]: До limit записей без повторов.
+        """
+        key = normalize_name(name).encode('utf-8')
+        results, seen = [], set()
+        position = self._lower_bound(key)
+        while position < self.key_count and len(results) < limit:
+            found, index = self._key_at(position)
+            if not found.startswith(key):
+                break
+            if index not in seen:
+                seen.add(index)
+                results.append(self._record(index))
+            position += 1
+        return results
+
+    def fuzzy(self, name: str, limit: int = 5, cutoff: float = 0.8) -> list[dict]:
+        """Ищет города с похожими названиями (например, с опечаткой).
+
+        Кандидаты берутся среди ключей с той же первой буквой и близкой
+        длиной, затем сравниваются через difflib.
+
+        Returns:
+            list[dict]: До limit записей, от наиболее похожей к наименее.
+        """
+        query = normalize_name(name)
+        if not query:
+            return []
+        first = query[0].encode('utf-8')
+        max_delta = max(1, len(query) // 4)
+
+        scored = {}
+        matcher = difflib.SequenceMatcher(b=query)
+        position = self._lower_bound(first)
+        while position < self.key_count:
+            found, index = self._key_at(position)
+            position += 1
+            if not found.startswith(first):
+                break
+            candidate = found.decode('utf-8')
+            if abs(len(candidate) - len(query)) > max_delta:
+                continue
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= cutoff and ratio > scored.get(index, 0):
+                scored[index] = ratio
+
+        best = sorted(scored.items(), key=lambda item: -item[1])[:limit]
+        return [self._record(index) for index, _ in best]
+
+    @metrics.timed('gazetteer.find')
+    def find(self, name: str) -> dict | None:
+        """Определяет город: сначала точный поиск, затем нечёткий.
+
+        Returns:
+            dict | None: Найденная запись или None.
+        """
+        found = self.lookup(name)
+        if found is None:
+            candidates = self.fuzzy(name, limit=1)
+            found = candidates[0] if candidates else None
+        return found
+
+    def close(self):
+        """Закрывает отображение файла."""
+        self._mm.close()
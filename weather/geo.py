@@ -0,0 +1,112 @@
+"""Модуль геометрических вспомогательных функций.
+
+Содержит расчёт расстояния по поверхности Земли, описанный вокруг круга
+прямоугольник координат (для поиска по индексу R*Tree в истории) и привязку
+координат к регулярной сетке, которая используется для ключей кэша погоды.
+"""
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Вычисляет расстояние между двумя точками по формуле гаверсинусов.
+
+    Args:
+        lat1 (float): Широта первой точки.
+        lon1 (float): Долгота первой точки.
+        lat2 (float): Широта второй точки.
+        lon2 (float): Долгота второй точки.
+
+    Returns:
+        float: Расстояние в километрах.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, float, float]:
+    """Возвращает прямоугольник координат, содержащий круг радиуса radius_km.
+
+    Если круг пересекает меридиан 180°, западная граница больше восточной;
+    если круг захватывает полюс, прямоугольник охватывает все долготы.
+
+    Returns:
+        tuple[float, float, float, float]: min_lat, min_lon, max_lat, max_lon.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angle)
+    max_lat = latitude + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0
+
+    ratio = math.sin(angle) / math.cos(math.radians(latitude))
+    if angle >= math.pi / 2 or ratio >= 1:
+        return min_lat, -180.0, max_lat, 180.0
+    d_lon = math.degrees(math.asin(ratio))
+    min_lon, max_lon = longitude - d_lon, longitude + d_lon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def grid_cell(latitude: float, longitude: float, resolution: float) -> tuple[int, int]:
+    """Возвращает индексы ячейки сетки с шагом resolution градусов."""
+    return math.floor(latitude / resolution), math.floor(longitude / resolution)
+
+
+def cell_center(row: int, col: int, resolution: float) -> tuple[float, float]:
+    """Возвращает координаты центра ячейки сетки."""
+    return (row + 0.5) * resolution, (col + 0.5) * resolution
+
+
+def wrap_cell_col(col: int, resolution: float) -> int:
+    """Приводит индекс столбца к диапазону долгот -180..180."""
+    columns = round(360 / resolution)
+    first = math.floor(-180 / resolution)
+    return (col - first) % columns + first
+
+
+def cell_ranges(latitude: float, longitude: float, resolution: float,
+                radius_km: float) -> tuple[tuple[int, int], list[tuple[int, int]]]:
+    """Возвращает диапазоны индексов ячеек сетки, которые могут лежать в радиусе от точки.
+
+    Диапазоны предназначены для поиска заполненных ячеек по индексу
+    (строка, столбец): перебирать сами ячейки не нужно.
+
+    Args:
+        latitude (float): Широта точки.
+        longitude (float): Долгота точки.
+        resolution (float): Шаг сетки в градусах.
+        radius_km (float): Радиус поиска в километрах.
+
+    Returns:
+        tuple: Диапазон строк (min_row, max_row) и список диапазонов столбцов
+            (min_col, max_col); диапазон через меридиан 180° делится на два.
+    """
+    row, col = grid_cell(latitude, longitude, resolution)
+    col = wrap_cell_col(col, resolution)
+    cell_km = resolution * KM_PER_DEGREE
+    row_span = math.ceil(radius_km / cell_km) + 1
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    col_span = math.ceil(radius_km / (cell_km * cos_lat)) + 1
+
+    columns = round(360 / resolution)
+    first = math.floor(-180 / resolution)
+    last = first + columns - 1
+    rows = (row - row_span, row + row_span)
+    if 2 * col_span + 1 >= columns:
+        return rows, [(first, last)]
+    low, high = col - col_span, col + col_span
+    if low < first:
+        return rows, [(low + columns, last), (first, high)]
+    if high > last:
+        return rows, [(low, last), (first, high - columns)]
+    return rows, [(low, high)]
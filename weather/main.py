@@ -6,8 +6,10 @@
 Запуск: python -m weather --city Москва
 """
 
+import sys
+import time
+
 from .parser import create_parser
-from .commands import get_weather_command
 
 
 def main():
@@ -15,13 +17,36 @@ def main():
     parser = create_parser()
     args = parser.parse_args()
 
+    # Команды импортируются после разбора аргументов: --help их не загружает
+    from .commands import get_weather_command
+    from . import metrics
+
+    if args.profile:
+        metrics.enable()
+    start = time.perf_counter()
     try:
         result = get_weather_command(args)
-        print(result)
+        if result is not None:
+            print(result)
     except KeyboardInterrupt:
         print("\nПрограмма прервана пользователем.")
     except Exception as e:
         print(f"Непредвиденная ошибка: {e}")
+    finally:
+        if args.profile:
+            print_profile(args.profile, time.perf_counter() - start)
+
+
+def print_profile(fmt: str, total_seconds: float):
+    """Выводит собранные метрики в stderr."""
+    from . import metrics
+
+    if fmt == 'json':
+        print(metrics.to_json(), file=sys.stderr)
+    elif fmt == 'prometheus':
+        print(metrics.to_prometheus(), end='', file=sys.stderr)
+    else:
+        print(metrics.format_report(total_seconds), file=sys.stderr)
 
 
 if __name__ == "__main__":
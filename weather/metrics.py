@@ -0,0 +1,207 @@
+"""Модуль сбора метрик производительности.
+
+Собирает время выполнения этапов (запросы к API, чтение и запись кэша,
+работа с базой истории, форматирование) и счётчики (число и объём
+HTTP-запросов, попадания в кэш, записанные строки). По умолчанию сбор
+выключен: таймеры и счётчики сводятся к проверке одного флага, поэтому
+не влияют на скорость. Включается через enable() — флагом --profile
+или в фоновом сервере, который отдаёт метрики по /metrics.
+
+Метрики можно вывести таблицей (format_report), в JSON (to_json)
+или в текстовом формате Prometheus (to_prometheus).
+"""
+
+import functools
+import threading
+import time
+from contextlib import nullcontext
+
+_enabled = False
+_lock = threading.Lock()
+# этап -> [число вызовов, суммарное время, максимальное время] (секунды)
+_timers: dict[str, list] = {}
+_counters: dict[str, float] = {}
+
+_NULL_TIMER = nullcontext()
+
+
+def enable():
+    """Включает сбор метрик."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Выключает сбор метрик (накопленные значения сохраняются)."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """Сбрасывает накопленные метрики."""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def observe(stage: str, seconds: float):
+    """Учитывает одно выполнение этапа длительностью seconds."""
+    if not _enabled:
+        return
+    with _lock:
+        entry = _timers.get(stage)
+        if entry is None:
+            _timers[stage] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+def incr(name: str, value: float = 1):
+    """Увеличивает счётчик name на value."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Timer:
+    """Контекстный менеджер, замеряющий время этапа."""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timer(stage: str):
+    """Возвращает контекстный менеджер для замера этапа.
+
+    Пример:
+        with metrics.timer('format'):
+            text = format_weather_output(data)
+    """
+    return _Timer(stage) if _enabled else _NULL_TIMER
+
+
+def timed(stage: str):
+    """Декоратор, замеряющий время каждого вызова функции как этап stage."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def snapshot() -> dict:
+    """Возвращает копию накопленных метрик.
+
+    Returns:
+        dict: {'stages': {этап: {count, total_ms, mean_ms, max_ms}},
+               'counters': {имя: значение}, 'cache_hit_ratio': float | None}
+    """
+    with _lock:
+        timers = {stage: list(entry) for stage, entry in _timers.items()}
+        counters = dict(_counters)
+
+    stages = {
+        stage: {
+            'count': count,
+            'total_ms': round(total * 1000, 3),
+            'mean_ms': round(total / count * 1000, 3),
+            'max_ms': round(maximum * 1000, 3),
+        }
+        for stage, (count, total, maximum) in sorted(timers.items())
+    }
+    lookups = counters.get('cache.hits', 0) + counters.get('cache.misses', 0) \
+        + counters.get('cache.stale_hits', 0)
+    ratio = round(counters.get('cache.hits', 0) / lookups, 4) if lookups else None
+    return {'stages': stages, 'counters': dict(sorted(counters.items())), 'cache_hit_ratio': ratio}
+
+
+def to_json() -> str:
+    """Возвращает метрики в JSON."""
+    import json
+
+    return json.dumps(snapshot(), ensure_ascii=False, indent=2)
+
+
+def _metric_name(name: str) -> str:
+    return 'weather_' + name.replace('.', '_').replace('-', '_')
+
+
+def to_prometheus() -> str:
+    """Возвращает метрики в текстовом формате Prometheus."""
+    with _lock:
+        timers = {stage: list(entry) for stage, entry in _timers.items()}
+        counters = dict(_counters)
+
+    lines = [
+        "# HELP weather_stage_seconds Время выполнения этапов.",
+        "# TYPE weather_stage_seconds summary",
+    ]
+    for stage, (count, total, _) in sorted(timers.items()):
+        lines.append(f'weather_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'weather_stage_seconds_count{{stage="{stage}"}} {count}')
+    lines += [
+        "# HELP weather_stage_seconds_max Максимальное время выполнения этапа.",
+        "# TYPE weather_stage_seconds_max gauge",
+    ]
+    for stage, (_, _, maximum) in sorted(timers.items()):
+        lines.append(f'weather_stage_seconds_max{{stage="{stage}"}} {maximum:.6f}')
+    for name, value in sorted(counters.items()):
+        metric = _metric_name(name) + '_total'
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def format_report(total_seconds: float | None = None) -> str:
+    """Форматирует метрики таблицей для вывода после команды.
+
+    Args:
+        total_seconds (float | None): Общее время команды; если задано,
+                                      для этапов выводится их доля.
+                                      Этапы могут быть вложены (db.connect
+                                      внутри db.read), поэтому доли не
+                                      обязаны складываться в 100%.
+    """
+    data = snapshot()
+    lines = ["", "ПРОФИЛЬ ВЫПОЛНЕНИЯ:", "=" * 72,
+             f"{'Этап':<22}{'Вызовов':>9}{'Всего, мс':>12}{'Ср., мс':>10}{'Макс., мс':>11}{'Доля':>8}"]
+    for stage, item in data['stages'].items():
+        share = ""
+        if total_seconds:
+            share = f"{item['total_ms'] / (total_seconds * 1000):.0%}"
+        lines.append(f"{stage:<22}{item['count']:>9}{item['total_ms']:>12.1f}"
+                     f"{item['mean_ms']:>10.2f}{item['max_ms']:>11.2f}{share:>8}")
+    if total_seconds:
+        lines.append(f"{'всего':<22}{'':>9}{total_seconds * 1000:>12.1f}")
+    lines.append("-" * 72)
+    for name, value in data['counters'].items():
+        lines.append(f"{name:<30}{value:>12g}")
+    if data['cache_hit_ratio'] is not None:
+        lines.append(f"{'cache.hit_ratio':<30}{data['cache_hit_ratio']:>12.1%}")
+    lines.append("=" * 72)
+    return "\n".join(lines)
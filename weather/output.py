@@ -0,0 +1,85 @@
+"""Модуль машиночитаемого вывода результатов в JSON и NDJSON.
+
+Каждый результат (или ошибка) превращается в запись с постоянным
+набором полей и пишется в поток сразу, как только готов, — вызывающей
+программе не нужно ждать окончания пакета или разбирать текстовые
+таблицы. В формате ndjson каждая запись — отдельная строка JSON,
+в формате json записи образуют массив, который закрывается даже
+при прерывании.
+"""
+
+import json
+
+from weather.codes import get_weather_description
+
+OUTPUT_FORMATS = ('text', 'json', 'ndjson')
+
+# Поля записи в постоянном порядке; отсутствующие значения — null
+RECORD_FIELDS = ('index', 'query', 'ok', 'city', 'latitude', 'longitude', 'time',
+                 'temperature', 'windspeed', 'winddirection', 'weathercode',
+                 'description', 'error')
+
+
+def make_record(index: int, query: str, data: dict | None = None, error=None) -> dict:
+    """Создаёт запись результата для одного места.
+
+    Args:
+        index (int): Номер места во входном списке.
+        query (str): Запрос в том виде, в каком его задал пользователь.
+        data (dict | None): Данные о погоде (если получены).
+        error (Exception | str | None): Ошибка (если данные не получены).
+
+    Returns:
+        dict: Запись со всеми полями RECORD_FIELDS.
+    """
+    record = dict.fromkeys(RECORD_FIELDS)
+    record.update(index=index, query=query, ok=error is None)
+    if error is not None:
+        record['error'] = str(error)
+    elif data is not None:
+        for field in RECORD_FIELDS[3:-1]:
+            record[field] = data.get(field)
+        if record['description'] is None and record['weathercode'] is not None:
+            record['description'] = get_weather_description(record['weathercode'])
+    return record
+
+
+def write_records(stream, records, fmt: str = 'ndjson') -> tuple[int, int]:
+    """Пишет записи в поток по мере их поступления.
+
+    Поток сбрасывается после каждой записи, поэтому её можно читать,
+    не дожидаясь следующей.
+
+    Args:
+        stream: Текстовый поток (обычно sys.stdout).
+        records (Iterable[dict]): Записи, например из make_record.
+        fmt (str): 'json' (массив) или 'ndjson' (запись на строку).
+
+    Returns:
+        tuple[int, int]: Число записей и число записей с ошибкой.
+
+    Raises:
+        ValueError: Если формат неизвестен.
+    """
+    if fmt not in OUTPUT_FORMATS[1:]:
+        raise ValueError(f"Неизвестный формат '{fmt}': ожидается json или ndjson")
+
+    count = errors = 0
+    if fmt == 'json':
+        stream.write("[")
+    try:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False)
+            if fmt == 'json':
+                line = ("\n  " if count == 0 else ",\n  ") + line
+            else:
+                line += "\n"
+            stream.write(line)
+            stream.flush()
+            count += 1
+            errors += not record['ok']
+    finally:
+        if fmt == 'json':
+            stream.write("\n]\n" if count else "]\n")
+        stream.flush()
+    return count, errors
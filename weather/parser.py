@@ -2,13 +2,39 @@
 
 import argparse
 
+# Open-Meteo отдаёт прогноз не больше чем на 16 дней
+MAX_FORECAST_DAYS = 16
+
+
+def forecast_days(value: str) -> int:
+    """Проверяет число дней прогноза для --forecast (1–16)."""
+    try:
+        days = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается целое число дней, получено '{value}'")
+    if not 1 <= days <= MAX_FORECAST_DAYS:
+        raise argparse.ArgumentTypeError(f"число дней прогноза должно быть от 1 до {MAX_FORECAST_DAYS}")
+    return days
+
+
+def positive_float(value: str) -> float:
+    """Проверяет, что значение --interval или --rate — положительное число."""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается число, получено '{value}'")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"значение должно быть больше нуля, получено '{value}'")
+    return number
+
 
 def create_parser():
     """Создаёт и возвращает настроенный объект argparse.ArgumentParser.
 
     Returns:
-        argparse.ArgumentParser: Парсер с взаимоисключающими --city/--coords
-                                и дополнительным флагом --history.
+        argparse.ArgumentParser: Парсер с взаимоисключающими
+                                --city/--coords/--cities/--cities-file
+                                и дополнительными флагами --history, --workers.
     """
     parser = argparse.ArgumentParser(
         description='Получение текущей погоды через Open-Meteo API',
@@ -19,6 +45,26 @@ def create_parser():
   py -m weather -c "Санкт-Петербург"
   py -m weather --coords 55.7558 37.6173
   py -m weather --history          ← новая команда!
+  py -m weather --near 55.7558 37.6173 --radius 50 --days 1
+  py -m weather --bbox 55 36 57 39 --since 2025-01-01 --limit 20
+  py -m weather --nearest 55.7558 37.6173
+  py -m weather --forecast 5 --city Москва --alert "temperature_2m<-15"
+  py -m weather --stats week --city Москва --days 30
+  py -m weather --export csv -o history.csv --since 2025-01-01
+  py -m weather --compact-history --keep-raw-days 30 --keep-hourly-days 365
+  py -m weather --export jsonl -o history.jsonl --after-id 120000
+  py -m weather --city Москва --no-daemon --profile
+  py -m weather --serve &          ← дальше --city/--coords отвечает сервер
+  py -m weather --prefetch 50 --days 7
+  py -m weather --backfill 2020-01-01 2024-12-31 --cities-file cities.txt --workers 4
+  py -m weather --serve --prefetch &
+  py -m weather --watch --cities-file cities.txt --rate 5
+  py -m weather --cities Москва Казань "Нижний Новгород"
+  py -m weather --cities-file cities.txt --workers 16
+  py -m weather --cities-file cities.txt --format ndjson | jq .temperature
+  cat cities.txt | py -m weather --cities-file -
+  py -m weather --build-gazetteer cities15000.txt cities.idx --alternate-names alternateNamesV2.txt
+  py -m weather --gazetteer cities.idx --city "Нижний Новгород"
         '''
     )
 
@@ -36,6 +82,17 @@ def create_parser():
         metavar=('LAT', 'LON'),
         help='Широта и долгота (например: 55.7558 37.6173)'
     )
+    group.add_argument(
+        '--cities',
+        nargs='+',
+        metavar='CITY',
+        help='Несколько городов для пакетного запроса'
+    )
+    group.add_argument(
+        '--cities-file',
+        metavar='FILE',
+        help='Файл со списком городов (по одному на строку), "-" — стандартный ввод'
+    )
 
     # НОВАЯ КОМАНДА — ДОЛЖНА БЫТЬ ВНЕ ГРУППЫ!
     parser.add_argument(
@@ -43,5 +100,230 @@ def create_parser():
         action='store_true',
         help='Показать историю последних запросов погоды'
     )
+    parser.add_argument(
+        '--near',
+        nargs=2,
+        type=float,
+        metavar=('LAT', 'LON'),
+        help='Показать записи истории не дальше --radius км от точки'
+    )
+    parser.add_argument(
+        '--radius',
+        type=float,
+        default=50.0,
+        metavar='KM',
+        help='Радиус поиска для --near, км (по умолчанию 50)'
+    )
+    parser.add_argument(
+        '--bbox',
+        nargs=4,
+        type=float,
+        metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'),
+        help='Показать записи истории внутри прямоугольника координат'
+    )
+    parser.add_argument(
+        '--nearest',
+        nargs=2,
+        type=float,
+        metavar=('LAT', 'LON'),
+        help='Показать ближайшие к точке места, для которых есть история'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        metavar='N',
+        help='Сколько записей показать для --near/--bbox (по умолчанию 50) или мест для --nearest (5)'
+    )
+    parser.add_argument(
+        '--forecast',
+        nargs='?',
+        const=3,
+        type=forecast_days,
+        metavar='DAYS',
+        help='Почасовой прогноз на DAYS дней (1–16, по умолчанию 3) со сводкой по суткам'
+    )
+    parser.add_argument(
+        '--alert',
+        action='append',
+        default=[],
+        metavar='VAR>VALUE',
+        help='Оповещение о выходе за порог в прогнозе, например "windspeed_10m>40" (можно повторять)'
+    )
+    parser.add_argument(
+        '--stats',
+        choices=['day', 'week', 'month'],
+        help='Статистика погоды по дням, неделям или месяцам (с --city — по одному городу)'
+    )
+    parser.add_argument(
+        '--days',
+        type=int,
+        metavar='N',
+        help='Ограничить статистику, поиск --near/--bbox (или выбор городов для --prefetch) '
+             'последними N днями'
+    )
+    parser.add_argument(
+        '--export',
+        choices=['csv', 'jsonl'],
+        help='Выгрузить историю в CSV или JSON Lines (с --city — по одному городу)'
+    )
+    parser.add_argument(
+        '--compact-history',
+        action='store_true',
+        help='Сжать старую историю: старые записи — в почасовые сводки, ещё более старые — удалить '
+             '(дневная статистика сохраняется)'
+    )
+    parser.add_argument(
+        '--keep-raw-days',
+        type=int,
+        default=30,
+        metavar='N',
+        help='Сколько дней хранить сырые записи при --compact-history (по умолчанию 30)'
+    )
+    parser.add_argument(
+        '--keep-hourly-days',
+        type=int,
+        default=365,
+        metavar='N',
+        help='Сколько дней хранить почасовые сводки при --compact-history (по умолчанию 365)'
+    )
+    parser.add_argument(
+        '--vacuum',
+        action='store_true',
+        help='С --compact-history: однократно перестроить базу, чтобы место освобождалось без блокировок'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        metavar='FILE',
+        help='Файл для выгрузки (по умолчанию стандартный вывод)'
+    )
+    parser.add_argument(
+        '--since',
+        metavar='ISO',
+        help='Начало интервала выгрузки или поиска --near/--bbox, например 2025-01-01'
+    )
+    parser.add_argument(
+        '--until',
+        metavar='ISO',
+        help='Конец интервала выгрузки или поиска --near/--bbox (не включительно)'
+    )
+    parser.add_argument(
+        '--after-id',
+        type=int,
+        default=0,
+        metavar='ID',
+        help='Продолжить выгрузку после записи с этим id (файл дописывается)'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Запустить фоновый сервер погоды (адрес — $WEATHER_DAEMON, по умолчанию 127.0.0.1:8765)'
+    )
+    parser.add_argument(
+        '--backfill',
+        nargs=2,
+        metavar=('START', 'END'),
+        help='Загрузить в историю почасовой архив погоды за даты START..END (YYYY-MM-DD, включительно); '
+             'прерванная загрузка продолжается с места остановки'
+    )
+    parser.add_argument(
+        '--chunk-days',
+        type=int,
+        default=90,
+        metavar='N',
+        help='Длина куска архива в днях для --backfill (по умолчанию 90)'
+    )
+    parser.add_argument(
+        '--archive-url',
+        metavar='URL',
+        help='Адрес API архива (по умолчанию $WEATHER_ARCHIVE_URL или archive-api.open-meteo.com)'
+    )
+    parser.add_argument(
+        '--prefetch',
+        nargs='?',
+        const=20,
+        type=int,
+        metavar='N',
+        help='Прогреть кэш для N самых частых городов из истории (по умолчанию 20); '
+             'с --serve — в фоне при запуске сервера'
+    )
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help='Не обращаться к фоновому серверу, даже если он запущен '
+             '(с --grid-resolution, --grid-tolerance и --gazetteer сервер не используется)'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='table',
+        choices=['table', 'json', 'prometheus'],
+        help='Вывести в stderr время по этапам и счётчики (таблицей, в JSON или для Prometheus)'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Непрерывно обновлять погоду для --city/--coords/--cities/--cities-file'
+    )
+    parser.add_argument(
+        '--interval',
+        type=positive_float,
+        metavar='SEC',
+        help='Интервал обновления в режиме --watch (по умолчанию — чуть меньше TTL кэша); '
+             'для отдельного места: "Москва@600"'
+    )
+    parser.add_argument(
+        '--rate',
+        type=positive_float,
+        default=2.0,
+        help='Максимум запросов к API в секунду в режиме --watch (по умолчанию 2)'
+    )
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=30.0,
+        metavar='SEC',
+        help='Случайный разброс моментов обновления в режиме --watch (по умолчанию 30)'
+    )
+    parser.add_argument(
+        '--format',
+        choices=['text', 'json', 'ndjson'],
+        default='text',
+        help='Формат вывода погоды: текст, JSON-массив или NDJSON (запись на строку, по мере готовности)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Число параллельных запросов в пакетном режиме (по умолчанию 8)'
+    )
+    parser.add_argument(
+        '--grid-resolution',
+        type=float,
+        metavar='DEG',
+        help='Шаг сетки (в градусах) для ключей кэша погоды, например 0.05'
+    )
+    parser.add_argument(
+        '--grid-tolerance',
+        type=float,
+        default=0.0,
+        metavar='KM',
+        help='Радиус поиска ближайшей закэшированной ячейки сетки, км'
+    )
+    parser.add_argument(
+        '--gazetteer',
+        metavar='FILE',
+        help='Локальный справочник городов (по умолчанию $WEATHER_GAZETTEER)'
+    )
+    parser.add_argument(
+        '--build-gazetteer',
+        nargs=2,
+        metavar=('GEONAMES_TSV', 'FILE'),
+        help='Построить справочник городов (несжатый индекс для mmap) из выгрузки GeoNames'
+    )
+    parser.add_argument(
+        '--alternate-names',
+        metavar='FILE',
+        help='Файл alternateNamesV2.txt из GeoNames для точных русских названий в --build-gazetteer'
+    )
 
     return parser
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""Модуль прогрева кэша по истории запросов.
+
+Самые часто запрашиваемые города берутся из дневных сводок истории,
+после чего для них заранее заполняются кэш координат и кэш текущей
+погоды. Запросы выполняются пулом потоков ограниченного размера,
+погода запрашивается пачками, а уже свежие записи кэша не трогаются.
+Прогрев удобно запускать после развёртывания или очистки кэша.
+"""
+
+import threading
+
+from weather.batch import iter_weather_batch
+
+DEFAULT_LIMIT = 20
+DEFAULT_DAYS = 30
+DEFAULT_WORKERS = 4
+
+
+def prefetch_cities(api, cities: list[str], workers: int = DEFAULT_WORKERS) -> dict:
+    """Заполняет кэш координат и погоды для списка городов.
+
+    Названия из истории имеют вид "Москва, Россия"; геокодирование
+    выполняется по части до запятой — так же, как город обычно вводят
+    в командной строке, поэтому прогретый ключ кэша совпадает с ключом
+    будущего запроса. Места, записанные координатами ("55.75, 37.62"),
+    не геокодируются: погода для них запрашивается прямо по координатам.
+
+    Args:
+        api (WeatherAPI): Клиент API с прогреваемым кэшем.
+        cities (list[str]): Названия городов.
+        workers (int): Максимальное число одновременных запросов.
+
+    Returns:
+        dict: Итог с ключами requested, warmed, failed и errors
+              (город -> текст ошибки).
+    """
+    from weather.database import parse_coords_label
+
+    points, named = [], []
+    for index, city in enumerate(cities):
+        coords = parse_coords_label(city)
+        if coords:
+            points.append((index, coords))
+        else:
+            named.append(index)
+
+    queries = [cities[index].split(',')[0].strip() for index in named]
+    warmed = 0
+    errors = {}
+    for position, _, _, error in iter_weather_batch(api, queries, workers):
+        if error is None:
+            warmed += 1
+        else:
+            errors[cities[named[position]]] = str(error)
+
+    if points:
+        try:
+            api.get_weather_many([coords for _, coords in points])
+        except Exception as e:
+            for index, _ in points:
+                errors[cities[index]] = str(e)
+        else:
+            warmed += len(points)
+    return {'requested': len(cities), 'warmed': warmed, 'failed': len(errors), 'errors': errors}
+
+
+def prefetch_popular(api, limit: int = DEFAULT_LIMIT, days: int | None = DEFAULT_DAYS,
+                     workers: int = DEFAULT_WORKERS) -> dict:
+    """Прогревает кэш для limit самых частых городов за последние days дней.
+
+    Returns:
+        dict: Итог prefetch_cities и список городов (ключ cities).
+    """
+    from weather.database import get_top_cities
+
+    cities = [city for city, _ in get_top_cities(limit, days)]
+    return dict(prefetch_cities(api, cities, workers), cities=cities)
+
+
+def start_prefetch(api, limit: int = DEFAULT_LIMIT, days: int | None = DEFAULT_DAYS,
+                   workers: int = DEFAULT_WORKERS, on_done=None) -> threading.Thread:
+    """Запускает prefetch_popular в фоновом потоке.
+
+    Args:
+        on_done (Callable[[dict], None] | None): Вызывается с итогом прогрева.
+
+    Returns:
+        threading.Thread: Запущенный поток (daemon).
+    """
+    def run():
+        try:
+            result = prefetch_popular(api, limit, days, workers)
+        except Exception as e:
+            result = {'requested': 0, 'warmed': 0, 'failed': 0, 'errors': {}, 'error': str(e)}
+        if on_done is not None:
+            on_done(result)
+
+    thread = threading.Thread(target=run, name='weather-prefetch', daemon=True)
+    thread.start()
+    return thread
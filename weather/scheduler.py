@@ -0,0 +1,192 @@
+"""Модуль планировщика непрерывного обновления погоды (режим --watch).
+
+Один процесс следит за набором мест: каждое место обновляется незадолго
+до истечения TTL записи в кэше, моменты запросов разносятся случайным
+сдвигом, чтобы не создавать всплесков, а общая частота обращений
+к Open-Meteo ограничивается «ведром токенов».
+"""
+
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Пауза перед повторной попыткой после ошибки, секунды
+RETRY_DELAY = 60
+# Максимальная пауза цикла между проверками очереди, секунды
+POLL_INTERVAL = 1.0
+
+
+def parse_watch_target(value: str) -> dict:
+    """Разбирает описание места для наблюдения.
+
+    Форматы: "Москва", "55.75,37.62", а также с собственным интервалом
+    обновления в секундах через "@": "Москва@600", "55.75,37.62@300".
+
+    Returns:
+        dict: Ключи query, latitude, longitude (для координат) и interval.
+
+    Raises:
+        ValueError: Если интервал или координаты некорректны.
+    """
+    query, _, interval = value.partition('@')
+    query = query.strip()
+    target = {'query': query, 'latitude': None, 'longitude': None,
+              'interval': float(interval) if interval else None}
+    if target['interval'] is not None and target['interval'] <= 0:
+        raise ValueError(f"Интервал должен быть положительным: '{value}'")
+
+    parts = query.split(',')
+    if len(parts) == 2:
+        try:
+            target['latitude'], target['longitude'] = float(parts[0]), float(parts[1])
+        except ValueError:
+            pass
+    return target
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов по алгоритму «ведро токенов»."""
+
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic, sleep=time.sleep):
+        """Инициализирует ограничитель.
+
+        Args:
+            rate (float): Допустимое число запросов в секунду.
+            burst (int): Сколько запросов можно выполнить подряд без ожидания.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Ждёт, пока появится свободный токен, и забирает его."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            self._tokens -= 1
+        if wait > 0:
+            self._sleep(wait)
+
+
+class WatchScheduler:
+    """Планировщик, периодически обновляющий погоду для набора мест."""
+
+    def __init__(self, api, targets: list[dict], interval: float | None = None,
+                 lead: float = 60, jitter: float = 30, rate: float = 2.0, workers: int = 4,
+                 on_result=None, on_error=None, clock=time.monotonic, sleep=time.sleep):
+        """Инициализирует планировщик.
+
+        Args:
+            api (WeatherAPI): Клиент API.
+            targets (list[dict]): Места из parse_watch_target.
+            interval (float | None): Интервал обновления по умолчанию (сек);
+                                     None — TTL погоды в кэше минус lead.
+            lead (float): За сколько секунд до истечения TTL обновлять запись.
+            jitter (float): Максимальный случайный сдвиг момента обновления (сек).
+            rate (float): Максимум запросов к API в секунду.
+            workers (int): Число одновременно выполняемых запросов.
+            on_result (Callable[[dict, dict], None] | None): Вызывается с местом
+                                                             и данными о погоде.
+            on_error (Callable[[dict, Exception], None] | None): Вызывается при ошибке.
+        """
+        self.api = api
+        self.targets = targets
+        if interval:
+            self.default_interval = interval
+        else:
+            weather_ttl = api.cache.policy_for('weather_')['ttl'].total_seconds()
+            self.default_interval = max(weather_ttl - lead, 1.0)
+        self.jitter = jitter
+        self.workers = workers
+        self.on_result = on_result
+        self.on_error = on_error
+        self.limiter = RateLimiter(rate, clock=clock, sleep=sleep)
+        self._clock = clock
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        # Будит цикл, когда в очередь возвращается место
+        self._wakeup = threading.Condition(self._queue_lock)
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Просит цикл планировщика завершиться."""
+        self._stop.set()
+
+    def _period(self, target: dict) -> float:
+        """Возвращает интервал обновления места в секундах."""
+        return target['interval'] or self.default_interval
+
+    def _schedule(self, target: dict, delay: float):
+        """Ставит место в очередь с указанной задержкой и случайным сдвигом раньше срока."""
+        offset = random.uniform(0, min(self.jitter, delay / 2)) if self.jitter else 0.0
+        heapq.heappush(self._queue, (self._clock() + delay - offset, id(target), target))
+
+    def refresh(self, target: dict) -> dict:
+        """Запрашивает свежую погоду для места, минуя кэш.
+
+        Координаты города определяются один раз и запоминаются в месте.
+        """
+        if target['latitude'] is None:
+            coords = self.api.get_coordinates(target['query'])
+            if not coords:
+                raise Exception(f"Город '{target['query']}' не найден")
+            target['latitude'], target['longitude'] = coords['latitude'], coords['longitude']
+            target['name'] = f"{coords['name']}, {coords['country']}"
+        return self.api.get_weather(target['latitude'], target['longitude'],
+                                    target.get('name'), refresh=True)
+
+    def _run_one(self, target: dict):
+        """Обновляет одно место и планирует следующее обновление.
+
+        Следующее обновление планируется в любом случае: ошибка обработчика
+        on_result передаётся в on_error и не выводит место из наблюдения.
+        """
+        delay = self._period(target)
+        try:
+            weather_data = self.refresh(target)
+            if self.on_result:
+                try:
+                    self.on_result(target, weather_data)
+                except Exception as e:
+                    if self.on_error:
+                        self.on_error(target, e)
+        except Exception as e:
+            delay = min(self._period(target), RETRY_DELAY)
+            if self.on_error:
+                self.on_error(target, e)
+        finally:
+            with self._wakeup:
+                self._schedule(target, delay)
+                self._wakeup.notify()
+
+    def run(self, max_refreshes: int | None = None):
+        """Запускает цикл обновления до вызова stop() или max_refreshes обновлений.
+
+        Первые обновления равномерно распределяются по интервалу jitter.
+        """
+        for target in self.targets:
+            heapq.heappush(self._queue, (self._clock() + random.uniform(0, self.jitter),
+                                         id(target), target))
+        refreshes = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            while not self._stop.is_set():
+                if max_refreshes is not None and refreshes >= max_refreshes:
+                    break
+                with self._wakeup:
+                    due = self._queue[0][0] if self._queue else None
+                    if due is None or due > self._clock():
+                        wait = POLL_INTERVAL if due is None else due - self._clock()
+                        self._wakeup.wait(min(max(wait, 0.0), POLL_INTERVAL))
+                        continue
+                    _, _, target = heapq.heappop(self._queue)
+                self.limiter.acquire()
+                executor.submit(self._run_one, target)
+                refreshes += 1
@@ -0,0 +1,193 @@
+"""Модуль фонового сервера погоды.
+
+Сервер держит в памяти WeatherAPI с его кэшами и соединение с базой
+истории и отвечает на локальные HTTP-запросы, так что повторные вызовы
+CLI не тратят время на запуск и инициализацию. Одновременные одинаковые
+запросы объединяются в одно обращение к Open-Meteo.
+
+Протокол (ответы в JSON):
+    GET /weather?city=Москва
+    GET /weather?lat=55.75&lon=37.62
+    GET /history?limit=10
+    GET /history?lat=55.75&lon=37.62&radius=50&since=2025-01-01
+    GET /history?bbox=55,36,57,39&limit=100
+    GET /nearest?lat=55.75&lon=37.62&limit=5
+    GET /health
+    GET /metrics               (текст Prometheus; ?format=json — JSON)
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from weather import metrics
+from weather.api import WeatherAPI, get_weather_description
+from weather.client import DEFAULT_HOST, DEFAULT_PORT
+from weather.database import (get_history, get_history_in_box, get_history_near,
+                              get_nearest_locations, save_request)
+from weather.gazetteer import normalize_name
+from weather.singleflight import SingleFlight
+
+
+class WeatherServer(ThreadingHTTPServer):
+    """HTTP-сервер, разделяющий между запросами один клиент API."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT),
+                 api: WeatherAPI | None = None):
+        """Инициализирует сервер.
+
+        Args:
+            address (tuple[str, int]): Адрес для прослушивания.
+            api (WeatherAPI | None): Клиент API; по умолчанию создаётся новый.
+        """
+        super().__init__(address, WeatherRequestHandler)
+        self.api = api or WeatherAPI()
+        self.flights = SingleFlight()
+
+    @metrics.timed('server.weather')
+    def fetch_weather(self, params: dict) -> dict:
+        """Получает погоду по городу или координатам и сохраняет её в историю.
+
+        Одновременные запросы одного и того же места выполняются один раз.
+
+        Raises:
+            ValueError: Если параметры запроса некорректны.
+            Exception: При ошибках API.
+        """
+        if 'city' in params:
+            city = params['city']
+            key = ('city', normalize_name(city))
+            weather_data = self.flights.do(key, self._fetch_and_save, self.api.get_weather_by_city, city)
+        elif 'lat' in params and 'lon' in params:
+            latitude, longitude = float(params['lat']), float(params['lon'])
+            key = ('coords', latitude, longitude)
+            weather_data = self.flights.do(key, self._fetch_and_save, self.api.get_weather_by_coords,
+                                           latitude, longitude)
+        else:
+            raise ValueError("Нужен параметр city или пара lat и lon")
+        return dict(weather_data)
+
+    @staticmethod
+    def _fetch_and_save(fetch, *args) -> dict:
+        """Получает погоду, добавляет описание и сохраняет запрос в историю.
+
+        Ошибка записи в историю (например, занятая база) сообщается в stderr
+        и не мешает отдать полученную погоду всем ожидающим её запросам.
+        """
+        weather_data = fetch(*args)
+        weather_data['description'] = get_weather_description(weather_data['weathercode'])
+        try:
+            save_request(weather_data['city'], weather_data)
+        except Exception as e:
+            print(f"Ошибка сохранения в историю: {e}", file=sys.stderr)
+        return weather_data
+
+
+def find_history(params: dict) -> list[dict]:
+    """Ищет записи истории по координатам для запроса /history.
+
+    Параметры: lat, lon и radius (км, по умолчанию 50) — поиск в радиусе;
+    bbox=min_lat,min_lon,max_lat,max_lon — в прямоугольнике; а также
+    since, until и limit (по умолчанию 50).
+
+    Raises:
+        ValueError: Если параметры некорректны.
+    """
+    filters = dict(since=params.get('since'), until=params.get('until'),
+                   limit=int(params.get('limit', 50)))
+    if 'bbox' in params:
+        bounds = [float(value) for value in params['bbox'].split(',')]
+        if len(bounds) != 4:
+            raise ValueError("bbox: нужны четыре числа min_lat,min_lon,max_lat,max_lon")
+        return get_history_in_box(*bounds, **filters)
+    if 'lon' not in params:
+        raise ValueError("Нужна пара lat и lon")
+    return get_history_near(float(params['lat']), float(params['lon']),
+                            float(params.get('radius', 50)), **filters)
+
+
+class WeatherRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов фонового сервера."""
+
+    server: WeatherServer
+
+    def do_GET(self):
+        """Разбирает запрос и отвечает JSON-объектом {"ok": ..., ...}."""
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/weather':
+                self._send(200, {'ok': True, 'data': self.server.fetch_weather(params)})
+            elif url.path == '/history':
+                if 'lat' in params or 'bbox' in params:
+                    self._send(200, {'ok': True, 'data': find_history(params)})
+                else:
+                    rows = get_history(int(params.get('limit', 10)))
+                    self._send(200, {'ok': True, 'data': [list(row) for row in rows]})
+            elif url.path == '/nearest':
+                if 'lat' not in params or 'lon' not in params:
+                    raise ValueError("Нужна пара lat и lon")
+                locations = get_nearest_locations(float(params['lat']), float(params['lon']),
+                                                  int(params.get('limit', 5)))
+                self._send(200, {'ok': True, 'data': locations})
+            elif url.path == '/health':
+                self._send(200, {'ok': True, 'in_flight': self.server.flights.in_flight()})
+            elif url.path == '/metrics':
+                if params.get('format') == 'json':
+                    self._send(200, {'ok': True, 'data': metrics.snapshot()})
+                else:
+                    self._send_text(200, metrics.to_prometheus())
+            else:
+                self._send(404, {'ok': False, 'error': f"Неизвестный путь {url.path}"})
+        except ValueError as e:
+            self._send(400, {'ok': False, 'error': str(e)})
+        except Exception as e:
+            self._send(502, {'ok': False, 'error': str(e)})
+
+    def _send(self, status: int, payload: dict):
+        """Отправляет JSON-ответ."""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str):
+        """Отправляет ответ в текстовом формате Prometheus."""
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Отключает построчный журнал запросов в stderr."""
+
+
+def serve(address: tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT), api: WeatherAPI | None = None):
+    """Запускает сервер и обслуживает запросы до прерывания.
+
+    Сервер работает долго, поэтому сбор метрик в нём включён всегда.
+    """
+    metrics.enable()
+    with WeatherServer(address, api) as server:
+        print(f"Сервер погоды слушает http://{address[0]}:{server.server_address[1]}")
+        server.serve_forever()
+
+
+def start_in_background(address: tuple[str, int] = (DEFAULT_HOST, 0),
+                        api: WeatherAPI | None = None) -> WeatherServer:
+    """Запускает сервер в фоновом потоке (для тестов и встраивания).
+
+    Returns:
+        WeatherServer: Запущенный сервер; остановка — server.shutdown().
+    """
+    server = WeatherServer(address, api)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
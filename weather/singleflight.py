@@ -0,0 +1,67 @@
+"""Модуль объединения одновременных одинаковых запросов (single-flight).
+
+Если несколько потоков одновременно запрашивают данные по одному ключу,
+вычисление выполняет только первый из них, а остальные ждут и получают
+тот же результат или ту же ошибку.
+"""
+
+import threading
+
+
+class _Call:
+    """Состояние выполняющегося вызова."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Группа вызовов, в которой одновременные вызовы с одним ключом объединяются."""
+
+    def __init__(self):
+        """Инициализирует пустую группу вызовов."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Выполняет fn(*args, **kwargs) или присоединяется к уже идущему вызову.
+
+        Args:
+            key (Hashable): Ключ, по которому объединяются вызовы.
+            fn (Callable): Функция для вычисления результата.
+
+        Returns:
+            Any: Результат fn — общий для всех объединённых вызовов.
+
+        Raises:
+            Exception: Ошибка, возникшая при вычислении.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        """Возвращает число выполняющихся в данный момент вызовов."""
+        with self._lock:
+            return len(self._calls)